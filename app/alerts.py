@@ -0,0 +1,567 @@
+"""
+Server-side alert rules, evaluated on every ingest path as batches reach
+ingest.cache_latest: POST /readings and the batch/binary endpoints, the line
+protocol, the simulator and the MQTT worker.
+
+Rules are a JSON list in ALERT_RULES_FILE. Without a file, the defaults are
+the CO2 levels the dashboard shows. Rule types:
+
+    {"id": "co2-high", "field": "co2", "op": ">", "value": 1000, "severity": "warning"}
+    {"id": "co2-rising", "type": "rate", "field": "co2", "op": ">", "value": 200, "minutes": 5}
+    {"id": "too-warm", "type": "sustained", "field": "temp", "op": ">", "value": 26, "minutes": 15,
+     "sensors": ["SENSOR_001", "SENSOR_002"]}
+
+- threshold (the default type): the reading is above / below value.
+- rate: the change since the sensor's previous reading, scaled to `minutes`
+  (default 1), is above / below value.
+- sustained: every reading for the last `minutes` has been above / below
+  value.
+
+`sensors` limits a rule to those sensors. `severity` is info, warning
+(default) or critical.
+
+Evaluation is vectorized per batch, not per reading. Sensors get a row in
+arrays indexed [sensor, rule]: whether the alert is active and, for
+sustained rules, when the condition started to hold. Each sensor also keeps
+its last timestamp and values for rate rules. A batch is grouped by sensor,
+and each rule is one comparison over the whole batch. Readings older than a
+sensor's last one are not evaluated.
+
+A rule fires when it triggers for a sensor whose alert was inactive. It
+resolves when the sensor's newest reading in a batch no longer triggers it.
+Transitions are written to the ALERTS_ACTIVE_KEY hash (GET /alerts),
+published on ALERTS_CHANNEL and logged, in the same pipeline as the rest of
+cache_latest.
+
+Rule changes need no restart. The file's mtime is checked at most every
+ALERT_RULES_CHECK_SECONDS. Rules that keep their id and definition keep
+their state, and alerts of removed or changed rules are resolved. A file
+that does not parse is logged and the previous rules stay.
+
+After a restart, restore() rebuilds the active alerts from the hash, so
+they resolve like any other. Entries of rules that were removed or changed
+meanwhile are resolved right away. A restored rate alert resolves with the
+sensor's first reading, which has no predecessor to compute a rate from.
+
+State lives in each process. Rate and sustained rules, and resolutions, are
+only exact when each sensor's readings reach one process. That holds for one
+API replica, the simulator and a single MQTT worker. With more, route each
+sensor to one process (e.g. by sensor id at the load balancer).
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import orjson
+
+from . import metrics
+from .downsample import EPOCH, FIELD_NAMES, ONE_MICROSECOND
+
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "1") == "1"
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", "")
+RULES_CHECK_SECONDS = float(os.getenv("ALERT_RULES_CHECK_SECONDS", 5))
+
+# Hash of the alerts currently firing, "{rule}:{sensor_id}" -> event JSON
+ALERTS_ACTIVE_KEY = "alerts:active"
+# Every transition is published here as a JSON array of events
+ALERTS_CHANNEL = "sensor:alerts"
+
+FIELDS = ("co2_ppm", "temperature", "humidity")
+RULE_TYPES = ("threshold", "rate", "sustained")
+OPERATORS = (">", "<")
+SEVERITIES = ("info", "warning", "critical")
+
+# The levels the dashboard has always highlighted
+DEFAULT_RULES = [
+    {"id": "co2-high", "field": "co2", "op": ">", "value": 1000, "severity": "warning"},
+    {"id": "co2-critical", "field": "co2", "op": ">", "value": 2000, "severity": "critical"},
+]
+
+# last_timestamps of a sensor without readings, and "condition not holding" in `since`
+NONE = np.iinfo(np.int64).min
+MIN_SENSORS = 1024
+MICROS_PER_MINUTE = 60_000_000
+
+logger = logging.getLogger("app.alerts")
+
+
+def parse_rule(spec: dict) -> dict:
+    '''Validate one rule definition; returns it normalized (field as a column name, all keys present)'''
+    if not isinstance(spec, dict):
+        raise ValueError(f"Rule must be an object, got {spec!r}")
+    rule_id = spec.get("id")
+    if not isinstance(rule_id, str) or not rule_id:
+        raise ValueError(f"Rule without an id: {spec!r}")
+    unknown = set(spec) - {"id", "type", "field", "op", "value", "minutes", "severity", "sensors"}
+    if unknown:
+        raise ValueError(f"Rule {rule_id!r}: unknown keys {sorted(unknown)}")
+
+    rule_type = spec.get("type", "threshold")
+    if rule_type not in RULE_TYPES:
+        raise ValueError(f"Rule {rule_id!r}: type must be one of {RULE_TYPES}")
+    if spec.get("field") not in FIELD_NAMES:
+        raise ValueError(f"Rule {rule_id!r}: field must be one of {sorted(FIELD_NAMES)}")
+    if spec.get("op", ">") not in OPERATORS:
+        raise ValueError(f"Rule {rule_id!r}: op must be one of {OPERATORS}")
+    if type(spec.get("value")) not in (int, float):
+        raise ValueError(f"Rule {rule_id!r}: value must be a number")
+    if spec.get("severity", "warning") not in SEVERITIES:
+        raise ValueError(f"Rule {rule_id!r}: severity must be one of {SEVERITIES}")
+
+    minutes = spec.get("minutes")
+    if rule_type == "threshold" and minutes is not None:
+        raise ValueError(f"Rule {rule_id!r}: minutes only applies to rate and sustained rules")
+    if rule_type == "rate" and minutes is None:
+        minutes = 1
+    if rule_type != "threshold" and (type(minutes) not in (int, float) or minutes <= 0):
+        raise ValueError(f"Rule {rule_id!r}: minutes must be a positive number")
+
+    sensors = spec.get("sensors")
+    if sensors is not None:
+        if not isinstance(sensors, list) or not sensors or not all(isinstance(s, str) for s in sensors):
+            raise ValueError(f"Rule {rule_id!r}: sensors must be a non-empty list of sensor ids")
+        sensors = sorted(set(sensors))
+
+    return {
+        "id": rule_id,
+        "type": rule_type,
+        "field": FIELD_NAMES[spec["field"]][1],
+        "op": spec.get("op", ">"),
+        "value": float(spec["value"]),
+        "minutes": minutes,
+        "severity": spec.get("severity", "warning"),
+        "sensors": sensors,
+    }
+
+
+def parse_rules(specs) -> list:
+    '''A rule list, or {"rules": [...]}, -> normalized rules; raises ValueError'''
+    if isinstance(specs, dict):
+        specs = specs.get("rules")
+    if not isinstance(specs, list):
+        raise ValueError("Expected a JSON list of rules (or {\"rules\": [...]})")
+    rules = [parse_rule(spec) for spec in specs]
+    ids = [rule["id"] for rule in rules]
+    duplicates = sorted({rule_id for rule_id in ids if ids.count(rule_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate rule ids: {duplicates}")
+    return rules
+
+
+def group_key(rule: dict) -> tuple:
+    '''(type, field, direction): rules evaluated together as one comparison'''
+    return RULE_TYPES.index(rule["type"]), FIELDS.index(rule["field"]), -1 if rule["op"] == ">" else 1
+
+
+def load_rules(path) -> list:
+    return parse_rules(orjson.loads(Path(path).read_bytes()))
+
+
+class AlertEngine:
+    '''Evaluates a rule set over batches of readings, with per-sensor state in [sensor, rule] arrays'''
+
+    def __init__(self, rules: Optional[list] = None, path=None, check_interval: float = RULES_CHECK_SECONDS):
+        self.path = Path(path) if path else None
+        self.check_interval = check_interval
+        self.sensor_index = {}
+        self.sensor_ids = []
+        self.last_timestamps = np.full(MIN_SENSORS, NONE, dtype=np.int64)
+        self.last_values = np.full((MIN_SENSORS, len(FIELDS)), np.nan)
+        self.rules = []
+        self.active = np.zeros((MIN_SENSORS, 0), dtype=bool)
+        self.since = np.zeros((MIN_SENSORS, 0), dtype=np.int64)
+        self.applies = np.zeros((MIN_SENSORS, 0), dtype=bool)
+        self.pending = []
+        self.evaluated = self.fired = self.resolved = self.reloads = self.reload_errors = 0
+        self._mtime = None
+        self._checked = time.monotonic()
+
+        if self.path is not None:
+            # A broken file at startup is a configuration error, not something to run without
+            self._mtime = self.path.stat().st_mtime_ns
+            self.set_rules(load_rules(self.path))
+        else:
+            self.set_rules(DEFAULT_RULES if rules is None else rules)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.last_timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.last_timestamps, self.last_values, self.active, self.since, self.applies)
+        return sum(array.nbytes for array in arrays)
+
+    def set_rules(self, specs: list):
+        '''Replace the rule set (raises ValueError, keeping the current one, when it is invalid)
+
+        Rules whose id and definition are unchanged keep their state; active
+        alerts of the others are resolved with the next evaluated batch.
+        '''
+        # Rules of one group (see _compile) sit next to each other, so each group is a column slice
+        rules = sorted(parse_rules(specs), key=group_key)
+        count = len(self.sensor_ids)
+        old = {rule["id"]: (i, rule) for i, rule in enumerate(self.rules)}
+        old_sustained = {rule_id: i for i, rule_id in enumerate(self._sustained_ids())}
+
+        active = np.zeros((self.capacity, len(rules)), dtype=bool)
+        kept = set()
+        for i, rule in enumerate(rules):
+            previous = old.get(rule["id"])
+            if previous is not None and previous[1] == rule:
+                active[:, i] = self.active[:, previous[0]]
+                kept.add(previous[0])
+        for i, rule in enumerate(self.rules):
+            if i not in kept:
+                for sensor in np.flatnonzero(self.active[:count, i]):
+                    self.pending.append(self._event(rule, sensor, "resolved", None, None))
+                    self.resolved += 1
+
+        self.rules = rules
+        self._compile()
+        since = np.full((self.capacity, len(self.sustained_rows)), NONE, dtype=np.int64)
+        for i, rule_id in enumerate(self._sustained_ids()):
+            if rule_id in old_sustained and rules[self.sustained_rows[i]] == old[rule_id][1]:
+                since[:, i] = self.since[:, old_sustained[rule_id]]
+        self.active, self.since = active, since
+        self.applies = np.zeros((self.capacity, len(self.scoped_rows)), dtype=bool)
+        self._scope(0, count)
+
+    def _sustained_ids(self) -> list:
+        return [rule["id"] for rule in self.rules if rule["type"] == "sustained"]
+
+    def _compile(self):
+        '''Group rules by (type, field, direction) so each group is one broadcast comparison'''
+        self.sustained_rows = np.array([i for i, rule in enumerate(self.rules) if rule["type"] == "sustained"],
+                                       dtype=np.intp)
+        self.scoped_rows = np.array([i for i, rule in enumerate(self.rules) if rule["sensors"]], dtype=np.intp)
+        self.has_rates = any(rule["type"] == "rate" for rule in self.rules)
+
+        groups = {}
+        for i, rule in enumerate(self.rules):
+            groups.setdefault(group_key(rule), []).append(i)
+        first_sustained = len(self.rules) - len(self.sustained_rows)
+        self.groups = []
+        for (kind, field, direction), columns in groups.items():
+            rule_type, sign = RULE_TYPES[kind], float(-direction)
+            rules = [self.rules[i] for i in columns]
+            limits = np.array([rule["value"] for rule in rules])
+            if rule_type == "rate":
+                # Compared per minute; reported per the rule's `minutes`
+                limits = limits / np.array([rule["minutes"] for rule in rules])
+            durations = np.array([round(rule["minutes"] * MICROS_PER_MINUTE) if rule_type == "sustained" else 0
+                                  for rule in rules], dtype=np.int64)
+            # Sustained rules sort last, so their columns in `since` are a slice too
+            positions = slice(columns[0] - first_sustained, columns[-1] + 1 - first_sustained)
+            self.groups.append((rule_type, field, sign, slice(columns[0], columns[-1] + 1),
+                                sign * limits, durations, positions))
+
+    def _scope(self, start: int, end: int):
+        '''Fill `applies` for sensors [start, end)'''
+        for i, row in enumerate(self.scoped_rows):
+            members = set(self.rules[row]["sensors"])
+            self.applies[start:end, i] = [sensor_id in members for sensor_id in self.sensor_ids[start:end]]
+
+    def _grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+
+        def grown(array, fill):
+            result = np.full((capacity, *array.shape[1:]), fill, dtype=array.dtype)
+            result[:len(array)] = array
+            return result
+
+        self.last_timestamps = grown(self.last_timestamps, NONE)
+        self.last_values = grown(self.last_values, np.nan)
+        self.active = grown(self.active, False)
+        self.since = grown(self.since, NONE)
+        self.applies = grown(self.applies, False)
+
+    def sensor_rows(self, sensor_ids: List[str]) -> np.ndarray:
+        '''State row of every sensor id, registering new sensors'''
+        index = self.sensor_index
+        rows = np.array([index.get(sensor_id, -1) for sensor_id in sensor_ids], dtype=np.intp)
+        if rows.min(initial=0) < 0:
+            start = len(self.sensor_ids)
+            for i in np.flatnonzero(rows < 0):
+                sensor_id = sensor_ids[i]
+                if sensor_id not in index:
+                    index[sensor_id] = len(self.sensor_ids)
+                    self.sensor_ids.append(sensor_id)
+                rows[i] = index[sensor_id]
+            if len(self.sensor_ids) > self.capacity:
+                self._grow(len(self.sensor_ids))
+            self._scope(start, len(self.sensor_ids))
+        return rows
+
+    def restore(self, entries: list) -> list:
+        '''Mark alerts active again from ALERTS_ACTIVE_KEY entries (firing events)
+
+        Returns resolved events for the entries whose rule no longer exists, no
+        longer matches the entry or does not apply to the sensor.
+        '''
+        columns = {rule["id"]: i for i, rule in enumerate(self.rules)}
+        stale = []
+        for entry in entries:
+            column = columns.get(entry["rule"])
+            rule = self.rules[column] if column is not None else None
+            if (rule is None
+                    or (rule["type"], rule["field"], rule["op"], rule["value"], rule["severity"])
+                    != (entry["type"], entry["field"], entry["op"], entry["limit"], entry["severity"])
+                    or (rule["sensors"] and entry["sensor_id"] not in rule["sensors"])):
+                stale.append(dict(entry, state="resolved", value=None))
+                self.resolved += 1
+                continue
+            sensor = self.sensor_rows([entry["sensor_id"]])[0]
+            self.active[sensor, column] = True
+            if rule["type"] == "sustained":
+                # The condition held for at least `minutes` before the alert fired
+                fired_at = (datetime.fromisoformat(entry["timestamp"]) - EPOCH) // ONE_MICROSECOND
+                position = int(np.flatnonzero(self.sustained_rows == column)[0])
+                self.since[sensor, position] = fired_at - round(rule["minutes"] * MICROS_PER_MINUTE)
+        return stale
+
+    def maybe_reload(self, now: Optional[float] = None):
+        '''Reload ALERT_RULES_FILE if it changed, checking at most every check_interval seconds'''
+        if self.path is None:
+            return
+        now = time.monotonic() if now is None else now
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError as e:
+            if self._mtime is not None:
+                self._mtime = None
+                self.reload_errors += 1
+                logger.error("alert rules unreadable, keeping current rules",
+                             extra={"fields": {"path": str(self.path), "error": str(e)}})
+            return
+        if mtime == self._mtime:
+            return
+        # Recorded even when the file is broken, so it is not re-parsed until it changes again
+        self._mtime = mtime
+        try:
+            self.set_rules(load_rules(self.path))
+        except (OSError, ValueError) as e:
+            self.reload_errors += 1
+            logger.error("alert rules rejected, keeping current rules",
+                         extra={"fields": {"path": str(self.path), "error": str(e)}})
+            return
+        self.reloads += 1
+        logger.info("alert rules reloaded", extra={"fields": {"path": str(self.path), "rules": len(self.rules)}})
+
+    def evaluate_rows(self, rows: List[dict]) -> list:
+        '''evaluate() for insert rows (see ingest.reading_row)'''
+        count = len(rows)
+        micros = np.fromiter(((row["timestamp"] - EPOCH) // ONE_MICROSECOND for row in rows),
+                             dtype=np.int64, count=count)
+        values = np.empty((len(FIELDS), count))
+        for i, field in enumerate(FIELDS):
+            values[i] = np.fromiter((row[field] for row in rows), dtype=np.float64, count=count)
+        return self.evaluate([row["sensor_id"] for row in rows], micros, values)
+
+    def evaluate(self, sensor_ids: List[str], micros: np.ndarray, values: np.ndarray) -> list:
+        '''Evaluate every rule over one batch and update the state; returns the transitions as events
+
+        micros: int64 microseconds since the epoch per reading; values: 3 x n
+        (co2_ppm, temperature, humidity). The batch may be in any order.
+        '''
+        self.maybe_reload()
+        events, self.pending = self.pending, []
+        if not len(micros):
+            return events
+
+        rows = self.sensor_rows(sensor_ids)
+        fresh = micros > self.last_timestamps[rows]
+        if not fresh.all():
+            rows, micros, values = rows[fresh], micros[fresh], values[:, fresh]
+            if not len(rows):
+                return events
+        count = len(rows)
+        if count > 1 and not (rows[1:] > rows[:-1]).all():
+            order = np.lexsort((micros, rows))
+            rows, micros, values = rows[order], micros[order], values[:, order]
+            first = np.empty(count, dtype=bool)
+            first[0] = True
+            first[1:] = rows[1:] != rows[:-1]
+            starts = np.flatnonzero(first)
+        else:
+            # Common case (a fleet tick, a single reading): one reading per sensor, already grouped
+            first = None
+            starts = np.arange(count)
+        ends = np.append(starts[1:], count) - 1
+        sensors = rows[starts]
+        if count > 1 and sensors[-1] - sensors[0] == len(sensors) - 1:
+            # Consecutive rows (sensors registered in batch order): slice the state instead of gathering
+            sensors = slice(sensors[0], sensors[-1] + 1)
+        self.evaluated += count
+
+        rates = self._rates(sensors, micros, values, starts) if self.has_rates else None
+        triggered = np.zeros((count, len(self.rules)), dtype=bool)
+        since = np.full((count, len(self.sustained_rows)), NONE, dtype=np.int64)
+        for rule_type, field, sign, columns, limits, durations, positions in self.groups:
+            measure = sign * (rates[field] if rule_type == "rate" else values[field])
+            holds = measure[:, None] > limits
+            if rule_type == "sustained":
+                started = self._run_start(holds, micros, first, sensors, positions)
+                since[:, positions] = np.where(holds, started, NONE)
+                holds &= micros[:, None] - started >= durations
+            triggered[:, columns] = holds
+        if len(self.scoped_rows):
+            triggered[:, self.scoped_rows] &= self.applies[rows if first is not None else sensors]
+
+        # Each sensor's newest reading in the batch
+        last = ends if first is not None else slice(None)
+        if first is None:
+            any_triggered = last_triggered = triggered
+        else:
+            any_triggered = np.logical_or.reduceat(triggered, starts, axis=0)
+            last_triggered = triggered[last]
+        was_active = self.active[sensors]
+        fired = any_triggered & ~was_active
+        resolved = (was_active | any_triggered) & ~last_triggered
+        self.active[sensors] = last_triggered
+        self.since[sensors] = since[last]
+        self.last_timestamps[sensors] = micros[last]
+        self.last_values[sensors] = values[:, last].T
+
+        sensor_of_group = rows[starts]
+        for state, changed in (("firing", fired), ("resolved", resolved)):
+            for flat in np.flatnonzero(changed):
+                group, column = divmod(int(flat), len(self.rules))
+                at = ends[group]
+                if state == "firing":
+                    at = starts[group] + np.argmax(triggered[starts[group]:at + 1, column])
+                events.append(self._transition(column, sensor_of_group[group], state, at, micros, values, rates))
+        return events
+
+    def _rates(self, sensors, micros, values, starts) -> np.ndarray:
+        '''Change per minute of every field since each reading's predecessor (NaN without one)'''
+        previous_micros = np.empty_like(micros)
+        previous_micros[1:] = micros[:-1]
+        previous_micros[starts] = self.last_timestamps[sensors]
+        previous_values = np.empty_like(values)
+        previous_values[:, 1:] = values[:, :-1]
+        previous_values[:, starts] = self.last_values[sensors].T
+        # No predecessor: the NaN values make the rate NaN, and NaN compares false
+        elapsed = np.where(previous_micros == NONE, 1, micros - previous_micros).astype(np.float64)
+        elapsed[elapsed <= 0] = np.nan
+        return (values - previous_values) * (MICROS_PER_MINUTE / elapsed)
+
+    def _run_start(self, holds, micros, first, sensors, positions) -> np.ndarray:
+        '''Per reading and sustained rule: since when its condition has held without interruption
+
+        A run is broken by a reading where the condition does not hold and at
+        the first reading of each sensor, where it may continue from `since`.
+        '''
+        if first is None:
+            # One reading per sensor: each run either continues from `since` or starts here
+            carried = self.since[sensors][:, positions]
+            return np.where(holds & (carried != NONE), carried, micros[:, None])
+
+        index = np.arange(len(holds))[:, None]
+        breaks = ~holds | first[:, None]
+        last_break = np.maximum.accumulate(np.where(breaks, index, 0), axis=0)
+        continues = np.take_along_axis(holds, last_break, axis=0)
+        start = np.minimum(last_break + ~continues, len(holds) - 1)
+        started = micros[start]
+        carried = self.since[sensors][np.cumsum(first) - 1][:, positions]
+        return np.where(continues & (carried != NONE), carried, started)
+
+    def _transition(self, column, sensor, state, at, micros, values, rates) -> dict:
+        rule = self.rules[column]
+        field = FIELDS.index(rule["field"])
+        if rule["type"] == "rate":
+            value = rates[field, at] * rule["minutes"]
+        else:
+            value = values[field, at]
+        if state == "firing":
+            self.fired += 1
+        else:
+            self.resolved += 1
+        return self._event(rule, sensor, state, float(value), int(micros[at]))
+
+    def _event(self, rule: dict, sensor: int, state: str, value, micros) -> dict:
+        if micros is None:
+            micros = int(self.last_timestamps[sensor])
+        return {
+            "rule": rule["id"],
+            "sensor_id": self.sensor_ids[sensor],
+            "state": state,
+            "severity": rule["severity"],
+            "type": rule["type"],
+            "field": rule["field"],
+            "op": rule["op"],
+            "limit": rule["value"],
+            "value": value,
+            "timestamp": (EPOCH + timedelta(microseconds=micros)).isoformat(),
+        }
+
+    def stats(self) -> dict:
+        count = len(self.sensor_ids)
+        return {
+            "source": str(self.path) if self.path else "default",
+            "rules": len(self.rules),
+            "sensors": count,
+            "active": int(self.active[:count].sum()),
+            "evaluated_readings": self.evaluated,
+            "fired": self.fired,
+            "resolved": self.resolved,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "bytes": self.nbytes,
+        }
+
+
+# The process-wide engine every ingest path evaluates with (None with ALERTS_ENABLED=0)
+rule_engine = AlertEngine(path=ALERT_RULES_FILE or None) if ALERTS_ENABLED else None
+
+
+def record(pipe, rows: List[dict], engine: Optional[AlertEngine] = None) -> list:
+    '''Evaluate rows and queue the resulting transitions on an existing pipeline (see ingest.cache_latest)'''
+    engine = engine or rule_engine
+    if engine is None or not rows:
+        return []
+    start = time.perf_counter()
+    events = engine.evaluate_rows(rows)
+    metrics.observe_since(metrics.ALERT_EVALUATION, start)
+    if events:
+        queue_events(pipe, events)
+    return events
+
+
+async def restore(redis_client, engine: Optional[AlertEngine] = None) -> int:
+    '''Rebuild the engine's active alerts from ALERTS_ACTIVE_KEY at startup; returns how many were restored'''
+    engine = engine or rule_engine
+    if engine is None:
+        return 0
+    entries = [orjson.loads(value) for value in await redis_client.hvals(ALERTS_ACTIVE_KEY)]
+    stale = engine.restore(entries)
+    if stale:
+        pipe = redis_client.pipeline(transaction=False)
+        queue_events(pipe, stale)
+        await pipe.execute()
+    return len(entries) - len(stale)
+
+
+def queue_events(pipe, events: list):
+    for event in events:
+        key = f"{event['rule']}:{event['sensor_id']}"
+        if event["state"] == "firing":
+            pipe.hset(ALERTS_ACTIVE_KEY, key, orjson.dumps(event))
+        else:
+            pipe.hdel(ALERTS_ACTIVE_KEY, key)
+        metrics.ALERT_EVENTS.labels(event["severity"], event["state"]).inc()
+        level = logging.WARNING if event["state"] == "firing" and event["severity"] != "info" else logging.INFO
+        logger.log(level, f"alert {event['state']}", extra={"fields": {
+            key: event[key] for key in ("rule", "sensor_id", "severity", "value", "timestamp")
+        }})
+    pipe.publish(ALERTS_CHANNEL, orjson.dumps(events))
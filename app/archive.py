@@ -0,0 +1,318 @@
+"""
+Cold storage: readings older than ARCHIVE_AFTER_DAYS move out of
+sensor_readings into compressed Parquet files, one per sensor and UTC day:
+
+    {ARCHIVE_DIR}/sensor_id={quoted id}/{YYYY-MM-DD}.parquet
+
+Files hold timestamp (timestamp[us]), co2_ppm, temperature and humidity
+sorted by timestamp, zstd-compressed with delta-encoded timestamps and
+byte-stream-split floats, in row groups of ROW_GROUP_SIZE readings.
+
+The job works one sensor-day at a time, in one transaction: DELETE ...
+RETURNING the day's rows, write them to the day's file (merged with the file
+already there, fsynced, then renamed over it), and commit. The file is
+durable before the rows leave the database, so a failure leaves rows in both
+tiers rather than neither; the next run merges them in again and drops the
+duplicates, and readers drop them until then (see Archive.boundary). Rollups
+stay in the database, so rollup-resolution history is unaffected; rebuilding
+rollups skips each sensor's archived days (rollups.rebuild_rollups).
+
+Reads open only the files of the days a window overlaps, memory-mapped, and
+filter on timestamp so Parquet skips row groups outside the range by their
+statistics. /readings/history, /stats and /readings/export combine them with
+the database rows. Which days a sensor has archived comes from one listing of
+its directory, cached until the directory changes, so finding them does not
+cost a filesystem call per day of the window on the event loop.
+
+Usage:
+    python -m app.archive run                    # archive days older than ARCHIVE_AFTER_DAYS
+    python -m app.archive run --every 3600       # keep running, once an hour
+    python -m app.archive run --days 7 --sensor SENSOR_001
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+from sqlalchemy import delete, func, select
+
+from .database import SensorReading
+from .downsample import rows_to_columns
+
+# Empty disables the archive: nothing is moved and queries only read the database
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 30))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+FIELDS = ("co2_ppm", "temperature", "humidity")
+ROW_GROUP_SIZE = 65536
+ONE_DAY = timedelta(days=1)
+# Directory mtimes this recent may not yet reflect a write in the same tick: list again
+LISTING_SETTLE_NS = 2_000_000_000
+
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def merge_columns(*parts):
+    '''Concatenate ascending (timestamps, fields) pairs into one ascending pair; None parts are skipped
+
+    Where the parts' time ranges overlap (rows left in both tiers by an
+    interrupted run), rows identical in every column are kept once.
+    '''
+    parts = [part for part in parts if part is not None]
+    if len(parts) == 1:
+        return parts[0]
+    timestamps = np.concatenate([timestamps for timestamps, _ in parts])
+    fields = {name: np.concatenate([fields[name] for _, fields in parts]) for name in FIELDS}
+    ranges = [(timestamps[0], timestamps[-1]) for timestamps, _ in parts if len(timestamps)]
+    if all(previous[1] < following[0] for previous, following in zip(ranges, ranges[1:])):
+        return timestamps, fields
+    return dedupe(timestamps, fields)
+
+
+def dedupe(timestamps: np.ndarray, fields: dict):
+    '''Sort by timestamp and drop rows identical in every column'''
+    order = np.lexsort((*(fields[name] for name in reversed(FIELDS)), timestamps))
+    timestamps = timestamps[order]
+    fields = {name: values[order] for name, values in fields.items()}
+    keep = np.ones(len(timestamps), dtype=bool)
+    keep[1:] = timestamps[1:] != timestamps[:-1]
+    for values in fields.values():
+        keep[1:] |= values[1:] != values[:-1]
+    return timestamps[keep], {name: values[keep] for name, values in fields.items()}
+
+
+class Archive:
+    def __init__(self, root, compression: str = ARCHIVE_COMPRESSION):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.root = Path(root)
+        self.compression = compression
+        self.schema = pa.schema([
+            ("timestamp", pa.timestamp("us")),
+            *((name, pa.float64()) for name in FIELDS),
+        ])
+        # sensor_id -> (directory mtime, archived days ascending)
+        self._listings = {}
+
+    def sensor_dir(self, sensor_id: str) -> Path:
+        # Quoted so any sensor id is one safe path component
+        return self.root / f"sensor_id={quote(sensor_id, safe='')}"
+
+    def path(self, sensor_id: str, day: date) -> Path:
+        return self.sensor_dir(sensor_id) / f"{day.isoformat()}.parquet"
+
+    def sensor_ids(self) -> list:
+        '''Sensors with an archive directory'''
+        if not self.root.is_dir():
+            return []
+        prefix = "sensor_id="
+        return sorted(unquote(entry.name[len(prefix):]) for entry in os.scandir(self.root)
+                      if entry.name.startswith(prefix) and entry.is_dir())
+
+    def archived_days(self, sensor_id: str) -> list:
+        '''Start of every archived day of a sensor, oldest first
+
+        One stat() per call: the directory listing is reused until the
+        directory's mtime changes (a day file written or replaced).
+        '''
+        directory = self.sensor_dir(sensor_id)
+        try:
+            mtime = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._listings.pop(sensor_id, None)
+            return []
+        cached = self._listings.get(sensor_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        # Temporary files (.{day}.parquet.tmp) do not end in .parquet
+        days = sorted(datetime.fromisoformat(entry.name[:-len(".parquet")]) for entry in os.scandir(directory)
+                      if entry.name.endswith(".parquet"))
+        if time.time_ns() - mtime > LISTING_SETTLE_NS:
+            self._listings[sensor_id] = (mtime, days)
+        return days
+
+    def day_paths(self, sensor_id: str, start: Optional[datetime], end: Optional[datetime]) -> list:
+        '''Existing files of the days overlapping [start, end), oldest first'''
+        first = day_start(start) if start is not None else None
+        return [self.path(sensor_id, day.date()) for day in self.archived_days(sensor_id)
+                if (first is None or day >= first) and (end is None or day < end)]
+
+    def boundary(self, sensor_id: str, start: Optional[datetime], end: Optional[datetime] = None):
+        '''End of the newest archived day overlapping [start, end), or None when no day is archived
+
+        Database rows before it are duplicates left by an interrupted run or late
+        readings the next run will archive; readers merge them with the archived
+        ones (merge_columns) and read the database as usual from the boundary on.
+        '''
+        paths = self.day_paths(sensor_id, start, end)
+        return datetime.fromisoformat(paths[-1].stem) + ONE_DAY if paths else None
+
+    def read_file(self, path: Path, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        '''(datetime64[us] array, name -> float64 array) of one file, restricted to [start, end)'''
+        import pyarrow.parquet as pq
+
+        filters = []
+        if start is not None:
+            filters.append(("timestamp", ">=", start))
+        if end is not None:
+            filters.append(("timestamp", "<", end))
+        table = pq.read_table(path, memory_map=True, filters=filters or None)
+        timestamps = table.column("timestamp").to_numpy().astype("datetime64[us]")
+        return timestamps, {name: table.column(name).to_numpy() for name in FIELDS}
+
+    def iter_days(self, sensor_id: str, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> Iterator[tuple]:
+        '''(timestamps, fields) per archived day overlapping [start, end), oldest first'''
+        for path in self.day_paths(sensor_id, start, end):
+            timestamps, fields = self.read_file(path, start, end)
+            if len(timestamps):
+                yield timestamps, fields
+
+    def read_window(self, sensor_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        '''Archived readings in [start, end) as ascending columns, or None when there are none'''
+        days = list(self.iter_days(sensor_id, start, end))
+        if not days:
+            return None
+        return merge_columns(*days)
+
+    async def fetch(self, sensor_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        '''read_window off the event loop; no thread hop when no file overlaps the window'''
+        if not self.day_paths(sensor_id, start, end):
+            return None
+        return await asyncio.to_thread(self.read_window, sensor_id, start, end)
+
+    def write_day(self, sensor_id: str, day: date, timestamps: np.ndarray, fields: dict) -> int:
+        '''Merge readings into the day's file (atomically replaced); returns its reading count'''
+        import pyarrow.parquet as pq
+
+        path = self.path(sensor_id, day)
+        if path.exists():
+            timestamps, fields = merge_columns(self.read_file(path), (timestamps, fields))
+        timestamps, fields = dedupe(timestamps.astype("datetime64[us]"), fields)
+
+        table = self.pa.table(
+            [self.pa.array(timestamps, type=self.pa.timestamp("us")),
+             *(self.pa.array(fields[name], type=self.pa.float64()) for name in FIELDS)],
+            schema=self.schema
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        pq.write_table(
+            table, tmp,
+            compression=self.compression,
+            use_dictionary=False,
+            column_encoding={"timestamp": "DELTA_BINARY_PACKED",
+                             **{name: "BYTE_STREAM_SPLIT" for name in FIELDS}},
+            row_group_size=ROW_GROUP_SIZE,
+        )
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._listings.pop(sensor_id, None)
+        directory = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        return len(timestamps)
+
+    def archive_day(self, engine, sensor_id: str, day: datetime) -> int:
+        '''Move one sensor-day out of the database; returns readings moved'''
+        columns = (SensorReading.timestamp, SensorReading.co2_ppm, SensorReading.temperature, SensorReading.humidity)
+        with engine.begin() as conn:
+            rows = conn.execute(
+                delete(SensorReading).where(
+                    SensorReading.sensor_id == sensor_id,
+                    SensorReading.timestamp >= day,
+                    SensorReading.timestamp < day + ONE_DAY
+                ).returning(*columns)
+            ).all()
+            if rows:
+                # Written (and fsynced) before the DELETE commits
+                self.write_day(sensor_id, day.date(), *rows_to_columns(rows, FIELDS))
+        return len(rows)
+
+    def run(self, engine, older_than_days: int = ARCHIVE_AFTER_DAYS, sensor_ids: Optional[list] = None,
+            now: Optional[datetime] = None) -> dict:
+        '''Archive every whole day before now - older_than_days; returns counts'''
+        cutoff = day_start((now or datetime.utcnow()) - timedelta(days=older_than_days))
+        if sensor_ids is None:
+            sensor_ids = sensors_with_readings_before(engine, cutoff)
+
+        moved = days = 0
+        for sensor_id in sensor_ids:
+            while True:
+                with engine.connect() as conn:
+                    oldest = conn.execute(
+                        select(func.min(SensorReading.timestamp)).where(
+                            SensorReading.sensor_id == sensor_id, SensorReading.timestamp < cutoff
+                        )
+                    ).scalar()
+                if oldest is None:
+                    break
+                moved += self.archive_day(engine, sensor_id, day_start(oldest))
+                days += 1
+        return {"cutoff": cutoff.isoformat(), "sensors": len(sensor_ids), "days": days, "readings": moved}
+
+    def stats(self) -> dict:
+        files = list(self.root.glob("sensor_id=*/*.parquet"))
+        return {
+            "root": str(self.root),
+            "sensors": len({path.parent for path in files}),
+            "files": len(files),
+            "bytes": sum(path.stat().st_size for path in files),
+        }
+
+
+def sensors_with_readings_before(engine, cutoff: datetime) -> list:
+    '''Candidate sensors, from the small 1d rollups when they are maintained'''
+    from . import rollups
+    from .database import SensorRollup
+
+    if rollups.ROLLUPS_ENABLED:
+        query = select(SensorRollup.sensor_id).where(
+            SensorRollup.resolution == "1d", SensorRollup.bucket < cutoff
+        ).distinct()
+    else:
+        query = select(SensorReading.sensor_id).where(SensorReading.timestamp < cutoff).distinct()
+    with engine.connect() as conn:
+        return sorted(conn.execute(query).scalars())
+
+
+def main():
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run")
+    run.add_argument("--dir", default=ARCHIVE_DIR, help="archive root (default ARCHIVE_DIR)")
+    run.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive readings older than this")
+    run.add_argument("--sensor", action="append", help="only these sensors (repeatable)")
+    run.add_argument("--every", type=float, default=0, help="repeat every N seconds")
+    args = parser.parse_args()
+
+    if not args.dir:
+        parser.error("set ARCHIVE_DIR or pass --dir")
+    archive = Archive(args.dir)
+    while True:
+        started = time.perf_counter()
+        result = archive.run(engine, args.days, args.sensor)
+        print(f"Archived {result['readings']:,} readings ({result['days']} sensor-days) before {result['cutoff']} "
+              f"in {time.perf_counter() - started:.1f}s")
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
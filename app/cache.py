@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("app.cache")
+
+
+class LocalCache:
+    '''Bounded in-process LRU whose entries expire after their own TTL'''
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        '''Cached value, or None when missing or expired'''
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float):
+        if ttl <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TierStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, hit: bool, elapsed: float):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "avg_seconds": self.seconds / lookups if lookups else 0.0,
+            "max_seconds": self.max_seconds,
+        }
+
+
+class TwoTierCache:
+    '''In-process LRU in front of Redis, with single-flight misses and stale-while-revalidate
+
+    Redis keys hold the plain JSON value and live for ttl + stale_ttl seconds; once
+    fewer than stale_ttl seconds remain the value is stale: it is still served, and
+    one background task per key recomputes it. The local tier only keeps values
+    for local_ttl seconds so replicas never drift far from Redis.
+
+    Concurrent misses for the same key in this process share one computation.
+    '''
+
+    def __init__(self, redis_client, ttl=60.0, stale_ttl=30.0, local_ttl=5.0, local_max_entries=1024):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.local_ttl = local_ttl
+        self.local = LocalCache(local_max_entries)
+        self._inflight = {}
+        self._refreshes = set()
+
+        # Counters reported by stats()
+        self.local_stats = TierStats()
+        self.redis_stats = TierStats()
+        self.compute_stats = TierStats()
+        self.coalesced = 0
+        self.stale_served = 0
+        self.refresh_failures = 0
+
+    async def get_or_compute(self, key: str, compute):
+        '''Return (value, source) with source "local", "redis" or "computed"
+
+        compute is an async callable; a None result is returned but not cached.
+        '''
+        start = time.perf_counter()
+        value = self.local.get(key)
+        self.local_stats.record(value is not None, time.perf_counter() - start)
+        if value is not None:
+            return value, "local"
+
+        start = time.perf_counter()
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.pttl(key)
+        cached, remaining_ms = await pipe.execute()
+        self.redis_stats.record(cached is not None, time.perf_counter() - start)
+
+        if cached is not None:
+            value = json.loads(cached)
+            fresh_for = remaining_ms / 1000 - self.stale_ttl if remaining_ms and remaining_ms > 0 else 0.0
+            if fresh_for > 0:
+                self.local.set(key, value, min(self.local_ttl, fresh_for))
+            else:
+                self.stale_served += 1
+                self._refresh_in_background(key, compute)
+            return value, "redis"
+
+        return await self._single_flight(key, compute), "computed"
+
+    async def invalidate(self, key: str):
+        '''Drop key from both tiers so the next lookup recomputes it'''
+        self.local.discard(key)
+        await self.redis_client.delete(key)
+
+    def stats(self) -> dict:
+        return {
+            "local": {**self.local_stats.as_dict(), "entries": len(self.local),
+                      "capacity": self.local.max_entries},
+            "redis": self.redis_stats.as_dict(),
+            "compute": {"computations": self.compute_stats.misses,
+                        "avg_seconds": self.compute_stats.as_dict()["avg_seconds"],
+                        "max_seconds": self.compute_stats.max_seconds, "coalesced": self.coalesced,
+                        "stale_served": self.stale_served, "refresh_failures": self.refresh_failures,
+                        "inflight": len(self._inflight)},
+        }
+
+    async def _single_flight(self, key, compute):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self._inflight[key] = asyncio.create_task(self._compute_and_store(key, compute))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: a cancelled waiter must not cancel the computation other waiters share
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(self, key, compute):
+        start = time.perf_counter()
+        try:
+            value = await compute()
+        finally:
+            self.compute_stats.record(False, time.perf_counter() - start)
+        if value is not None:
+            await self.redis_client.setex(key, int(self.ttl + self.stale_ttl), json.dumps(value))
+            self.local.set(key, value, self.local_ttl)
+        return value
+
+    def _refresh_in_background(self, key, compute):
+        if key in self._inflight:
+            self.coalesced += 1
+            return
+
+        async def refresh():
+            try:
+                await self._single_flight(key, compute)
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.warning("background cache refresh failed", extra={"fields": {"key": key, "error": str(e)}})
+
+        # Keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.create_task(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
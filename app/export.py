@@ -0,0 +1,170 @@
+import asyncio
+import csv
+import io
+from datetime import datetime, time, timezone
+from typing import Optional
+
+import numpy as np
+import orjson
+from sqlalchemy import select
+
+from .archive import ONE_DAY, merge_columns
+from .database import SensorReading
+from .downsample import rows_to_columns
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+COLUMNS = ("timestamp", "co2_ppm", "temperature", "humidity")
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    '''Stored timestamps are naive UTC; convert an offset-aware bound before it reaches a query'''
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def export_query(sensor_id: str, start: Optional[datetime], end: Optional[datetime], chunk_size: int):
+    '''Ascending range scan streamed through a server-side cursor, chunk_size rows at a time'''
+    query = select(
+        SensorReading.timestamp, SensorReading.co2_ppm, SensorReading.temperature, SensorReading.humidity
+    ).where(SensorReading.sensor_id == sensor_id)
+    if start is not None:
+        query = query.where(SensorReading.timestamp >= start)
+    if end is not None:
+        query = query.where(SensorReading.timestamp < end)
+    return query.order_by(SensorReading.timestamp.asc()).execution_options(yield_per=chunk_size)
+
+
+class NDJSONEncoder:
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, rows) -> bytes:
+        return b"".join(
+            orjson.dumps({"timestamp": ts.isoformat(), "co2_ppm": co2, "temperature": temp, "humidity": hum},
+                         option=orjson.OPT_APPEND_NEWLINE)
+            for ts, co2, temp, hum in rows
+        )
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class CSVEncoder:
+    def header(self) -> bytes:
+        return (",".join(COLUMNS) + "\r\n").encode()
+
+    def encode(self, rows) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows((ts.isoformat(), co2, temp, hum) for ts, co2, temp, hum in rows)
+        return buffer.getvalue().encode()
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _ChunkSink(io.RawIOBase):
+    '''Write-only file object whose contents are handed out and cleared chunk by chunk'''
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+class ArrowEncoder:
+    '''Arrow IPC stream: one schema message, then one record batch per chunk'''
+
+    def __init__(self):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ("timestamp", pa.timestamp("us")),
+            ("co2_ppm", pa.float64()),
+            ("temperature", pa.float64()),
+            ("humidity", pa.float64()),
+        ])
+        self.sink = _ChunkSink()
+        self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+    def header(self) -> bytes:
+        return self.sink.take()
+
+    def encode(self, rows) -> bytes:
+        columns = list(zip(*rows))
+        batch = self.pa.record_batch(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        self.writer.write_batch(batch)
+        return self.sink.take()
+
+    def footer(self) -> bytes:
+        self.writer.close()
+        return self.sink.take()
+
+
+ENCODERS = {"ndjson": NDJSONEncoder, "csv": CSVEncoder, "arrow": ArrowEncoder}
+
+
+async def stream_export(session_factory, encoder, sensor_id: str, start: Optional[datetime],
+                        end: Optional[datetime], chunk_size: int, archive=None):
+    '''Yield the encoded export chunk by chunk; memory stays bounded by chunk_size rows
+    (or one archived day)
+
+    Archived days (see app.archive) come first, each merged with any database
+    rows of that day (see Archive.boundary), then the rows still in the database.
+    '''
+    start, end = naive_utc(start), naive_utc(end)
+    header = encoder.header()
+    if header:
+        yield header
+
+    boundary = archive.boundary(sensor_id, start, end) if archive is not None else None
+    if boundary is not None:
+        # Database rows before the boundary are few, normally none: read at once, merged into their day
+        async with session_factory() as db:
+            result = await db.stream(export_query(sensor_id, start, min(end or boundary, boundary), chunk_size))
+            late_timestamps, late_fields = rows_to_columns(await result.all())
+        paths = {datetime.fromisoformat(path.stem): path for path in archive.day_paths(sensor_id, start, end)}
+        late_days = np.unique(late_timestamps.astype("datetime64[D]")).tolist()
+        for day in sorted(paths.keys() | {datetime.combine(day, time()) for day in late_days}):
+            lo, hi = np.searchsorted(late_timestamps, np.array([day, day + ONE_DAY], dtype="datetime64[us]"))
+            timestamps, fields = merge_columns(
+                await asyncio.to_thread(archive.read_file, paths[day], start, end) if day in paths else None,
+                (late_timestamps[lo:hi], {name: values[lo:hi] for name, values in late_fields.items()})
+            )
+            for lo in range(0, len(timestamps), chunk_size):
+                hi = lo + chunk_size
+                yield encoder.encode(list(zip(
+                    timestamps[lo:hi].tolist(), *(fields[name][lo:hi].tolist() for name in COLUMNS[1:])
+                )))
+        start = boundary
+
+    if end is None or start is None or start < end:
+        # The session lives as long as the response body, not the request handler
+        async with session_factory() as db:
+            result = await db.stream(export_query(sensor_id, start, end, chunk_size))
+            async for rows in result.partitions():
+                yield encoder.encode(rows)
+
+    footer = encoder.footer()
+    if footer:
+        yield footer
@@ -0,0 +1,91 @@
+"""
+Binary ingest formats for POST /readings, selected by Content-Type.
+
+application/x-sensor-frame - fixed little-endian layout, one sensor per frame:
+
+    offset  size  field
+    0       2     magic b"SR"
+    2       1     version (1)
+    3       1     sensor_id length N
+    4       N     sensor_id (UTF-8)
+    4+N     16*k  k records of: uint32 age_ms, float32 co2_ppm, float32 temperature, float32 humidity
+
+    age_ms is how long before sending the reading was taken (0 for a live reading),
+    so a device can buffer readings while offline without keeping wall-clock time.
+
+application/msgpack - one map, or an array of maps, with the JSON field names.
+"""
+
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+FRAME_CONTENT_TYPE = "application/x-sensor-frame"
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+MAGIC = b"SR"
+VERSION = 1
+HEADER = struct.Struct("<2sBB")
+RECORD = np.dtype([
+    ("age_ms", "<u4"),
+    ("co2_ppm", "<f4"),
+    ("temperature", "<f4"),
+    ("humidity", "<f4"),
+])
+
+
+def encode_frame(sensor_id: str, readings) -> bytes:
+    '''Build a frame from (age_ms, co2_ppm, temperature, humidity) tuples (what the firmware sends)'''
+    name = sensor_id.encode()
+    return HEADER.pack(MAGIC, VERSION, len(name)) + name + np.array(list(readings), dtype=RECORD).tobytes()
+
+
+def decode_frame(body: bytes, received_at: datetime) -> list:
+    '''Decode a frame into insert rows (see ingest.reading_row); raises ValueError when malformed'''
+    if len(body) < HEADER.size:
+        raise ValueError("Frame shorter than its header")
+    magic, version, name_length = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise ValueError("Not a sensor frame (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+
+    offset = HEADER.size + name_length
+    if name_length == 0 or len(body) < offset:
+        raise ValueError("Missing sensor_id")
+    sensor_id = body[HEADER.size:offset].decode()
+    if (len(body) - offset) % RECORD.itemsize:
+        raise ValueError(f"Record section is not a multiple of {RECORD.itemsize} bytes")
+
+    records = np.frombuffer(body, dtype=RECORD, offset=offset)
+    if not len(records):
+        raise ValueError("Frame holds no readings")
+    values = np.stack([records["co2_ppm"], records["temperature"], records["humidity"]])
+    if not np.isfinite(values).all():
+        raise ValueError("Readings must be finite numbers")
+
+    # float32 -> float64 -> Python floats in one pass per column
+    co2, temperature, humidity = values.astype(np.float64).tolist()
+    ages = records["age_ms"].tolist()
+    return [
+        {
+            "sensor_id": sensor_id,
+            "co2_ppm": co2[i],
+            "temperature": temperature[i],
+            "humidity": humidity[i],
+            "timestamp": received_at - timedelta(milliseconds=ages[i]),
+        }
+        for i in range(len(records))
+    ]
+
+
+def decode_msgpack(body: bytes) -> list:
+    '''Decode a MessagePack body into a list of reading mappings (still to be validated)'''
+    import msgpack
+
+    try:
+        items = msgpack.unpackb(body)
+    except (ValueError, msgpack.UnpackException) as e:
+        raise ValueError(f"Invalid MessagePack: {e}")
+    return items if isinstance(items, list) else [items]
@@ -0,0 +1,360 @@
+"""
+In-process hot tier: the last HOT_TIER_RETENTION_MINUTES of readings of every
+sensor in NumPy arrays, so /readings/history and /stats windows inside that
+range are answered by slicing memory instead of querying the database.
+
+Each sensor's readings are kept ascending by timestamp in one int64 array
+(microseconds since the epoch) and a 3 x capacity float64 array (co2_ppm,
+temperature, humidity), 32 bytes per reading. New readings are appended in
+place; the arrays double when full, up to HOT_TIER_SENSOR_CAPACITY readings,
+beyond which the oldest quarter is dropped. HOT_TIER_MEMORY_MB bounds the
+whole tier: past it, the sensors written or read least recently are dropped
+whole. A minute-ly trim releases readings older than the retention.
+
+Feeding: every ingest path (API, simulator, line protocol, MQTT worker)
+publishes its readings on Redis through ingest.cache_latest, back-dated ones
+on BACKFILL_CHANNEL, and the ReadingBroadcaster of each API replica hands
+them to its tier, so every replica holds every sensor. After each
+(re)subscription the tier reloads the window from the database and answers
+nothing until that completes; a reading seen both ways during the reload is
+kept once.
+
+A window is served only if nothing in it can be missing: it must start after
+the last reload's start, inside the retention, and after the newest reading
+this sensor had dropped. Everything else falls through to the database.
+Rows bulk-loaded with app.loader bypass Redis and show up after the next reload.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from .database import SensorReading
+from .downsample import EPOCH, ONE_MICROSECOND, rows_to_columns
+from .stats import column_stats
+
+logger = logging.getLogger("app.hot_tier")
+
+HOT_TIER_ENABLED = os.getenv("HOT_TIER_ENABLED", "0") == "1"
+RETENTION_MINUTES = int(os.getenv("HOT_TIER_RETENTION_MINUTES", 360))
+MEMORY_MB = float(os.getenv("HOT_TIER_MEMORY_MB", 64))
+SENSOR_CAPACITY = int(os.getenv("HOT_TIER_SENSOR_CAPACITY", 8192))
+
+FIELDS = ("co2_ppm", "temperature", "humidity")
+READING_BYTES = 8 * (1 + len(FIELDS))
+MIN_CAPACITY = 64
+
+# Rows per round trip while reloading from the database
+WARM_CHUNK = 50000
+
+
+def to_micros(moment: datetime) -> int:
+    return (moment - EPOCH) // ONE_MICROSECOND
+
+
+class Series:
+    '''One sensor's readings, ascending by timestamp, in [start, end) of preallocated arrays'''
+    __slots__ = ("timestamps", "values", "start", "end")
+
+    def __init__(self, capacity: int):
+        self.allocate(capacity)
+
+    def allocate(self, capacity: int):
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((len(FIELDS), capacity), dtype=np.float64)
+        self.start = self.end = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        return self.capacity * READING_BYTES
+
+    def __len__(self):
+        return self.end - self.start
+
+    def live(self):
+        return self.timestamps[self.start:self.end], self.values[:, self.start:self.end]
+
+    def since(self, micros: int):
+        '''Views of the readings at or after micros'''
+        timestamps, values = self.live()
+        first = int(np.searchsorted(timestamps, micros))
+        return timestamps[first:], values[:, first:]
+
+
+class HotTier:
+    def __init__(self, session_factory, retention_minutes: int = RETENTION_MINUTES, memory_mb: float = MEMORY_MB,
+                 sensor_capacity: int = SENSOR_CAPACITY, trim_interval: float = 60.0,
+                 retry_delay: float = 5.0):
+        self.session_factory = session_factory
+        self.retention = timedelta(minutes=retention_minutes)
+        self.sensor_capacity = max(MIN_CAPACITY, sensor_capacity)
+        # Always room for at least one full sensor
+        self.max_bytes = max(int(memory_mb * 2 ** 20), self.sensor_capacity * READING_BYTES)
+        self.trim_interval = trim_interval
+        self.retry_delay = retry_delay
+
+        self._series = OrderedDict()    # sensor_id -> Series, least recently written or read first
+        self._complete_since = {}       # sensor_id -> micros after the newest reading it dropped
+        self.covered_since = None       # micros the last reload started from
+        self.ready = False
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted_sensors = 0
+        self.dropped_readings = 0
+        self.warmed_readings = 0
+        self.warm_seconds = 0.0
+        self._warm_task = None
+        self._trim_task = None
+
+    # Feeding
+
+    def feed(self, readings: list):
+        '''Published reading payloads (see ingest.latest_payload), e.g. from ReadingBroadcaster'''
+        if not readings:
+            return
+        self.append(
+            [reading["sensor_id"] for reading in readings],
+            np.array([reading["timestamp"] for reading in readings], dtype="datetime64[us]").view(np.int64),
+            np.array([[reading[field] for reading in readings] for field in FIELDS], dtype=np.float64)
+        )
+
+    def append(self, sensor_ids: list, micros: np.ndarray, values: np.ndarray, now: Optional[datetime] = None):
+        '''Add readings of any sensors in any order; values is 3 x n (FIELDS order)'''
+        horizon = to_micros((now or datetime.utcnow()) - self.retention)
+        ids = np.asarray(sensor_ids)
+        keep = micros >= horizon
+        if not keep.all():
+            ids, micros, values = ids[keep], micros[keep], values[:, keep]
+        if not len(ids):
+            return
+
+        if len(ids) > 1:
+            order = np.argsort(ids, kind="stable")
+            ids, micros, values = ids[order], micros[order], values[:, order]
+        edges = [0, *(np.flatnonzero(ids[1:] != ids[:-1]) + 1).tolist(), len(ids)]
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            self._append(str(ids[lo]), micros[lo:hi], values[:, lo:hi])
+
+        while self.nbytes > self.max_bytes and len(self._series) > 1:
+            self._evict(next(iter(self._series)))
+
+    def _append(self, sensor_id: str, micros: np.ndarray, values: np.ndarray):
+        series = self._series.get(sensor_id)
+        if series is None:
+            series = self._series[sensor_id] = Series(self._capacity_for(len(micros)))
+            self.nbytes += series.nbytes
+        else:
+            self._series.move_to_end(sensor_id)
+
+        # While reloading, a reading may arrive both from the database and from Redis
+        dedupe = not self.ready
+        n = len(micros)
+        ascending = n == 1 or bool(np.all(micros[1:] >= micros[:-1]))
+        last = series.timestamps[series.end - 1] if len(series) else None
+        if ascending and (last is None or micros[0] > last or (micros[0] == last and not dedupe)):
+            if series.end + n <= series.capacity:
+                series.timestamps[series.end:series.end + n] = micros
+                series.values[:, series.end:series.end + n] = values
+                series.end += n
+                return
+            old_micros, old_values = series.live()
+            micros = np.concatenate((old_micros, micros))
+            values = np.concatenate((old_values, values), axis=1)
+        else:
+            # Late or back-dated readings: merge and re-sort the sensor's arrays
+            old_micros, old_values = series.live()
+            micros = np.concatenate((old_micros, micros))
+            values = np.concatenate((old_values, values), axis=1)
+            if dedupe:
+                order = np.lexsort((*values[::-1], micros))
+                micros, values = micros[order], values[:, order]
+                keep = np.ones(len(micros), dtype=bool)
+                keep[1:] = (micros[1:] != micros[:-1]) | (values[:, 1:] != values[:, :-1]).any(axis=0)
+                micros, values = micros[keep], values[:, keep]
+            else:
+                order = np.argsort(micros, kind="stable")
+                micros, values = micros[order], values[:, order]
+        self._store(sensor_id, series, micros, values)
+
+    def _store(self, sensor_id: str, series: Series, micros: np.ndarray, values: np.ndarray):
+        '''Replace the series' contents with ascending arrays, resizing and dropping the oldest as needed'''
+        n = len(micros)
+        if n > self.sensor_capacity:
+            # Drop a quarter at once so a full sensor is not rewritten on every reading
+            keep = self.sensor_capacity * 3 // 4
+            self._dropped(sensor_id, int(micros[n - keep - 1]), n - keep)
+            micros, values = micros[n - keep:], values[:, n - keep:]
+            n = keep
+
+        capacity = self._capacity_for(n)
+        if capacity != series.capacity:
+            self.nbytes += (capacity - series.capacity) * READING_BYTES
+            series.allocate(capacity)
+        series.timestamps[:n] = micros
+        series.values[:, :n] = values
+        series.start, series.end = 0, n
+
+    def _capacity_for(self, n: int) -> int:
+        return min(self.sensor_capacity, max(MIN_CAPACITY, 1 << int(n).bit_length()))
+
+    def _dropped(self, sensor_id: str, newest: int, count: int):
+        '''Readings up to newest are gone: windows of this sensor must start after it'''
+        self._complete_since[sensor_id] = max(self._complete_since.get(sensor_id, 0), newest + 1)
+        self.dropped_readings += count
+
+    def _evict(self, sensor_id: str):
+        series = self._series.pop(sensor_id)
+        self.nbytes -= series.nbytes
+        self.evicted_sensors += 1
+        if len(series):
+            self._dropped(sensor_id, int(series.timestamps[series.end - 1]), len(series))
+
+    def trim(self, now: Optional[datetime] = None):
+        '''Release readings older than the retention and shrink mostly empty arrays'''
+        horizon = to_micros((now or datetime.utcnow()) - self.retention)
+        for sensor_id, series in list(self._series.items()):
+            series.start += int(np.searchsorted(series.live()[0], horizon))
+            if not len(series):
+                del self._series[sensor_id]
+                self.nbytes -= series.nbytes
+            elif len(series) * 4 <= series.capacity and series.capacity > MIN_CAPACITY:
+                self._store(sensor_id, series, *series.live())
+        # Windows never reach past the horizon, so older drop marks no longer matter
+        self._complete_since = {sensor_id: since for sensor_id, since in self._complete_since.items()
+                                if since > horizon}
+
+    # Reloading from the database
+
+    def connected(self):
+        '''The readings subscription is (re)established: reload everything published before it'''
+        self.disconnected()
+        self._warm_task = asyncio.create_task(self._reload())
+
+    def disconnected(self):
+        '''Readings may be missed from now on; stop serving until the next reload'''
+        self.ready = False
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            self._warm_task = None
+
+    async def _reload(self):
+        while True:
+            try:
+                await self.warm()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("hot tier reload failed, serving from the database; retrying",
+                               extra={"fields": {"error": str(e)}})
+                await asyncio.sleep(self.retry_delay)
+
+    async def warm(self, now: Optional[datetime] = None):
+        started = time.perf_counter()
+        since = (now or datetime.utcnow()) - self.retention
+        query = select(
+            SensorReading.timestamp, SensorReading.co2_ppm, SensorReading.temperature, SensorReading.humidity,
+            SensorReading.sensor_id
+        ).where(SensorReading.timestamp >= since).order_by(
+            SensorReading.sensor_id, SensorReading.timestamp
+        ).execution_options(yield_per=WARM_CHUNK)
+
+        loaded = 0
+        async with self.session_factory() as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                timestamps, fields = rows_to_columns(rows, FIELDS)
+                self.append([row[4] for row in rows], timestamps.view(np.int64),
+                            np.stack([fields[field] for field in FIELDS]), now=now)
+                loaded += len(rows)
+
+        self.covered_since = to_micros(since)
+        self.ready = True
+        self.warmed_readings = loaded
+        self.warm_seconds = time.perf_counter() - started
+
+    def start(self):
+        if self._trim_task is None:
+            self._trim_task = asyncio.create_task(self._trim_loop())
+
+    async def stop(self):
+        self.disconnected()
+        if self._trim_task is not None:
+            self._trim_task.cancel()
+            try:
+                await self._trim_task
+            except asyncio.CancelledError:
+                pass
+            self._trim_task = None
+
+    async def _trim_loop(self):
+        while True:
+            await asyncio.sleep(self.trim_interval)
+            self.trim()
+
+    # Serving
+
+    def covers(self, sensor_id: str, since: datetime, now: Optional[datetime] = None) -> bool:
+        '''Whether every reading of sensor_id at or after since is held here'''
+        hit = self.ready and to_micros(since) >= max(
+            self.covered_since,
+            to_micros((now or datetime.utcnow()) - self.retention),
+            self._complete_since.get(sensor_id, 0)
+        )
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def window(self, sensor_id: str, since: datetime):
+        '''(datetime64[us] array, name -> float64 array) ascending, like downsample.rows_to_columns'''
+        series = self._series.get(sensor_id)
+        if series is None:
+            return np.empty(0, dtype="datetime64[us]"), {field: np.empty(0) for field in FIELDS}
+        self._series.move_to_end(sensor_id)
+        micros, values = series.since(to_micros(since))
+        # Copies: the arrays are rewritten in place as readings arrive
+        return micros.view("datetime64[us]").copy(), {field: values[i].copy() for i, field in enumerate(FIELDS)}
+
+    def compute_stats(self, sensor_id: str, since: datetime, fields: list, metrics: list) -> Optional[dict]:
+        '''Same result as stats.compute_stats (without window_minutes); None when the window is empty'''
+        series = self._series.get(sensor_id)
+        if series is None:
+            return None
+        self._series.move_to_end(sensor_id)
+        _, values = series.since(to_micros(since))
+        return column_stats(dict(zip(FIELDS, values)), fields, metrics)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ready": self.ready,
+            "covered_since": (EPOCH + self.covered_since * ONE_MICROSECOND).isoformat()
+            if self.covered_since is not None else None,
+            "retention_minutes": self.retention // timedelta(minutes=1),
+            "sensors": len(self._series),
+            "readings": sum(len(series) for series in self._series.values()),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evicted_sensors": self.evicted_sensors,
+            "dropped_readings": self.dropped_readings,
+            "warmed_readings": self.warmed_readings,
+            "warm_seconds": self.warm_seconds,
+        }
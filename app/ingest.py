@@ -0,0 +1,240 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import time
+
+import orjson
+from pydantic import BaseModel, field_validator
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from .database import SensorReading
+from . import alerts, metrics, running_stats, schema
+from .push import BACKFILL_CHANNEL, READINGS_CHANNEL
+from .rollups import update_rollups
+
+LATEST_TTL = 300  # 5 min TTL for sensor:{id}:latest
+
+_payload_encoding = metrics.SERIALIZE_DURATION.labels("reading_payload")
+
+NUMERIC_FIELDS = ("co2_ppm", "temperature", "humidity")
+
+class SensorReadingInput(BaseModel):
+    '''One reading as sent by a sensor (JSON body, MessagePack item, MQTT payload)
+
+    timestamp is optional: devices that buffered readings while offline send when
+    each was measured; without it the reading is stamped on arrival. It must lie
+    within schema.check_timestamp's bounds.
+    '''
+    sensor_id: str
+    co2_ppm: float
+    temperature: float
+    humidity: float
+    timestamp: Optional[datetime] = None
+
+    @field_validator("timestamp")
+    @classmethod
+    def naive_utc(cls, value):
+        if value is None:
+            return value
+        # Stored timestamps are naive UTC; convert offset-aware input
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return schema.check_timestamp(value)
+
+    def to_row(self, received_at: datetime) -> dict:
+        return reading_row(self.sensor_id, self.co2_ppm, self.temperature, self.humidity,
+                           self.timestamp or received_at)
+
+
+# Redis Stream the API appends to in INGEST_MODE=stream; drained by app.stream_worker
+STREAM_KEY = "sensor:readings:stream"
+STREAM_GROUP = "sensor-writers"
+
+# Rows the database rejected permanently (see store_isolating), newest DEAD_LETTER_MAXLEN kept
+DEAD_LETTER_KEY = "sensor:readings:dead-letter"
+DEAD_LETTER_MAXLEN = 10000
+
+# Set of every sensor_id that has reported; backs GET /readings/latest without sensor_ids
+KNOWN_SENSORS_KEY = "sensors:known"
+
+
+def parse_ndjson(body: bytes) -> list:
+    '''Split an NDJSON body into decoded items, keeping undecodable lines as errors'''
+    items = []
+    for line in body.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(orjson.loads(line))
+        except ValueError as e:
+            items.append(ValueError(f"Invalid JSON line: {e}"))
+    return items
+
+
+def decode_reading(body: bytes) -> Optional[tuple]:
+    '''Fast path for one JSON reading: (sensor_id, co2_ppm, temperature, humidity)
+
+    Only accepts the shape SensorReadingInput would accept unchanged (a string
+    sensor_id and JSON numbers, no timestamp); anything else returns None so the
+    caller can let Pydantic coerce or reject it with the usual error details.
+    '''
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+    if type(data) is not dict or type(data.get("sensor_id")) is not str or "timestamp" in data:
+        return None
+    values = [data["sensor_id"]]
+    for field in NUMERIC_FIELDS:
+        value = data.get(field)
+        if type(value) is float:
+            values.append(value)
+        elif type(value) is int:
+            values.append(float(value))
+        else:
+            return None
+    return tuple(values)
+
+
+def reading_row(sensor_id: str, co2_ppm: float, temperature: float, humidity: float,
+                timestamp: datetime) -> dict:
+    '''Build one insert row for SensorReading'''
+    return {
+        "sensor_id": sensor_id,
+        "co2_ppm": co2_ppm,
+        "temperature": temperature,
+        "humidity": humidity,
+        "timestamp": timestamp,
+    }
+
+
+def latest_payload(row: dict) -> dict:
+    '''JSON-ready representation cached under sensor:{id}:latest'''
+    return {
+        "sensor_id": row["sensor_id"],
+        "co2_ppm": row["co2_ppm"],
+        "temperature": row["temperature"],
+        "humidity": row["humidity"],
+        "timestamp": row["timestamp"].isoformat(),
+    }
+
+
+async def store_readings(db, rows: List[dict]):
+    '''Write all rows to PostgreSQL in one bulk INSERT, plus their rollups, in one transaction'''
+    if not rows:
+        return
+    await db.execute(insert(SensorReading), rows)
+    await update_rollups(db, rows)
+    start = time.perf_counter()
+    await db.commit()
+    metrics.observe_since(metrics.DB_COMMIT, start)
+    metrics.READINGS_STORED.inc(len(rows))
+
+
+def is_permanent_error(error: Exception) -> bool:
+    '''Database errors the same rows hit again on every retry (bad values, no partition, a
+    constraint), as opposed to connection-class errors that go away by themselves'''
+    return isinstance(error, (DataError, IntegrityError)) and not error.connection_invalidated
+
+
+async def store_isolating(session_factory, rows: List[dict]) -> list:
+    '''store_readings in a session of its own; rows failing permanently are isolated by bisection
+
+    Returns (row, error message) for the rows that could not be stored, every
+    other row is committed. Connection-class errors are raised for the caller
+    to retry; after a partial bisection that re-inserts the halves already
+    committed (delivery is at-least-once anyway).
+    '''
+    try:
+        async with session_factory() as db:
+            await store_readings(db, rows)
+        return []
+    except Exception as e:
+        if not is_permanent_error(e):
+            raise
+        if len(rows) == 1:
+            return [(rows[0], str(e.orig))]
+    middle = len(rows) // 2
+    return await store_isolating(session_factory, rows[:middle]) + await store_isolating(session_factory, rows[middle:])
+
+
+async def dead_letter(redis_client, rejected: list, source: str):
+    '''Keep rows the database rejected on DEAD_LETTER_KEY (capped) for inspection and replay'''
+    if not rejected:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for row, error in rejected:
+        pipe.xadd(DEAD_LETTER_KEY, {"r": orjson.dumps(latest_payload(row)), "source": source, "error": error},
+                  maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+    await pipe.execute()
+
+
+async def cache_latest(redis_client, rows: List[dict]) -> dict:
+    '''Update sensor:{id}:latest for every sensor in rows, record the sensors as known, fold
+    the rows into the running stats, evaluate the alert rules on them and publish them for
+    push subscribers, all in one pipelined round trip
+
+    Every row is serialized once; returns sensor_id -> the JSON bytes of its newest
+    row so callers can reuse them in the response. Back-dated rows (client
+    timestamps older than LATEST_TTL) are stored but neither cached nor pushed;
+    they go out on BACKFILL_CHANNEL for the API replicas' hot tiers instead.
+    '''
+    start = time.perf_counter()
+    encoded = [orjson.dumps(latest_payload(row)) for row in rows]
+    metrics.observe_since(_payload_encoding, start)
+    latest = {}
+    for row, payload in zip(rows, encoded):
+        current = latest.get(row["sensor_id"])
+        if current is None or row["timestamp"] >= current[0]["timestamp"]:
+            latest[row["sensor_id"]] = (row, payload)
+
+    if not latest:
+        return {}
+
+    fresh_after = datetime.utcnow() - timedelta(seconds=LATEST_TTL)
+    pipe = redis_client.pipeline(transaction=False)
+    for sensor_id, (row, payload) in latest.items():
+        if row["timestamp"] >= fresh_after:
+            pipe.setex(f"sensor:{sensor_id}:latest", LATEST_TTL, payload)
+    pipe.sadd(KNOWN_SENSORS_KEY, *latest)
+    running_stats.record(pipe, rows)
+    alerts.record(pipe, rows)
+    fresh = [payload for row, payload in zip(rows, encoded) if row["timestamp"] >= fresh_after]
+    if fresh:
+        pipe.publish(READINGS_CHANNEL, b"[" + b",".join(fresh) + b"]")
+    if len(fresh) < len(rows):
+        stale = [payload for row, payload in zip(rows, encoded) if row["timestamp"] < fresh_after]
+        pipe.publish(BACKFILL_CHANNEL, b"[" + b",".join(stale) + b"]")
+    await pipe.execute()
+    return {sensor_id: payload for sensor_id, (_, payload) in latest.items()}
+
+
+async def fetch_latest(redis_client, sensor_ids: List[str]) -> dict:
+    '''sensor_id -> cached latest payload, or None when its key has expired; one MGET'''
+    if not sensor_ids:
+        return {}
+    values = await redis_client.mget([f"sensor:{sensor_id}:latest" for sensor_id in sensor_ids])
+    return {sensor_id: orjson.loads(value) if value else None for sensor_id, value in zip(sensor_ids, values)}
+
+
+async def enqueue_stream(redis_client, rows: List[dict]):
+    '''XADD every row to the ingest stream in one pipelined round trip'''
+    if not rows:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for row in rows:
+        pipe.xadd(STREAM_KEY, {"r": orjson.dumps(latest_payload(row))})
+    await pipe.execute()
+
+
+def decode_stream_entry(fields: dict) -> dict:
+    '''Stream entry fields -> insert row; raises ValueError when malformed'''
+    try:
+        data = orjson.loads(fields["r"])
+        timestamp = schema.check_timestamp(datetime.fromisoformat(data["timestamp"]))
+        return reading_row(data["sensor_id"], float(data["co2_ppm"]), float(data["temperature"]),
+                           float(data["humidity"]), timestamp)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed stream entry: {e!r}")
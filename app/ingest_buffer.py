@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+
+from .ingest import store_isolating
+
+logger = logging.getLogger("app.ingest_buffer")
+
+
+class WriteBehindBuffer:
+    '''Bounded in-process queue drained into sensor_readings by a background flusher task
+
+    Rows are flushed when batch_size rows are waiting or flush_interval seconds
+    have passed, whichever comes first. submit() never blocks: when the queue is
+    full it returns False so the caller can push back on the client.
+
+    Connection-class database errors are retried; rows the database rejects
+    outright (see ingest.store_isolating) are dropped and counted instead, so one
+    bad row cannot wedge the flusher.
+    '''
+
+    def __init__(self, session_factory, max_size=10000, batch_size=500, flush_interval=1.0,
+                 retry_delay=1.0, after_flush=None, store=None):
+        self.session_factory = session_factory
+        # Optional async callable(batch) that takes the place of the database insert,
+        # e.g. ingest.enqueue_stream with INGEST_MODE=stream; failures are retried
+        self.store = store
+        # Optional async callable(batch) run once a batch is committed, e.g. ingest.cache_latest
+        self.after_flush = after_flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._stopping = asyncio.Event()
+        self._task = None
+        # The batch the flusher task is writing, if any
+        self._in_flight = None
+
+        # Counters reported by stats()
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, row: dict) -> bool:
+        '''Enqueue one row; returns False when the buffer is full'''
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def put(self, row: dict):
+        '''Enqueue one row, waiting for room instead of rejecting (for stream sources)'''
+        await self._queue.put(row)
+        self.enqueued += 1
+
+    def submit_many(self, rows: list) -> bool:
+        '''Enqueue all rows or none of them; returns False when they do not fit'''
+        if self._queue.maxsize and self._queue.maxsize - self._queue.qsize() < len(rows):
+            self.rejected += len(rows)
+            return False
+        for row in rows:
+            self._queue.put_nowait(row)
+        self.enqueued += len(rows)
+        return True
+
+    async def stop(self, timeout=10.0):
+        '''Stop the flusher and write out everything still queued'''
+        self._stopping.set()
+        if self._task is not None:
+            done, _ = await asyncio.wait({self._task}, timeout=timeout)
+            if not done:
+                # Cancelling interrupts the flusher's insert, so its batch is lost (or at best unconfirmed)
+                if self._in_flight:
+                    self.dropped_rows += len(self._in_flight)
+                    logger.error("write-behind flusher timed out on shutdown, dropping its in-flight batch",
+                                 extra={"fields": {"timeout": timeout, "rows": len(self._in_flight)}})
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Anything left (flusher not started or timed out) is flushed inline
+        while True:
+            batch = await self._drain(self.batch_size, wait=0)
+            if not batch:
+                break
+            if not await self._flush(batch):
+                self.dropped_rows += len(batch)
+                logger.error("write-behind buffer dropped rows on shutdown", extra={"fields": {"rows": len(batch)}})
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "flushed_rows": self.flushed_rows,
+            "flush_count": self.flush_count,
+            "failed_flushes": self.failed_flushes,
+            "dropped_rows": self.dropped_rows,
+            "last_flush_seconds": self.last_flush_seconds,
+            "avg_flush_seconds": self._total_flush_seconds / self.flush_count if self.flush_count else 0.0,
+            "max_flush_seconds": self.max_flush_seconds,
+        }
+
+    async def _drain(self, limit, wait):
+        '''Collect up to limit rows, waiting at most `wait` seconds for the batch to fill'''
+        batch = []
+        deadline = time.monotonic() + wait
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+        return batch
+
+    async def _flush(self, batch) -> bool:
+        start = time.perf_counter()
+        try:
+            if self.store is not None:
+                await self.store(batch)
+                rejected = []
+            else:
+                rejected = await store_isolating(self.session_factory, batch)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.warning("write-behind flush failed", extra={"fields": {"rows": len(batch), "error": str(e)}})
+            return False
+        if batch is self._in_flight:
+            # Committed: cancelling the flusher from here on loses nothing
+            self._in_flight = None
+        if rejected:
+            self.dropped_rows += len(rejected)
+            logger.error("write-behind flush dropped rows the database rejected",
+                         extra={"fields": {"rows": len(rejected), "error": rejected[0][1]}})
+            dropped = {id(row) for row, _ in rejected}
+            batch = [row for row in batch if id(row) not in dropped]
+
+        elapsed = time.perf_counter() - start
+        self.flushed_rows += len(batch)
+        self.flush_count += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self._total_flush_seconds += elapsed
+
+        if self.after_flush is not None:
+            try:
+                await self.after_flush(batch)
+            except Exception as e:
+                logger.warning("write-behind post-flush hook failed",
+                               extra={"fields": {"rows": len(batch), "error": str(e)}})
+        return True
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            batch = await self._drain(self.batch_size, wait=self.flush_interval)
+            if not batch:
+                continue
+            self._in_flight = batch
+            # Keep retrying a failed batch; the queue filling up meanwhile is our backpressure
+            while not await self._flush(batch):
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.retry_delay)
+                except asyncio.TimeoutError:
+                    continue
+                # Stopping: hand the batch back so stop() makes a final attempt
+                self._in_flight = None
+                self._requeue(batch)
+                return
+
+    def _requeue(self, batch):
+        for row in batch:
+            try:
+                self._queue.put_nowait(row)
+            except asyncio.QueueFull:
+                self.dropped_rows += 1
@@ -0,0 +1,172 @@
+"""
+InfluxDB-style line protocol listener for high-rate sensors (UDP and/or TCP).
+
+One reading per line:
+
+    co2,sensor=S1 ppm=412.3,temp=21.2,hum=44 1704067200000000000
+
+- The measurement name is not interpreted.
+- The sensor tag may also be spelled sensor_id.
+- Fields may use the short names (ppm/co2, temp, hum) or the JSON names
+  (co2_ppm, temperature, humidity).
+- The optional timestamp is in nanoseconds since the epoch (UTC); lines without
+  one are stamped on arrival. Timestamps outside ingest.check_timestamp's
+  bounds (schema.check_timestamp) are parse errors.
+- Escaped spaces and commas are not supported.
+
+Parsed rows go through a WriteBehindBuffer whose flushes end in
+ingest.cache_latest, i.e. the same storage and Redis path as POST /readings:
+with INGEST_MODE=stream the buffer XADDs its batches to the ingest stream
+instead of inserting them, and the stream writers store them.
+UDP datagrams that find the buffer full are dropped and counted; TCP
+connections instead stop being read until there is room.
+"""
+
+import asyncio
+import math
+from datetime import datetime, timedelta
+
+from .schema import check_timestamp
+
+EPOCH = datetime(1970, 1, 1)
+
+FIELD_ALIASES = {
+    "ppm": "co2_ppm",
+    "co2": "co2_ppm",
+    "co2_ppm": "co2_ppm",
+    "temp": "temperature",
+    "temperature": "temperature",
+    "hum": "humidity",
+    "humidity": "humidity",
+}
+REQUIRED_FIELDS = ("co2_ppm", "temperature", "humidity")
+
+
+def parse_line(line: str, received_at: datetime) -> dict:
+    '''One line -> insert row (see ingest.reading_row); raises ValueError when malformed'''
+    parts = line.split(" ")
+    if len(parts) not in (2, 3):
+        raise ValueError("Expected 'measurement,tags fields [timestamp]'")
+
+    sensor_id = None
+    for tag in parts[0].split(",")[1:]:
+        key, _, value = tag.partition("=")
+        if key in ("sensor", "sensor_id"):
+            sensor_id = value
+    if not sensor_id:
+        raise ValueError("Missing sensor tag")
+
+    row = {"sensor_id": sensor_id}
+    for field in parts[1].split(","):
+        key, _, value = field.partition("=")
+        name = FIELD_ALIASES.get(key)
+        if name is None:
+            continue
+        # Integer fields carry an i (or u) suffix
+        value = float(value.rstrip("iu"))
+        if not math.isfinite(value):
+            raise ValueError(f"Field {key} must be a finite number")
+        row[name] = value
+    missing = [name for name in REQUIRED_FIELDS if name not in row]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+
+    if len(parts) == 3 and parts[2]:
+        try:
+            row["timestamp"] = EPOCH + timedelta(microseconds=int(parts[2]) // 1000)
+        except OverflowError:
+            raise ValueError("Timestamp out of range") from None
+        check_timestamp(row["timestamp"], received_at)
+    else:
+        row["timestamp"] = received_at
+    return row
+
+
+class LineProtocolServer:
+    def __init__(self, buffer, host="0.0.0.0", udp_port=None, tcp_port=None):
+        self.buffer = buffer
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self._transport = None
+        self._server = None
+
+        # Counters reported by stats()
+        self.lines = 0
+        self.parse_errors = 0
+        self.dropped = 0
+        self.connections = 0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self.udp_port:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(self.host, self.udp_port)
+            )
+        if self.tcp_port:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, self.tcp_port)
+
+    async def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def stats(self) -> dict:
+        return {
+            "udp_port": self.udp_port,
+            "tcp_port": self.tcp_port,
+            "lines": self.lines,
+            "parse_errors": self.parse_errors,
+            "dropped": self.dropped,
+            "open_connections": self.connections,
+            "buffer": self.buffer.stats(),
+        }
+
+    def parse(self, line: bytes, received_at: datetime):
+        '''Parsed row, or None (counted) for blank and malformed lines'''
+        line = line.strip()
+        if not line or line.startswith(b"#"):
+            return None
+        self.lines += 1
+        try:
+            return parse_line(line.decode(), received_at)
+        except ValueError:
+            self.parse_errors += 1
+            return None
+
+    def datagram_received(self, data: bytes):
+        received_at = datetime.utcnow()
+        for line in data.splitlines():
+            row = self.parse(line, received_at)
+            if row is not None and not self.buffer.submit(row):
+                self.dropped += 1
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not line:
+                    break
+                row = self.parse(line, datetime.utcnow())
+                if row is not None:
+                    # Waiting here stops reading the socket: TCP backpressure instead of drops
+                    await self.buffer.put(row)
+        finally:
+            self.connections -= 1
+            writer.close()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: LineProtocolServer):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.datagram_received(data)
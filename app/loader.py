@@ -0,0 +1,312 @@
+"""
+Bulk loader for historical readings (CSV, NDJSON or Parquet files).
+
+Columns / keys: sensor_id, timestamp, co2_ppm, temperature, humidity.
+timestamp may be ISO 8601 (offsets are converted to UTC) or epoch seconds;
+sensor_id may be omitted when --sensor-id is given.
+
+On PostgreSQL every chunk is COPY'd into a temporary staging table and
+inserted with one INSERT ... SELECT that skips (sensor_id, timestamp) pairs
+already stored, so re-running an import is safe. Other databases use a
+plain bulk insert with the same dedupe. Rollups for the loaded days are
+rebuilt at the end.
+
+Usage:
+    python -m app.loader device-042.csv
+    python -m app.loader archive/*.parquet --chunk-size 100000
+    python -m app.loader offline-dump.ndjson.gz --sensor-id SENSOR_042 --no-rollups
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import orjson
+from sqlalchemy import insert, select, tuple_
+
+from . import rollups, schema
+from .database import SensorReading
+from .ingest import reading_row
+
+FORMATS = ("csv", "ndjson", "parquet")
+STAGING_TABLE = "sensor_readings_staging"
+COLUMNS = ("sensor_id", "co2_ppm", "temperature", "humidity", "timestamp")
+
+
+def detect_format(path: Path) -> str:
+    suffixes = [s.lower() for s in path.suffixes if s.lower() != ".gz"]
+    suffix = suffixes[-1] if suffixes else ""
+    if suffix in (".ndjson", ".jsonl", ".json"):
+        return "ndjson"
+    if suffix in (".parquet", ".pq"):
+        return "parquet"
+    if suffix == ".csv":
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {path}; pass --format")
+
+
+def open_text(path: Path):
+    return gzip.open(path, "rt", newline="") if path.suffix == ".gz" else open(path, newline="")
+
+
+def read_csv(path: Path, chunk_size: int):
+    with open_text(path) as f:
+        yield from csv.DictReader(f)
+
+
+def read_ndjson(path: Path, chunk_size: int):
+    with open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                yield ValueError(f"Invalid JSON line: {e}")
+
+
+def read_parquet(path: Path, chunk_size: int):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        yield from batch.to_pylist()
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson, "parquet": read_parquet}
+
+
+def parse_timestamp(value) -> datetime:
+    '''ISO 8601 string, datetime or epoch seconds -> naive UTC datetime'''
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    elif isinstance(value, str) and value:
+        try:
+            return datetime.utcfromtimestamp(float(value))
+        except ValueError:
+            pass
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    else:
+        raise ValueError("Missing timestamp")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def to_row(record, default_sensor_id=None) -> dict:
+    '''One decoded record -> insert row; raises ValueError when a field is missing or invalid'''
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("Record is not an object")
+    sensor_id = record.get("sensor_id") or default_sensor_id
+    if not sensor_id:
+        raise ValueError("Missing sensor_id")
+    try:
+        return reading_row(
+            str(sensor_id),
+            float(record["co2_ppm"]),
+            float(record["temperature"]),
+            float(record["humidity"]),
+            parse_timestamp(record.get("timestamp")),
+        )
+    except KeyError as e:
+        raise ValueError(f"Missing field {e.args[0]}")
+    except TypeError as e:
+        raise ValueError(str(e))
+
+
+def dedupe(rows: list) -> list:
+    '''Keep the last row per (sensor_id, timestamp) within a chunk'''
+    return list({(row["sensor_id"], row["timestamp"]): row for row in rows}.values())
+
+
+def copy_chunk(raw_connection, rows: list) -> int:
+    '''COPY rows into the staging table and insert the new ones; returns rows inserted'''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows((row["sensor_id"], row["co2_ppm"], row["temperature"], row["humidity"],
+                      row["timestamp"].isoformat()) for row in rows)
+    buffer.seek(0)
+
+    cursor = raw_connection.cursor()
+    try:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+            "(sensor_id text, co2_ppm double precision, temperature double precision, "
+            'humidity double precision, "timestamp" timestamp) ON COMMIT DELETE ROWS'
+        )
+        cursor.copy_expert(
+            f'COPY {STAGING_TABLE} (sensor_id, co2_ppm, temperature, humidity, "timestamp") '
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        # The (sensor_id, timestamp) index turns NOT EXISTS into one index probe per row
+        cursor.execute(
+            f'INSERT INTO {schema.TABLE} (sensor_id, co2_ppm, temperature, humidity, "timestamp") '
+            f'SELECT s.sensor_id, s.co2_ppm, s.temperature, s.humidity, s."timestamp" FROM {STAGING_TABLE} s '
+            f"WHERE NOT EXISTS (SELECT 1 FROM {schema.TABLE} r "
+            'WHERE r.sensor_id = s.sensor_id AND r."timestamp" = s."timestamp")'
+        )
+        inserted = cursor.rowcount
+        raw_connection.commit()
+    except Exception:
+        raw_connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return inserted
+
+
+def insert_chunk(engine, rows: list) -> int:
+    '''Portable fallback: look up existing keys for the chunk, bulk insert the rest'''
+    keys = [(row["sensor_id"], row["timestamp"]) for row in rows]
+    with engine.begin() as conn:
+        existing = set()
+        for start in range(0, len(keys), 500):
+            existing.update(conn.execute(
+                select(SensorReading.sensor_id, SensorReading.timestamp)
+                .where(tuple_(SensorReading.sensor_id, SensorReading.timestamp).in_(keys[start:start + 500]))
+            ).tuples())
+        new_rows = [row for row, key in zip(rows, keys) if key not in existing]
+        if new_rows:
+            conn.execute(insert(SensorReading), new_rows)
+    return len(new_rows)
+
+
+class Loader:
+    '''Streams files into sensor_readings chunk by chunk and keeps the totals'''
+
+    def __init__(self, engine, chunk_size=50000, default_sensor_id=None, progress=None):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.default_sensor_id = default_sensor_id
+        self.progress = progress
+        self.postgres = schema.is_postgres(engine)
+        self.partition_interval = None
+        if self.postgres:
+            with engine.connect() as conn:
+                if schema.is_partitioned(conn):
+                    self.partition_interval = schema.PARTITION_INTERVAL or "day"
+        self._raw = None
+
+        self.read = 0
+        self.invalid = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.earliest = None
+        self.latest = None
+        # sensor_id -> [earliest, latest] of its loaded rows, so rollups are rebuilt per sensor
+        self.sensor_ranges = {}
+        self.started = time.perf_counter()
+
+    def load_file(self, path: Path, fmt: str = None):
+        fmt = fmt or detect_format(path)
+        chunk = []
+        for number, record in enumerate(READERS[fmt](path, self.chunk_size), start=1):
+            self.read += 1
+            try:
+                chunk.append(to_row(record, self.default_sensor_id))
+            except ValueError as e:
+                self.invalid += 1
+                if self.invalid <= 10:
+                    print(f"{path}:{number}: skipped ({e})", file=sys.stderr)
+            if len(chunk) >= self.chunk_size:
+                self.load_chunk(chunk)
+                self.report(path)
+                chunk = []
+        if chunk:
+            self.load_chunk(chunk)
+        self.report(path)
+
+    def load_chunk(self, rows: list):
+        unique = dedupe(rows)
+        self.duplicates += len(rows) - len(unique)
+        earliest = min(row["timestamp"] for row in unique)
+        latest = max(row["timestamp"] for row in unique)
+        self.earliest = min(self.earliest or earliest, earliest)
+        self.latest = max(self.latest or latest, latest)
+        for row in unique:
+            span = self.sensor_ranges.get(row["sensor_id"])
+            if span is None:
+                self.sensor_ranges[row["sensor_id"]] = [row["timestamp"], row["timestamp"]]
+            elif row["timestamp"] < span[0]:
+                span[0] = row["timestamp"]
+            elif row["timestamp"] > span[1]:
+                span[1] = row["timestamp"]
+
+        if self.partition_interval:
+            schema.ensure_partitions(self.engine, self.partition_interval, earliest, latest)
+
+        if self.postgres:
+            if self._raw is None:
+                self._raw = self.engine.raw_connection()
+            inserted = copy_chunk(self._raw, unique)
+        else:
+            inserted = insert_chunk(self.engine, unique)
+        self.inserted += inserted
+        self.duplicates += len(unique) - inserted
+
+    def report(self, path: Path):
+        if self.progress is None:
+            return
+        elapsed = time.perf_counter() - self.started
+        self.progress(
+            f"{path.name}: {self.read:,} read, {self.inserted:,} inserted, {self.duplicates:,} duplicates, "
+            f"{self.invalid:,} invalid ({self.read / elapsed if elapsed else 0:,.0f} rows/s)"
+        )
+
+    def rebuild_rollups(self, archive=None) -> int:
+        '''Rebuild the rollups of the loaded sensors over the days loaded for each, one transaction per sensor
+
+        Days already in the archive keep their rollups (see rollups.rebuild_rollups).
+        '''
+        if not rollups.ROLLUPS_ENABLED:
+            return 0
+        return sum(
+            rollups.rebuild_rollups(self.engine, sensor_id=sensor_id, since=earliest, until=latest, archive=archive)
+            for sensor_id, (earliest, latest) in self.sensor_ranges.items()
+        )
+
+    def close(self):
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+
+
+def main():
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--sensor-id", help="for files without a sensor_id column")
+    parser.add_argument("--no-rollups", action="store_true", help="skip rebuilding rollups for the loaded days")
+    args = parser.parse_args()
+
+    loader = Loader(engine, args.chunk_size, args.sensor_id, progress=lambda line: print(line, file=sys.stderr))
+    try:
+        for path in args.files:
+            loader.load_file(path, args.format)
+    finally:
+        loader.close()
+
+    if not args.no_rollups:
+        from .archive import ARCHIVE_DIR, Archive
+
+        written = loader.rebuild_rollups(Archive(ARCHIVE_DIR) if ARCHIVE_DIR else None)
+        print(f"Rebuilt {written} rollup buckets", file=sys.stderr)
+    print(f"Loaded {loader.inserted:,} readings ({loader.duplicates:,} duplicates, {loader.invalid:,} invalid) "
+          f"in {time.perf_counter() - loader.started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Structured logging, with sampling for per-reading events.
+
+configure() gives the "app" logger one stderr handler. LOG_FORMAT=json writes
+one JSON object per line for log shippers; the default is a readable
+"event key=value ..." line. Fields passed to SampledLogger (or as
+extra={"fields": {...}}) become top-level keys.
+
+SampledLogger keeps hot paths from logging every reading: it lets through
+about `rate` of the events and tags each one with sample_rate so counts can
+be scaled back up.
+"""
+
+import logging
+import os
+import random
+
+import orjson
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Share of per-reading ingest events that are logged
+INGEST_LOG_SAMPLE_RATE = float(os.getenv("INGEST_LOG_SAMPLE_RATE", 0.01))
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, json_lines: bool = False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record) -> str:
+        fields = getattr(record, "fields", None) or {}
+        if self.json_lines:
+            entry = {
+                "ts": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "event": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return orjson.dumps(entry, default=str).decode()
+
+        line = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}"
+        line += "".join(f" {key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure(name: str = "app"):
+    logger = logging.getLogger(name)
+    if not any(isinstance(handler.formatter, StructuredFormatter) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(StructuredFormatter(json_lines=LOG_FORMAT == "json"))
+        logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    return logger
+
+
+class SampledLogger:
+    def __init__(self, name: str, rate: float = INGEST_LOG_SAMPLE_RATE):
+        self.logger = logging.getLogger(name)
+        self.rate = rate
+
+    def info(self, event: str, **fields):
+        self.log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, fields)
+
+    def log(self, level: int, event: str, fields: dict):
+        # One random() per call when not sampled; formatting only happens for logged events
+        if self.rate <= 0 or (self.rate < 1 and random.random() >= self.rate):
+            return
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, extra={"fields": {**fields, "sample_rate": self.rate}})
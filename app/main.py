@@ -1,51 +1,133 @@
-from fastapi import FastAPI, Depends, BackgroundTasks, Body
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Depends, BackgroundTasks, Body, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from pydantic import BaseModel
-import redis
-import json
+from pydantic import ValidationError
+import redis.asyncio as aioredis
+import orjson
 from typing import List, Optional
 import os
+import asyncio
 from pathlib import Path
 
-from .database import SessionLocal, SensorReading
-from .sensor_simulator import SensorSimulator
+from .database import AsyncSessionLocal, SensorReading, async_engine, engine
+from . import alerts, downsample, export, frames, logs, metrics, pools, rollups, running_stats, schema, stats
+from .sensor_simulator import FleetSimulator
+from .ingest import (KNOWN_SENSORS_KEY, SensorReadingInput, decode_reading, parse_ndjson, reading_row,
+                     store_readings, cache_latest, enqueue_stream, fetch_latest)
+from .push import ReadingBroadcaster, sse_stream
+from .ingest_buffer import WriteBehindBuffer
+from .cache import TwoTierCache
+from .hot_tier import HOT_TIER_ENABLED, HotTier
+from .archive import ARCHIVE_DIR, Archive, merge_columns
+from .line_protocol import LineProtocolServer
+from .stream_worker import stream_stats
 
-# Pydantic model for sensor reading
-class SensorReadingInput(BaseModel):
-    sensor_id: str
-    co2_ppm: float
-    temperature: float
-    humidity: float
+app = FastAPI(
+    title="IoT Sensor Data Pipeline",
+    default_response_class=metrics.InstrumentedORJSONResponse if metrics.METRICS_ENABLED else ORJSONResponse
+)
+
+logs.configure()
+# Per-reading events are sampled (INGEST_LOG_SAMPLE_RATE) instead of printed one line each
+ingest_log = logs.SampledLogger("app.ingest")
+
+# Upper bound on readings accepted by a single POST /readings/batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 10000))
 
-app = FastAPI(title="IoT Sensor Data Pipeline")
+# Points returned by /readings/history when method is given without max_points
+DEFAULT_MAX_POINTS = int(os.getenv("HISTORY_DEFAULT_MAX_POINTS", 1000))
+
+# Rows fetched per server-side cursor round trip by /readings/export
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
 
 # Serve dashboard HTML
 templates_dir = Path(__file__).parent / "templates"
 
-# Redis connection
-redis_client = redis.Redis(
-    host=os.getenv("REDIS_HOST", "localhost"),
-    port=int(os.getenv("REDIS_PORT", 6379)),
-    decode_responses=True
+# Redis connection - one shared, bounded asyncio connection pool for all handlers and background
+# tasks (REDIS_MAX_CONNECTIONS etc., see app/pools.py)
+redis_pool = pools.create_redis_pool()
+redis_client = (metrics.InstrumentedRedis if metrics.METRICS_ENABLED else aioredis.Redis)(connection_pool=redis_pool)
+
+# /stats results: in-process LRU in front of Redis, single-flight misses, stale-while-revalidate
+stats_cache = TwoTierCache(
+    redis_client,
+    ttl=float(os.getenv("STATS_CACHE_TTL", 60)),
+    stale_ttl=float(os.getenv("STATS_CACHE_STALE_TTL", 30)),
+    local_ttl=float(os.getenv("STATS_LOCAL_CACHE_TTL", 5)),
+    local_max_entries=int(os.getenv("STATS_LOCAL_CACHE_SIZE", 1024))
 )
 
-# Sensor simulator
-simulator = SensorSimulator()
+# Sensor simulator: SIMULATOR_SENSORS sensors (SENSOR_001, ...) reporting every SIMULATOR_INTERVAL seconds
+SIMULATOR_INTERVAL = float(os.getenv("SIMULATOR_INTERVAL", 10))
+simulator = FleetSimulator(int(os.getenv("SIMULATOR_SENSORS", 1)))
 
-def get_db():
-    db = SessionLocal()
-    try:
+# Optional in-process copy of the last HOT_TIER_RETENTION_MINUTES of readings per sensor,
+# serving /readings/history and /stats windows inside it (see app/hot_tier.py)
+hot_tier = HotTier(AsyncSessionLocal) if HOT_TIER_ENABLED else None
+
+# Parquet cold storage that app.archive moves old readings into; history, stats and
+# export read it alongside the database (see app/archive.py)
+archive = Archive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+
+# Fans readings published on Redis out to /readings/stream clients (and the hot tier)
+broadcaster = ReadingBroadcaster(redis_client, tap=hot_tier)
+
+# Ingest mode: "sync" commits every POST /readings before responding, "buffered"
+# enqueues the row for the write-behind flusher and returns immediately, "stream"
+# XADDs it to a Redis Stream drained by separate app.stream_worker processes
+INGEST_MODE = os.getenv("INGEST_MODE", "sync")
+
+write_buffer = None
+if INGEST_MODE == "buffered":
+    write_buffer = WriteBehindBuffer(
+        AsyncSessionLocal,
+        max_size=int(os.getenv("WRITE_BUFFER_MAX_SIZE", 10000)),
+        batch_size=int(os.getenv("WRITE_BUFFER_BATCH_SIZE", 500)),
+        flush_interval=float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", 1.0))
+    )
+
+# Optional UDP/TCP line-protocol listener for high-rate sensors; its own buffer
+# batches rows into the same store_readings (or, with INGEST_MODE=stream,
+# enqueue_stream) + cache_latest path as the HTTP API
+LINE_PROTOCOL_UDP_PORT = int(os.getenv("LINE_PROTOCOL_UDP_PORT", 0))
+LINE_PROTOCOL_TCP_PORT = int(os.getenv("LINE_PROTOCOL_TCP_PORT", 0))
+
+line_server = None
+if LINE_PROTOCOL_UDP_PORT or LINE_PROTOCOL_TCP_PORT:
+    line_server = LineProtocolServer(
+        WriteBehindBuffer(
+            AsyncSessionLocal,
+            max_size=int(os.getenv("WRITE_BUFFER_MAX_SIZE", 10000)),
+            batch_size=int(os.getenv("WRITE_BUFFER_BATCH_SIZE", 500)),
+            flush_interval=float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", 1.0)),
+            after_flush=lambda batch: cache_latest(redis_client, batch),
+            store=(lambda batch: enqueue_stream(redis_client, batch)) if INGEST_MODE == "stream" else None
+        ),
+        host=os.getenv("LINE_PROTOCOL_HOST", "0.0.0.0"),
+        udp_port=LINE_PROTOCOL_UDP_PORT,
+        tcp_port=LINE_PROTOCOL_TCP_PORT
+    )
+
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(async_engine)
+    metrics.REGISTRY.register(metrics.ComponentCollector(stats_cache, write_buffer, line_server, hot_tier,
+                                                         alerts.rule_engine))
+    metrics.REGISTRY.register(metrics.PoolCollector({"async": async_engine, "sync": engine}, redis_pool))
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 @app.get("/", response_class=HTMLResponse)
 def read_root():
     '''Serve the dashboard GUI with no-cache headers'''
-    from fastapi.responses import Response
     dashboard_path = templates_dir / "dashboard.html"
     if dashboard_path.exists():
         content = dashboard_path.read_text()
@@ -61,70 +143,324 @@ def read_root():
     return {"status": "IoT Sensor Pipeline Active", "version": "1.0.0"}
 
 @app.get("/health")
-def health_check():
+async def health_check():
     '''API health check endpoint'''
     return {"status": "IoT Sensor Pipeline Active", "version": "1.0.0"}
 
-@app.post("/readings")
-def create_reading(
-    reading: SensorReadingInput,
-    db: Session = Depends(get_db)
-):
-    '''Receive sensor reading from ESP32 or other sensors and store in DB + Redis'''
-
-    # Build reading data from POST body
-    reading_data = {
-        "sensor_id": reading.sensor_id,
-        "co2_ppm": reading.co2_ppm,
-        "temperature": reading.temperature,
-        "humidity": reading.humidity,
-        "timestamp": datetime.utcnow().isoformat()
+async def persist_rows(db: AsyncSession, rows: list, source: str) -> dict:
+    '''Store rows (or enqueue them in buffered/stream mode), then update Redis; returns cache_latest's payloads'''
+    if INGEST_MODE == "stream":
+        # Durable hand-off to the stream writers; no database work in the API
+        await enqueue_stream(redis_client, rows)
+    elif write_buffer is not None:
+        # Write-behind: enqueue for the background flusher, reject when it is saturated
+        if not write_buffer.submit_many(rows):
+            raise HTTPException(
+                status_code=503,
+                detail="Ingest buffer full, retry later",
+                headers={"Retry-After": "1"}
+            )
+    else:
+        # Store in PostgreSQL (raw rows + rollups)
+        await store_readings(db, rows)
+
+    metrics.READINGS_INGESTED.labels(source).inc(len(rows))
+    # Cache latest reading in Redis and notify push subscribers
+    return await cache_latest(redis_client, rows)
+
+@app.post("/readings", openapi_extra={"requestBody": {
+    "required": True,
+    "content": {
+        "application/json": {"schema": SensorReadingInput.model_json_schema()},
+        frames.FRAME_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+        "application/msgpack": {"schema": {"type": "string", "format": "binary"}},
     }
+}})
+async def create_reading(request: Request, db: AsyncSession = Depends(get_db)):
+    '''Receive sensor reading from ESP32 or other sensors and store in DB + Redis
+
+    Well-formed bodies are decoded with orjson without building a Pydantic model;
+    anything else goes through SensorReadingInput for the same coercion and 422s.
+    Binary bodies (application/x-sensor-frame, application/msgpack) may carry many
+    readings, see app/frames.py.
+    '''
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == frames.FRAME_CONTENT_TYPE or content_type in frames.MSGPACK_CONTENT_TYPES:
+        return await create_readings_binary(content_type, body, db)
+
+    reading = decode_reading(body)
+    if reading is not None:
+        row = reading_row(*reading, datetime.utcnow())
+    else:
+        try:
+            model = SensorReadingInput.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError([
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False, include_context=False)
+            ])
+        row = model.to_row(datetime.utcnow())
+
+    sensor_id = row["sensor_id"]
+    encoded = await persist_rows(db, [row], "single")
 
-    # Store in PostgreSQL
-    db_reading = SensorReading(
-        sensor_id=reading.sensor_id,
-        co2_ppm=reading.co2_ppm,
-        temperature=reading.temperature,
-        humidity=reading.humidity
+    ingest_log.info("reading received", sensor_id=sensor_id, co2_ppm=row["co2_ppm"],
+                    temperature=row["temperature"], humidity=row["humidity"])
+
+    # The response embeds the exact bytes cached in Redis instead of encoding the reading again
+    return Response(
+        content=b'{"status":"success","reading":' + encoded[sensor_id] + b"}",
+        media_type="application/json"
     )
-    db.add(db_reading)
-    db.commit()
-    db.refresh(db_reading)
-
-    # Cache latest reading in Redis
-    redis_client.setex(
-        f"sensor:{reading.sensor_id}:latest",
-        300,  # 5 min TTL
-        json.dumps(reading_data)
+
+async def create_readings_binary(content_type: str, body: bytes, db: AsyncSession):
+    '''Fixed-layout frame or MessagePack body: one or many readings, stored all-or-nothing'''
+    received_at = datetime.utcnow()
+    if content_type == frames.FRAME_CONTENT_TYPE:
+        try:
+            rows = frames.decode_frame(body, received_at)
+            # Record ages only reach into the past
+            schema.check_timestamp(min(row["timestamp"] for row in rows), received_at)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        try:
+            items = frames.decode_msgpack(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        rows = []
+        for index, item in enumerate(items):
+            try:
+                reading = SensorReadingInput.model_validate(item)
+            except ValidationError as e:
+                raise RequestValidationError([
+                    {**error, "loc": ("body", index, *error["loc"])}
+                    for error in e.errors(include_url=False, include_context=False)
+                ])
+            rows.append(reading.to_row(received_at))
+
+    if len(rows) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Body exceeds {MAX_BATCH_SIZE} readings")
+    if rows:
+        await persist_rows(db, rows, "frame" if content_type == frames.FRAME_CONTENT_TYPE else "msgpack")
+
+    ingest_log.info("binary readings received", content_type=content_type, count=len(rows))
+    return {"status": "success", "accepted": len(rows), "sensor_ids": sorted({row["sensor_id"] for row in rows})}
+
+@app.post("/readings/batch")
+async def create_readings_batch(request: Request, db: AsyncSession = Depends(get_db)):
+    '''Receive many readings (JSON array or NDJSON) and store them with one bulk insert'''
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        items = parse_ndjson(body)
+    else:
+        try:
+            items = orjson.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of readings")
+
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} readings")
+
+    now = datetime.utcnow()
+    rows = []
+    results = []
+    for index, item in enumerate(items):
+        if isinstance(item, Exception):
+            results.append({"index": index, "status": "error", "errors": [{"msg": str(item)}]})
+            continue
+        try:
+            reading = SensorReadingInput.model_validate(item)
+        except ValidationError as e:
+            results.append({
+                "index": index,
+                "status": "error",
+                "errors": e.errors(include_url=False, include_context=False, include_input=False)
+            })
+            continue
+        rows.append(reading.to_row(now))
+        results.append({"index": index, "status": "success", "sensor_id": reading.sensor_id})
+
+    # One transaction (or one hand-off in buffered/stream mode) and one Redis round trip for the whole batch
+    if rows:
+        await persist_rows(db, rows, "batch")
+
+    accepted = len(rows)
+    rejected = len(items) - accepted
+    ingest_log.info("batch received", count=len(items), accepted=accepted, rejected=rejected)
+
+    return {
+        "status": "success" if rejected == 0 else ("partial" if accepted else "error"),
+        "accepted": accepted,
+        "rejected": rejected,
+        "results": results
+    }
+
+@app.get("/ingest/stats")
+async def get_ingest_stats():
+    '''Write-behind queue depth and flush latency, plus line-protocol listener counters'''
+    result = {"mode": INGEST_MODE}
+    if write_buffer is not None:
+        result["buffer"] = write_buffer.stats()
+    if INGEST_MODE == "stream":
+        result["stream"] = await stream_stats(redis_client)
+    if line_server is not None:
+        result["line_protocol"] = line_server.stats()
+    return result
+
+@app.get("/readings/stream")
+async def stream_readings(request: Request, sensor_ids: Optional[str] = None, min_interval: float = 1.0):
+    '''Server-Sent Events feed of new readings, optionally filtered by comma-separated sensor_ids
+
+    A client receives at most one batch per min_interval seconds; readings it could
+    not keep up with are coalesced to the newest one per sensor.
+    '''
+    if min_interval < 0:
+        raise HTTPException(status_code=400, detail="min_interval must not be negative")
+    sensors = {s.strip() for s in sensor_ids.split(",") if s.strip()} if sensor_ids else None
+    return StreamingResponse(
+        sse_stream(broadcaster, request, sensors, min_interval),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    print(f"✅ Received from {reading.sensor_id}: CO2={reading.co2_ppm:.1f} ppm, Temp={reading.temperature:.1f}C, Humidity={reading.humidity:.1f}%")
+@app.get("/readings/latest")
+async def get_latest_readings(sensor_ids: Optional[str] = None):
+    '''Latest reading of many sensors in one Redis MGET
 
-    return {"status": "success", "reading": reading_data}
+    sensor_ids: comma-separated; omitted means every sensor that has reported.
+    Sensors whose cached value has expired come back as null and are listed in "expired".
+    '''
+    if sensor_ids:
+        sensors = list(dict.fromkeys(s.strip() for s in sensor_ids.split(",") if s.strip()))
+    else:
+        sensors = sorted(await redis_client.smembers(KNOWN_SENSORS_KEY))
+
+    latest = await fetch_latest(redis_client, sensors)
+    return {
+        "source": "cache",
+        "count": len(latest),
+        "expired": [sensor_id for sensor_id, data in latest.items() if data is None],
+        "data": latest
+    }
 
 @app.get("/readings/latest/{sensor_id}")
-def get_latest_reading(sensor_id: str):
+async def get_latest_reading(sensor_id: str):
     '''Get latest reading from Redis cache'''
-    cached = redis_client.get(f"sensor:{sensor_id}:latest")
+    cached = await redis_client.get(f"sensor:{sensor_id}:latest")
     
     if cached:
-        return {"source": "cache", "data": json.loads(cached)}
+        return {"source": "cache", "data": orjson.loads(cached)}
     
     return {"source": "cache", "data": None}
 
+history_rows = metrics.DB_ROWS.labels("history")
+
 @app.get("/readings/history/{sensor_id}")
-def get_reading_history(sensor_id: str, hours: int = 24, db: Session = Depends(get_db)):
-    '''Get historical readings from database'''
+async def get_reading_history(
+    sensor_id: str,
+    hours: int = 24,
+    max_points: Optional[int] = None,
+    method: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    '''Get historical readings from database
+
+    With max_points, windows holding more raw readings than that are served from the
+    finest rollup (1m / 1h / 1d) whose bucket count fits. With method=lttb|minmax|avg
+    the raw readings are downsampled on the server to at most max_points instead.
+    Raw readings of windows inside the hot tier are read from memory; days moved to
+    the archive are read from there and merged in.
+    '''
     cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-    
-    readings = db.query(SensorReading).filter(
-        SensorReading.sensor_id == sensor_id,
-        SensorReading.timestamp >= cutoff_time
-    ).order_by(SensorReading.timestamp.desc()).all()
-    
+    hot = None
+    if hot_tier is not None and hot_tier.covers(sensor_id, cutoff_time):
+        hot = hot_tier.window(sensor_id, cutoff_time)
+    archived = await archive.fetch(sensor_id, cutoff_time) if archive is not None else None
+    window_filter = (SensorReading.sensor_id == sensor_id, SensorReading.timestamp >= cutoff_time)
+    columns = (SensorReading.timestamp, SensorReading.co2_ppm, SensorReading.temperature, SensorReading.humidity)
+
+    if method is not None:
+        if method not in downsample.METHODS:
+            raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(downsample.METHODS)}")
+        max_points = max_points or DEFAULT_MAX_POINTS
+        if max_points < 3:
+            raise HTTPException(status_code=400, detail="max_points must be at least 3 when downsampling")
+        if hot is not None:
+            timestamps, fields = hot
+        else:
+            result = await db.execute(select(*columns).where(*window_filter).order_by(SensorReading.timestamp.asc()))
+            rows = result.all()
+            history_rows.observe(len(rows))
+            timestamps, fields = downsample.rows_to_columns(rows)
+        if archived is not None:
+            timestamps, fields = merge_columns(archived, (timestamps, fields))
+        source_count = len(timestamps)
+        timestamps, fields = downsample.downsample_readings(timestamps, fields, max_points, method)
+        points = downsample.to_points(timestamps, fields)
+        return {
+            "sensor_id": sensor_id,
+            "resolution": "raw",
+            "method": method,
+            "source_count": source_count,
+            "count": len(points),
+            "readings": points
+        }
+
+    resolution = "raw"
+    if max_points is not None:
+        if max_points < 1:
+            raise HTTPException(status_code=400, detail="max_points must be positive")
+        if hot is not None:
+            raw_count = len(hot[0])
+        else:
+            raw_count = (await db.execute(select(func.count()).where(*window_filter))).scalar()
+        if archived is not None:
+            raw_count += len(archived[0])
+        resolution = rollups.choose_resolution(timedelta(hours=hours), max_points, raw_count)
+
+    if resolution != "raw":
+        result = await db.execute(rollups.rollup_query(sensor_id, resolution, cutoff_time))
+        # Windows of more days than max_points: merge the daily buckets further
+        points = rollups.merge_points([rollups.rollup_point(r) for r in result.scalars()], max_points)
+        return {
+            "sensor_id": sensor_id,
+            "resolution": resolution,
+            "count": len(points),
+            "readings": points
+        }
+
+    if hot is not None:
+        points = downsample.to_points(*merge_columns(archived, hot))
+        return {
+            "sensor_id": sensor_id,
+            "resolution": resolution,
+            "count": len(points),
+            "readings": points
+        }
+
+    # Plain column tuples: no ORM objects for what is only serialized
+    result = await db.execute(select(*columns).where(*window_filter).order_by(SensorReading.timestamp.desc()))
+    readings = result.all()
+    history_rows.observe(len(readings))
+
+    if archived is not None:
+        points = downsample.to_points(*merge_columns(archived, downsample.rows_to_columns(readings[::-1])))
+        return {
+            "sensor_id": sensor_id,
+            "resolution": resolution,
+            "count": len(points),
+            "readings": points
+        }
+
     return {
         "sensor_id": sensor_id,
+        "resolution": resolution,
         "count": len(readings),
         "readings": [
             {
@@ -137,39 +473,113 @@ def get_reading_history(sensor_id: str, hours: int = 24, db: Session = Depends(g
         ]
     }
 
+@app.get("/readings/export/{sensor_id}")
+async def export_readings(
+    sensor_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: str = "ndjson"
+):
+    '''Stream readings in [start, end) as NDJSON, CSV or Arrow IPC with constant memory'''
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    start, end = export.naive_utc(start), export.naive_utc(end)
+    if start is not None and end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    encoder = export.ENCODERS[format]()
+    filename = f"{sensor_id}.{'arrows' if format == 'arrow' else format}"
+    return StreamingResponse(
+        export.stream_export(AsyncSessionLocal, encoder, sensor_id, start, end, EXPORT_CHUNK_SIZE, archive),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.get("/stats/{sensor_id}")
-def get_statistics(sensor_id: str, db: Session = Depends(get_db)):
-    '''Calculate statistics from recent readings'''
-    
-    # Check cache first
-    cache_key = f"sensor:{sensor_id}:stats"
-    cached_stats = redis_client.get(cache_key)
-    
-    if cached_stats:
-        return {"source": "cache", "stats": json.loads(cached_stats)}
-    
-    # Calculate from database
-    cutoff_time = datetime.utcnow() - timedelta(hours=1)
-    readings = db.query(SensorReading).filter(
-        SensorReading.sensor_id == sensor_id,
-        SensorReading.timestamp >= cutoff_time
-    ).all()
-    
-    if not readings:
+async def get_statistics(
+    sensor_id: str,
+    window_minutes: int = stats.DEFAULT_WINDOW_MINUTES,
+    fields: str = stats.DEFAULT_FIELDS,
+    metric_names: str = Query(stats.DEFAULT_METRICS, alias="metrics")
+):
+    '''Statistics over a recent window
+
+    Windows inside the hot tier are computed from memory. Otherwise windows up to
+    RUNNING_STATS_MAX_WINDOW_MINUTES asking only for avg/min/max/count are read from
+    the running per-minute buckets in Redis; anything else is one SQL aggregate
+    query behind the two-tier cache.
+
+    fields: comma-separated co2, temp, humidity
+    metrics: comma-separated avg, min, max, count, stddev, p50/p95/p99 (stddev and percentiles need PostgreSQL)
+    '''
+    try:
+        stats.validate_window(window_minutes)
+        parsed_fields = stats.parse_fields(fields)
+        parsed_metrics = stats.parse_metrics(metric_names, async_engine.dialect.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    since = datetime.utcnow() - timedelta(minutes=window_minutes)
+    if hot_tier is not None and hot_tier.covers(sensor_id, since):
+        result = hot_tier.compute_stats(sensor_id, since, parsed_fields, parsed_metrics)
+        if result is None:
+            return {"message": "No recent data"}
+        result["window_minutes"] = window_minutes
+        return {"source": "memory", "stats": result}
+
+    if running_stats.supports(window_minutes, parsed_metrics):
+        result = await running_stats.read_stats(redis_client, sensor_id, window_minutes, parsed_fields, parsed_metrics)
+        if result is None:
+            return {"message": "No recent data"}
+        return {"source": "running", "stats": result}
+
+    # The computation may outlive this request (shared by concurrent misses or
+    # refreshing a stale entry), so it opens its own session
+    async def compute():
+        async with AsyncSessionLocal() as db:
+            return await stats.compute_stats(db, sensor_id, window_minutes, parsed_fields, parsed_metrics, archive)
+
+    cache_key = stats.cache_key(sensor_id, window_minutes, parsed_fields, parsed_metrics)
+    result, source = await stats_cache.get_or_compute(cache_key, compute)
+
+    if result is None:
         return {"message": "No recent data"}
-    
-    stats = {
-        "avg_co2": sum(r.co2_ppm for r in readings) / len(readings),
-        "max_co2": max(r.co2_ppm for r in readings),
-        "min_co2": min(r.co2_ppm for r in readings),
-        "avg_temp": sum(r.temperature for r in readings) / len(readings),
-        "sample_count": len(readings)
-    }
-    
-    # Cache for 1 minute
-    redis_client.setex(cache_key, 60, json.dumps(stats))
-    
-    return {"source": "database", "stats": stats}
+
+    return {"source": "database" if source == "computed" else "cache", "stats": result}
+
+@app.get("/alerts")
+async def get_alerts(sensor_id: Optional[str] = None, severity: Optional[str] = None):
+    '''Alerts currently firing, newest first (rules evaluated on ingest, see app/alerts.py)'''
+    active = [orjson.loads(value) for value in await redis_client.hvals(alerts.ALERTS_ACTIVE_KEY)]
+    if sensor_id:
+        active = [alert for alert in active if alert["sensor_id"] == sensor_id]
+    if severity:
+        active = [alert for alert in active if alert["severity"] == severity]
+    active.sort(key=lambda alert: alert["timestamp"], reverse=True)
+    return {"count": len(active), "alerts": active}
+
+@app.get("/alerts/rules")
+async def get_alert_rules():
+    '''The rules this process evaluates and its engine counters'''
+    if alerts.rule_engine is None:
+        raise HTTPException(status_code=404, detail="Alerting is disabled (ALERTS_ENABLED=0)")
+    # Reflect a rule file edited since the last ingested batch
+    alerts.rule_engine.maybe_reload()
+    return {"rules": alerts.rule_engine.rules, "engine": alerts.rule_engine.stats()}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    '''Prometheus text exposition of the request, database, Redis, cache and ingest metrics'''
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    '''Hit/miss counters and lookup latency per tier of the /stats cache, plus the hot tier's occupancy'''
+    result = {"stats": stats_cache.stats()}
+    if hot_tier is not None:
+        result["hot_tier"] = hot_tier.stats()
+    return result
 
 @app.on_event("startup")
 async def startup_event():
@@ -177,37 +587,77 @@ async def startup_event():
     print("🚀 IoT Sensor API Started - Ready to receive ESP32 data!")
     print("📡 Listening for POST requests at /readings")
     print("🔍 Check dashboard at http://localhost:8000")
-    print("⚠️  Simulator enabled - generating test data every 10s")
+    print(f"⚠️  Simulator enabled - {len(simulator)} sensor(s) generating test data every {SIMULATOR_INTERVAL:g}s")
+
+    broadcaster.start()
+
+    if alerts.rule_engine is not None:
+        try:
+            restored = await alerts.restore(redis_client)
+            if restored:
+                print(f"🚨 Restored {restored} active alert(s)")
+        except Exception as e:
+            print(f"Restoring active alerts failed: {e}")
+
+    if hot_tier is not None:
+        hot_tier.start()
+        print(f"🔥 Hot tier enabled - last {hot_tier.retention} per sensor, up to {hot_tier.max_bytes >> 20} MiB")
+
+    if write_buffer is not None:
+        write_buffer.start()
+        print(f"🗃️  Write-behind ingest enabled (capacity {write_buffer.stats()['capacity']})")
 
-    # Simulator enabled - generating test data
-    import asyncio
+    if line_server is not None:
+        line_server.buffer.start()
+        await line_server.start()
+        print(f"📶 Line protocol listening on udp:{LINE_PROTOCOL_UDP_PORT or '-'} tcp:{LINE_PROTOCOL_TCP_PORT or '-'}")
+
+    if schema.PARTITION_INTERVAL and schema.is_postgres(engine):
+        async def maintain_partitions():
+            while True:
+                try:
+                    dropped = await asyncio.to_thread(schema.maintain_partitions, engine)
+                    if dropped:
+                        print(f"🧹 Retention dropped partitions: {', '.join(dropped)}")
+                except Exception as e:
+                    print(f"Partition maintenance error: {e}")
+                await asyncio.sleep(3600)
+
+        app.state.partition_task = asyncio.create_task(maintain_partitions())
+
+    # Simulator enabled - generating test data without blocking the event loop
     async def generate_readings():
         while True:
             try:
-                db = SessionLocal()
-                reading_data = simulator.get_reading()
-
-                db_reading = SensorReading(
-                    sensor_id=reading_data["sensor_id"],
-                    co2_ppm=reading_data["co2_ppm"],
-                    temperature=reading_data["temperature"],
-                    humidity=reading_data["humidity"]
-                )
-                db.add(db_reading)
-                db.commit()
-                db.close()
-
-                redis_client.setex(
-                    f"sensor:{reading_data['sensor_id']}:latest",
-                    300,
-                    json.dumps(reading_data)
-                )
+                rows = simulator.rows()
+                # The same path as the HTTP endpoints: stream, write-behind or direct insert
+                async with AsyncSessionLocal() as db:
+                    await persist_rows(db, rows, "simulator")
+                ingest_log.info("readings simulated", count=len(rows), sensor_id=rows[0]["sensor_id"],
+                                co2_ppm=rows[0]["co2_ppm"])
 
-                print(f"Generated reading: CO2={reading_data['co2_ppm']:.1f} ppm")
+            except Exception:
+                ingest_log.logger.exception("simulator tick failed")
 
-            except Exception as e:
-                print(f"Error: {e}")
+            await asyncio.sleep(SIMULATOR_INTERVAL)
 
-            await asyncio.sleep(10)
+    app.state.simulator_task = asyncio.create_task(generate_readings())
 
-    asyncio.create_task(generate_readings())
+@app.on_event("shutdown")
+async def shutdown_event():
+    '''Flush any readings still waiting in the write-behind buffer and release connections'''
+    # partition_task only exists when partition maintenance is enabled
+    tasks = [task for task in (app.state.simulator_task, getattr(app.state, "partition_task", None)) if task]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await broadcaster.stop()
+    if hot_tier is not None:
+        await hot_tier.stop()
+    if write_buffer is not None:
+        await write_buffer.stop()
+    if line_server is not None:
+        await line_server.stop()
+        await line_server.buffer.stop()
+    await redis_pool.disconnect()
+    await async_engine.dispose()
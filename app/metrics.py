@@ -0,0 +1,306 @@
+"""
+Prometheus metrics for the API, served on GET /metrics.
+
+- MetricsMiddleware: latency per endpoint, measured up to the response headers
+  so /readings/stream only counts its setup
+- instrument_engine(): SQLAlchemy cursor events timing every statement by verb
+  and recording rows written by DML
+- InstrumentedRedis: redis.asyncio client timing every command (a pipeline is
+  one observation)
+- InstrumentedORJSONResponse: JSON encoding time of responses
+- ComponentCollector: scrape-time counters and gauges read from the components'
+  own stats() (/stats cache tiers, write-behind buffer, line protocol, hot
+  tier, alert rules), so those cost nothing per request
+- PoolCollector: scrape-time occupancy of the database and Redis pools; their
+  checkout wait times are recorded by the pool classes in app.pools
+
+Labels are bounded sets (endpoint function name, SQL verb, Redis command), and
+label children are resolved once and reused. METRICS_ENABLED=0 leaves the hooks
+out entirely.
+"""
+
+import os
+import time
+
+import redis.asyncio as aioredis
+from fastapi.responses import ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Sub-millisecond Redis calls up to multi-second history responses
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to response headers per endpoint",
+    ("method", "endpoint", "status"), buckets=BUCKETS
+)
+DB_DURATION = Histogram(
+    "db_operation_duration_seconds", "SQL statement latency by verb, plus session commits",
+    ("operation",), buckets=BUCKETS
+)
+DB_ROWS = Histogram(
+    "db_query_rows", "Rows written per DML statement / returned per read query",
+    ("query",), buckets=ROW_BUCKETS
+)
+REDIS_DURATION = Histogram(
+    "redis_command_duration_seconds", "Redis command latency (a pipeline counts once)",
+    ("command",), buckets=BUCKETS
+)
+SERIALIZE_DURATION = Histogram(
+    "serialization_duration_seconds", "JSON encoding on the hot paths",
+    ("stage",), buckets=BUCKETS
+)
+DB_POOL_CHECKOUT = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the SQLAlchemy pool",
+    ("engine",), buckets=BUCKETS
+)
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts", "Checkouts that gave up after DB_POOL_TIMEOUT", ("engine",))
+REDIS_POOL_CHECKOUT = Histogram(
+    "redis_pool_checkout_seconds", "Time to get a connection from the Redis pool", buckets=BUCKETS
+)
+REDIS_POOL_TIMEOUTS = Counter("redis_pool_timeouts", "Redis commands that gave up after REDIS_POOL_TIMEOUT")
+READINGS_INGESTED = Counter("readings_ingested", "Readings accepted by the API", ("source",))
+READINGS_STORED = Counter("readings_stored", "Readings inserted into the database")
+ALERT_EVALUATION = Histogram(
+    "alert_evaluation_seconds", "Alert rule evaluation per ingest batch", buckets=BUCKETS
+)
+ALERT_EVENTS = Counter("alert_events", "Alert transitions", ("severity", "state"))
+
+DB_COMMIT = DB_DURATION.labels("commit")
+SQL_VERBS = ("select", "insert", "update", "delete")
+_db_children = {verb: DB_DURATION.labels(verb) for verb in (*SQL_VERBS, "other")}
+_dml_rows = {verb: DB_ROWS.labels(verb) for verb in SQL_VERBS[1:]}
+_redis_children = {}
+_http_children = {}
+
+
+def observe_since(child, start: float):
+    child.observe(time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    '''Pure ASGI middleware (no per-request task or body buffering)'''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        responded = False
+
+        async def send_timed(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                self.observe(scope, message["status"], start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception:
+            if not responded:
+                self.observe(scope, 500, start)
+            raise
+
+    @staticmethod
+    def observe(scope, status: int, start: float):
+        # The router stores the matched endpoint in the scope; unmatched paths share one label
+        endpoint = scope.get("endpoint")
+        key = (scope["method"], endpoint.__name__ if endpoint is not None else "unmatched", status)
+        child = _http_children.get(key)
+        if child is None:
+            child = _http_children[key] = HTTP_DURATION.labels(*key)
+        observe_since(child, start)
+
+
+def instrument_engine(engine):
+    '''Time every statement on engine (sync or async) and record rows written by DML'''
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["metrics_started"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("metrics_started", None)
+        if started is None:
+            return
+        verb = statement.lstrip()[:6].lower()
+        observe_since(_db_children.get(verb, _db_children["other"]), started)
+        rows = _dml_rows.get(verb)
+        if rows is not None and cursor.rowcount >= 0:
+            rows.observe(cursor.rowcount)
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            observe_since(_redis_child("PIPELINE"), start)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    '''redis.asyncio.Redis recording redis_command_duration_seconds per command'''
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            observe_since(_redis_child(args[0]), start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def _redis_child(command):
+    child = _redis_children.get(command)
+    if child is None:
+        child = _redis_children[command] = REDIS_DURATION.labels(str(command).upper())
+    return child
+
+
+_response_encoding = SERIALIZE_DURATION.labels("response")
+
+
+class InstrumentedORJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        start = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            observe_since(_response_encoding, start)
+
+
+class ComponentCollector:
+    '''Exports the counters components already keep, read at scrape time'''
+
+    def __init__(self, stats_cache=None, write_buffer=None, line_server=None, hot_tier=None, alert_engine=None):
+        self.stats_cache = stats_cache
+        self.write_buffer = write_buffer
+        self.line_server = line_server
+        self.hot_tier = hot_tier
+        self.alert_engine = alert_engine
+
+    def collect(self):
+        if self.stats_cache is not None:
+            stats = self.stats_cache.stats()
+            lookups = CounterMetricFamily(
+                "stats_cache_lookups", "/stats cache (sensor:*:stats keys) lookups per tier", labels=("tier", "result")
+            )
+            for tier in ("local", "redis"):
+                lookups.add_metric((tier, "hit"), stats[tier]["hits"])
+                lookups.add_metric((tier, "miss"), stats[tier]["misses"])
+            yield lookups
+            yield CounterMetricFamily("stats_cache_computations", "/stats results computed from the database",
+                                      value=stats["compute"]["computations"])
+            yield CounterMetricFamily("stats_cache_stale_served", "/stats results served stale while refreshing",
+                                      value=stats["compute"]["stale_served"])
+            yield GaugeMetricFamily("stats_cache_local_entries", "Entries in the in-process /stats tier",
+                                    value=stats["local"]["entries"])
+
+        if self.write_buffer is not None:
+            yield from buffer_metrics("write_buffer", self.write_buffer.stats())
+
+        if self.line_server is not None:
+            stats = self.line_server.stats()
+            for name, help_text in (("lines", "Line-protocol lines received"),
+                                    ("parse_errors", "Malformed line-protocol lines"),
+                                    ("dropped", "Line-protocol readings dropped because the buffer was full")):
+                yield CounterMetricFamily(f"line_protocol_{name}", help_text, value=stats[name])
+            yield GaugeMetricFamily("line_protocol_open_connections", "Open line-protocol TCP connections",
+                                    value=stats["open_connections"])
+            yield from buffer_metrics("line_protocol_buffer", stats["buffer"])
+
+        if self.hot_tier is not None:
+            stats = self.hot_tier.stats()
+            lookups = CounterMetricFamily("hot_tier_lookups", "History / stats windows checked against the hot tier",
+                                          labels=("result",))
+            lookups.add_metric(("hit",), stats["hits"])
+            lookups.add_metric(("miss",), stats["misses"])
+            yield lookups
+            yield GaugeMetricFamily("hot_tier_ready", "1 once the hot tier has been loaded from the database",
+                                    value=int(stats["ready"]))
+            for name, help_text in (("sensors", "Sensors held in the hot tier"),
+                                    ("readings", "Readings held in the hot tier"),
+                                    ("bytes", "Memory allocated by the hot tier's arrays"),
+                                    ("max_bytes", "HOT_TIER_MEMORY_MB")):
+                yield GaugeMetricFamily(f"hot_tier_{name}", help_text, value=stats[name])
+            yield CounterMetricFamily("hot_tier_evicted_sensors", "Sensors dropped to stay within the memory budget",
+                                      value=stats["evicted_sensors"])
+            yield CounterMetricFamily("hot_tier_dropped_readings", "Readings dropped by eviction or the per-sensor cap",
+                                      value=stats["dropped_readings"])
+
+        if self.alert_engine is not None:
+            stats = self.alert_engine.stats()
+            yield GaugeMetricFamily("alert_rules", "Alert rules loaded", value=stats["rules"])
+            yield GaugeMetricFamily("alert_active", "Alerts firing as seen by this process", value=stats["active"])
+            yield GaugeMetricFamily("alert_state_bytes", "Memory of the alert engine's state arrays",
+                                    value=stats["bytes"])
+            yield CounterMetricFamily("alert_evaluated_readings", "Readings evaluated against the alert rules",
+                                      value=stats["evaluated_readings"])
+            yield CounterMetricFamily("alert_rule_reloads", "Rule file reloads", value=stats["reloads"])
+            yield CounterMetricFamily("alert_rule_reload_errors", "Rule file changes rejected or unreadable",
+                                      value=stats["reload_errors"])
+
+
+def buffer_metrics(prefix: str, stats: dict):
+    yield GaugeMetricFamily(f"{prefix}_queue_depth", "Rows waiting to be flushed", value=stats["queue_depth"])
+    yield GaugeMetricFamily(f"{prefix}_capacity", "Queue capacity", value=stats["capacity"])
+    yield CounterMetricFamily(f"{prefix}_flushed_rows", "Rows flushed to the database", value=stats["flushed_rows"])
+    yield CounterMetricFamily(f"{prefix}_rejected", "Rows rejected because the queue was full",
+                              value=stats["rejected"])
+    yield CounterMetricFamily(f"{prefix}_failed_flushes", "Flushes that raised", value=stats["failed_flushes"])
+
+
+class PoolCollector:
+    '''Occupancy of the SQLAlchemy pools ({label: engine}) and the Redis connection pool'''
+
+    def __init__(self, engines: dict, redis_pool=None):
+        self.engines = engines
+        self.redis_pool = redis_pool
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections in use", labels=("engine",))
+        idle = GaugeMetricFamily("db_pool_idle", "Open connections waiting in the pool", labels=("engine",))
+        capacity = GaugeMetricFamily("db_pool_capacity", "pool_size + max_overflow", labels=("engine",))
+        saturation = GaugeMetricFamily("db_pool_saturation", "Connections in use / capacity", labels=("engine",))
+        for label, engine in self.engines.items():
+            pool = getattr(engine, "sync_engine", engine).pool
+            # NullPool / SingletonThreadPool (SQLite) have no bounded queue to report
+            if not hasattr(pool, "checkedout"):
+                continue
+            limit = pool.size() + max(pool._max_overflow, 0)
+            in_use = pool.checkedout()
+            checked_out.add_metric((label,), in_use)
+            idle.add_metric((label,), pool.checkedin())
+            capacity.add_metric((label,), limit)
+            saturation.add_metric((label,), in_use / limit if limit else 0.0)
+        yield from (checked_out, idle, capacity, saturation)
+
+        if self.redis_pool is not None:
+            in_use = len(self.redis_pool._in_use_connections)
+            limit = self.redis_pool.max_connections
+            yield GaugeMetricFamily("redis_pool_in_use", "Redis connections in use", value=in_use)
+            yield GaugeMetricFamily("redis_pool_idle", "Open Redis connections waiting in the pool",
+                                    value=len(self.redis_pool._available_connections))
+            yield GaugeMetricFamily("redis_pool_max_connections", "REDIS_MAX_CONNECTIONS", value=limit)
+            yield GaugeMetricFamily("redis_pool_saturation", "Redis connections in use / max_connections",
+                                    value=in_use / limit if limit else 0.0)
+
+
+def render() -> tuple:
+    '''(body, content type) of the current registry in the Prometheus text format'''
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,286 @@
+"""
+MQTT ingest worker: subscribes to sensors/{sensor_id}/reading and writes readings in batches.
+
+Payloads are JSON objects with the POST /readings fields; sensor_id comes from
+the topic (a sensor_id in the payload must match it). Messages are received
+with QoS 1 and acknowledged only after their batch is committed, so a crash
+means redelivery rather than loss (delivery is at-least-once). Invalid
+payloads are acknowledged right away and counted, so they are not redelivered
+forever; so are readings the database rejects outright (a value out of range, a
+timestamp with no partition), after being copied to the dead-letter stream
+(ingest.DEAD_LETTER_KEY).
+
+Run as many workers as needed: they join one shared subscription
+($share/MQTT_SHARE_GROUP/...), so the broker spreads messages across them.
+Each needs its own MQTT_CLIENT_ID that stays the same across restarts (e.g.
+the StatefulSet pod name): the broker keeps the worker's session, with the
+messages it has not acknowledged, under that id.
+
+Usage:
+    python -m app.mqtt_worker
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import signal
+import time
+from datetime import datetime
+
+import orjson
+
+from . import alerts, logs
+from .ingest import SensorReadingInput, cache_latest, dead_letter, store_isolating
+
+TOPIC = "sensors/+/reading"
+
+logger = logging.getLogger("app.mqtt_worker")
+# Invalid messages are counted; only a sample of them is logged
+invalid_log = logs.SampledLogger("app.mqtt_worker")
+
+
+def topic_sensor_id(topic: str) -> str:
+    parts = topic.split("/")
+    if len(parts) != 3 or parts[0] != "sensors" or parts[2] != "reading" or not parts[1]:
+        raise ValueError(f"Unexpected topic {topic!r}")
+    return parts[1]
+
+
+def decode_message(topic: str, payload: bytes, received_at: datetime) -> dict:
+    '''One MQTT message -> insert row; raises ValueError (incl. pydantic's) when invalid'''
+    sensor_id = topic_sensor_id(topic)
+    data = orjson.loads(payload)
+    if not isinstance(data, dict):
+        raise ValueError("Payload must be a JSON object")
+    if data.get("sensor_id", sensor_id) != sensor_id:
+        raise ValueError("Payload sensor_id does not match the topic")
+    reading = SensorReadingInput.model_validate({**data, "sensor_id": sensor_id})
+    return reading.to_row(received_at)
+
+
+class MQTTIngestWorker:
+    '''Bridges a paho-mqtt client (network thread) to batched async writes
+
+    The broker stops sending once `batch_size` messages are unacknowledged
+    (MQTT 5 Receive Maximum), which bounds memory and gives backpressure while
+    the database is slow or down. MQTT 3.1.1 has no such limit: at most
+    `queue_size` messages wait, then the network thread blocks and TCP pushes
+    back on the broker.
+    '''
+
+    def __init__(self, session_factory, redis_client, client_id, host="localhost", port=1883, topic=TOPIC,
+                 share_group="ingest", protocol="5", batch_size=500, queue_size=10000,
+                 flush_interval=1.0, retry_delay=1.0):
+        if not client_id:
+            raise ValueError("client_id is required and must stay the same across restarts")
+        self.session_factory = session_factory
+        self.redis_client = redis_client
+        self.host = host
+        self.port = port
+        self.subscription = f"$share/{share_group}/{topic}" if share_group else topic
+        self.client_id = client_id
+        self.protocol = protocol
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._queue = asyncio.Queue(maxsize=max(queue_size, batch_size))
+        self._stopping = asyncio.Event()
+        self._client = None
+        self.connected = asyncio.Event()
+
+        # Counters reported by stats()
+        self.received = 0
+        self.invalid = 0
+        self.stored = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "invalid": self.invalid,
+            "stored": self.stored,
+            "failed_flushes": self.failed_flushes,
+            "dead_lettered": self.dead_lettered,
+            "pending": self._queue.qsize(),
+        }
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        import paho.mqtt.client as mqtt
+
+        loop = asyncio.get_running_loop()
+
+        def on_connect(client, userdata, flags, reason_code, properties):
+            if reason_code.is_failure:
+                logger.error("MQTT connect failed", extra={"fields": {"reason": str(reason_code)}})
+                return
+            client.subscribe(self.subscription, qos=1)
+            loop.call_soon_threadsafe(self.connected.set)
+
+        def on_message(client, userdata, message):
+            # Runs on paho's network thread: waiting here for room stops it reading from the broker
+            future = asyncio.run_coroutine_threadsafe(self._queue.put(message), loop)
+            while not self._stopping.is_set():
+                try:
+                    return future.result(timeout=0.5)
+                except concurrent.futures.TimeoutError:
+                    continue
+            # Stopping: left unacknowledged, so the broker redelivers it
+            future.cancel()
+
+        if self.protocol == "5":
+            from paho.mqtt.packettypes import PacketTypes
+            from paho.mqtt.properties import Properties
+
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id,
+                                 protocol=mqtt.MQTTv5, manual_ack=True)
+            properties = Properties(PacketTypes.CONNECT)
+            properties.ReceiveMaximum = min(self.batch_size, 65535)
+            # Keep the session (subscription + unacknowledged messages) across restarts
+            properties.SessionExpiryInterval = 3600
+            connect_args = {"clean_start": False, "properties": properties}
+        else:
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id,
+                                 protocol=mqtt.MQTTv311, clean_session=False, manual_ack=True)
+            connect_args = {}
+
+        client.on_connect = on_connect
+        client.on_message = on_message
+        client.connect_async(self.host, self.port, **connect_args)
+        client.loop_start()
+        self._client = client
+        try:
+            await self._consume()
+        finally:
+            # Also releases a network thread waiting in on_message, so loop_stop() can join it
+            self._stopping.set()
+            client.disconnect()
+            client.loop_stop()
+
+    async def _consume(self):
+        while not self._stopping.is_set():
+            messages = await self._drain()
+            if messages:
+                await self._flush(messages)
+
+    async def _drain(self) -> list:
+        '''Up to batch_size messages, waiting at most flush_interval for the batch to fill'''
+        messages = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(messages) < self.batch_size and not self._stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                messages.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return messages
+
+    async def _flush(self, messages: list):
+        received_at = datetime.utcnow()
+        rows, valid = [], []
+        for message in messages:
+            self.received += 1
+            try:
+                rows.append(decode_message(message.topic, message.payload, received_at))
+                valid.append(message)
+            except ValueError as e:
+                self.invalid += 1
+                invalid_log.warning("rejected MQTT message", topic=message.topic, error=str(e))
+                self._client.ack(message.mid, message.qos)
+
+        # Retry connection-class errors until committed; when stopping instead, the
+        # valid messages stay unacknowledged and the broker redelivers them
+        stored, rejected = not rows, []
+        while not stored:
+            try:
+                rejected = await store_isolating(self.session_factory, rows)
+                stored = True
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.warning("MQTT batch failed", extra={"fields": {"rows": len(rows), "error": str(e)}})
+                if self._stopping.is_set():
+                    break
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.retry_delay)
+                except asyncio.TimeoutError:
+                    pass
+        if not stored:
+            return
+
+        if rejected:
+            # Retrying cannot help these: keep a copy and acknowledge them with the rest
+            self.dead_lettered += len(rejected)
+            logger.error("dead-lettering MQTT readings the database rejected",
+                         extra={"fields": {"rows": len(rejected), "error": rejected[0][1]}})
+            try:
+                await dead_letter(self.redis_client, rejected, "mqtt")
+            except Exception as e:
+                logger.error("dead-lettering MQTT readings failed",
+                             extra={"fields": {"rows": len(rejected), "error": str(e)}})
+            dropped = {id(row) for row, _ in rejected}
+            rows = [row for row in rows if id(row) not in dropped]
+
+        for message in valid:
+            self._client.ack(message.mid, message.qos)
+        self.stored += len(rows)
+
+        if rows:
+            try:
+                await cache_latest(self.redis_client, rows)
+            except Exception as e:
+                logger.warning("Redis update for MQTT readings failed",
+                               extra={"fields": {"rows": len(rows), "error": str(e)}})
+
+
+def main():
+    import redis.asyncio as aioredis
+
+    from .database import AsyncSessionLocal, async_engine
+
+    logs.configure()
+    redis_client = aioredis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        decode_responses=True
+    )
+    client_id = os.getenv("MQTT_CLIENT_ID")
+    if not client_id:
+        raise SystemExit("MQTT_CLIENT_ID is required: a stable id per worker, e.g. the StatefulSet pod name")
+    worker = MQTTIngestWorker(
+        AsyncSessionLocal,
+        redis_client,
+        client_id,
+        host=os.getenv("MQTT_HOST", "localhost"),
+        port=int(os.getenv("MQTT_PORT", 1883)),
+        topic=os.getenv("MQTT_TOPIC", TOPIC),
+        share_group=os.getenv("MQTT_SHARE_GROUP", "ingest"),
+        protocol=os.getenv("MQTT_PROTOCOL", "5"),
+        batch_size=int(os.getenv("MQTT_BATCH_SIZE", 500)),
+        queue_size=int(os.getenv("MQTT_QUEUE_SIZE", 10000)),
+        flush_interval=float(os.getenv("MQTT_FLUSH_INTERVAL", 1.0))
+    )
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        print(f"📡 MQTT ingest worker subscribing to {worker.subscription} on {worker.host}:{worker.port}")
+        try:
+            await alerts.restore(redis_client)
+            await worker.run()
+        finally:
+            print(f"MQTT ingest worker stopped: {worker.stats()}")
+            await redis_client.aclose()
+            await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
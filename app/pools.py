@@ -0,0 +1,137 @@
+"""
+Connection pool settings for PostgreSQL and Redis, read from the environment.
+
+PostgreSQL (both engines; SQLite keeps SQLAlchemy's defaults):
+    DB_POOL_SIZE=5          connections kept per engine; 0 = NullPool, one connection per checkout
+    DB_MAX_OVERFLOW=10      extra connections opened under load and closed when returned
+    DB_POOL_TIMEOUT=30      seconds a checkout waits for a connection before failing
+    DB_POOL_RECYCLE=1800    replace connections older than this many seconds (-1 = never)
+    DB_POOL_PRE_PING=1      test each connection on checkout, replacing ones the server dropped
+    DB_PGBOUNCER=0          1 = behind PgBouncer in transaction pooling mode
+
+Each API replica opens at most DB_POOL_SIZE + DB_MAX_OVERFLOW connections for
+requests (the async engine), plus a few on the sync engine used for schema
+maintenance. PgBouncer in transaction mode hands each transaction a different
+server connection, so nothing may outlive a transaction. The code keeps no
+session state (no SET, advisory locks or LISTEN), but asyncpg caches prepared
+statements per connection; DB_PGBOUNCER=1 turns that cache off and gives
+every statement a unique name. Pair it with a small DB_POOL_SIZE, or 0,
+because PgBouncer does the pooling.
+
+Redis:
+    REDIS_MAX_CONNECTIONS=50        commands beyond this wait for a free connection
+    REDIS_POOL_TIMEOUT=5            seconds to wait before failing with ConnectionError
+    REDIS_SOCKET_TIMEOUT=           seconds per read/write (unset = no timeout)
+    REDIS_SOCKET_CONNECT_TIMEOUT=5
+    REDIS_HEALTH_CHECK_INTERVAL=0   >0 pings connections idle for this long before reuse
+
+Checkout wait time and timeouts of both pools are recorded in app.metrics;
+pool occupancy is exported at scrape time by metrics.PoolCollector.
+"""
+
+import asyncio
+import os
+import time
+from uuid import uuid4
+
+from redis.asyncio import BlockingConnectionPool
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from . import metrics
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT")) if os.getenv("REDIS_SOCKET_TIMEOUT") else None
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", 5))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 0))
+
+
+class _TimedCheckout:
+    '''Records how long each checkout waited (including opening a new connection)'''
+    engine_label = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.DB_POOL_TIMEOUTS.labels(self.engine_label).inc()
+            raise
+        finally:
+            metrics.observe_since(metrics.DB_POOL_CHECKOUT.labels(self.engine_label), start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    engine_label = "sync"
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    '''create_engine / create_async_engine keyword arguments for url'''
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if DB_POOL_SIZE <= 0:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    if DB_PGBOUNCER and is_async:
+        # Prepared statements live on one server connection; PgBouncer may route the next
+        # transaction elsewhere, so never cache them and never reuse a name
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return options
+
+
+class TimedBlockingConnectionPool(BlockingConnectionPool):
+    '''Bounded Redis pool: waits for a free connection instead of opening unlimited ones'''
+
+    async def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        try:
+            return await super().get_connection(command_name, *keys, **options)
+        except RedisConnectionError as e:
+            if isinstance(e.__cause__, asyncio.TimeoutError):
+                metrics.REDIS_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            metrics.observe_since(metrics.REDIS_POOL_CHECKOUT, start)
+
+
+def create_redis_pool(**overrides) -> BlockingConnectionPool:
+    options = {
+        "host": os.getenv("REDIS_HOST", "localhost"),
+        "port": int(os.getenv("REDIS_PORT", 6379)),
+        "decode_responses": True,
+        "max_connections": REDIS_MAX_CONNECTIONS,
+        "timeout": REDIS_POOL_TIMEOUT,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": REDIS_SOCKET_CONNECT_TIMEOUT,
+        "socket_keepalive": True,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    options.update(overrides)
+    return TimedBlockingConnectionPool(**options)
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+
+logger = logging.getLogger("app.push")
+
+# Every ingest path publishes a JSON array of reading payloads here (see ingest.cache_latest)
+READINGS_CHANNEL = "sensor:readings"
+# Back-dated readings (older than the latest-value TTL): not pushed to clients, only to the tap
+BACKFILL_CHANNEL = "sensor:readings:backfill"
+
+
+class Subscriber:
+    '''One push client: the newest pending reading per sensor plus a wake-up event
+
+    Readings that arrive faster than the client drains them overwrite each other
+    per sensor, so a slow client costs at most one pending reading per sensor.
+    '''
+
+    def __init__(self, sensor_ids: Optional[set]):
+        self.sensor_ids = sensor_ids
+        self.pending = {}
+        self.event = asyncio.Event()
+        self.coalesced = 0
+
+    def offer(self, reading: dict):
+        if reading["sensor_id"] in self.pending:
+            self.coalesced += 1
+        self.pending[reading["sensor_id"]] = reading
+        self.event.set()
+
+    def take(self) -> list:
+        readings = list(self.pending.values())
+        self.pending = {}
+        self.event.clear()
+        return readings
+
+
+class ReadingBroadcaster:
+    '''Fans readings published on Redis out to the push clients connected to this replica
+
+    One pub/sub subscription per process; readings published by any replica (or
+    the simulator) reach every subscriber whose sensor filter matches.
+
+    tap (e.g. app.hot_tier.HotTier) also receives every batch, back-dated ones
+    included, via tap.feed(readings), and is told when the subscription is
+    confirmed (tap.connected()) and lost (tap.disconnected()), since readings
+    published in between are never delivered.
+    '''
+
+    def __init__(self, redis_client, channel: str = READINGS_CHANNEL, reconnect_delay: float = 1.0, tap=None):
+        self.redis_client = redis_client
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.tap = tap
+        self._all = set()
+        self._by_sensor = {}
+        self._task = None
+        self.received = 0
+
+    def subscribe(self, sensor_ids: Optional[set] = None) -> Subscriber:
+        subscriber = Subscriber(sensor_ids)
+        if sensor_ids is None:
+            self._all.add(subscriber)
+        else:
+            for sensor_id in sensor_ids:
+                self._by_sensor.setdefault(sensor_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber.sensor_ids is None:
+            self._all.discard(subscriber)
+            return
+        for sensor_id in subscriber.sensor_ids:
+            subscribers = self._by_sensor.get(sensor_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_sensor[sensor_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._all) + len({s for group in self._by_sensor.values() for s in group})
+
+    def dispatch(self, readings: list):
+        self.received += len(readings)
+        for reading in readings:
+            for subscriber in self._all:
+                subscriber.offer(reading)
+            for subscriber in self._by_sensor.get(reading["sensor_id"], ()):
+                subscriber.offer(reading)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        channels = [self.channel] if self.tap is None else [self.channel, BACKFILL_CHANNEL]
+        while True:
+            pubsub = self.redis_client.pubsub()
+            confirmed = 0
+            try:
+                await pubsub.subscribe(*channels)
+                async for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        confirmed += 1
+                        if confirmed == len(channels) and self.tap is not None:
+                            self.tap.connected()
+                        continue
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        readings = json.loads(message["data"])
+                        if self.tap is not None:
+                            self.tap.feed(readings)
+                        if message["channel"] == self.channel:
+                            self.dispatch(readings)
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.warning("ignoring malformed push message", extra={"fields": {"error": str(e)}})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("push subscription lost, reconnecting", extra={"fields": {"error": str(e)}})
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                if self.tap is not None:
+                    self.tap.disconnected()
+                await pubsub.reset()
+
+
+async def sse_stream(broadcaster: ReadingBroadcaster, request, sensor_ids: Optional[set],
+                     min_interval: float, keepalive: float = 15.0):
+    '''Server-Sent Events body: at most one batch per min_interval, newest reading per sensor'''
+    subscriber = broadcaster.subscribe(sensor_ids)
+    loop = asyncio.get_running_loop()
+    try:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            try:
+                await asyncio.wait_for(subscriber.event.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            sent_at = loop.time()
+            for reading in subscriber.take():
+                yield f"event: reading\ndata: {json.dumps(reading)}\n\n"
+            # Rate limit: whatever arrives meanwhile is coalesced per sensor
+            delay = min_interval - (loop.time() - sent_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,256 @@
+"""
+Continuous rollups of sensor_readings into 1-minute / 1-hour / 1-day buckets.
+
+Rollups are upserted in the same transaction as the raw rows (see
+ingest.store_readings) and can be rebuilt from sensor_readings. Days a sensor
+has moved to the archive (app.archive) are skipped: their readings are no
+longer in sensor_readings, so their rollups are all that is left of them.
+
+Usage:
+    python -m app.rollups rebuild                                  # everything
+    python -m app.rollups rebuild --sensor SENSOR_001 --since 2024-01-01 --until 2024-02-01
+"""
+
+import argparse
+import math
+import os
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .database import SensorReading, SensorRollup
+from .downsample import bucket_bounds
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "1") == "1"
+
+# Finest first; the history endpoint walks this list looking for a fit
+RESOLUTIONS = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+FIELDS = ("co2_ppm", "temperature", "humidity")
+
+
+def truncate(moment: datetime, resolution: str) -> datetime:
+    '''Start of the bucket containing moment'''
+    if resolution == "1m":
+        return moment.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate_rows(rows: List[dict], resolutions=tuple(RESOLUTIONS)) -> List[dict]:
+    '''Collapse raw rows into one partial aggregate per (sensor, resolution, bucket)'''
+    buckets = {}
+    for row in rows:
+        for resolution in resolutions:
+            key = (row["sensor_id"], resolution, truncate(row["timestamp"], resolution))
+            agg = buckets.get(key)
+            if agg is None:
+                agg = buckets[key] = {"sensor_id": key[0], "resolution": resolution, "bucket": key[2], "count": 0}
+                for field in FIELDS:
+                    agg[f"{field}_sum"] = 0.0
+                    agg[f"{field}_min"] = row[field]
+                    agg[f"{field}_max"] = row[field]
+            agg["count"] += 1
+            for field in FIELDS:
+                value = row[field]
+                agg[f"{field}_sum"] += value
+                if value < agg[f"{field}_min"]:
+                    agg[f"{field}_min"] = value
+                if value > agg[f"{field}_max"]:
+                    agg[f"{field}_max"] = value
+    # Consistent order so concurrent upserts lock rows in the same sequence
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def upsert_statement(dialect: str):
+    '''INSERT ... ON CONFLICT that merges a partial aggregate into an existing bucket'''
+    if dialect == "postgresql":
+        stmt = postgresql.insert(SensorRollup)
+        least, greatest = func.least, func.greatest
+    else:
+        stmt = sqlite.insert(SensorRollup)
+        least, greatest = func.min, func.max
+
+    table = SensorRollup.__table__
+    excluded = stmt.excluded
+    updates = {"count": table.c.count + excluded.count}
+    for field in FIELDS:
+        updates[f"{field}_sum"] = table.c[f"{field}_sum"] + excluded[f"{field}_sum"]
+        updates[f"{field}_min"] = least(table.c[f"{field}_min"], excluded[f"{field}_min"])
+        updates[f"{field}_max"] = greatest(table.c[f"{field}_max"], excluded[f"{field}_max"])
+    return stmt.on_conflict_do_update(index_elements=["sensor_id", "resolution", "bucket"], set_=updates)
+
+
+async def update_rollups(db, rows: List[dict]):
+    '''Fold freshly ingested rows into the rollup tables (caller commits)'''
+    if not ROLLUPS_ENABLED or not rows:
+        return
+    await db.execute(upsert_statement(db.bind.dialect.name), aggregate_rows(rows))
+
+
+def choose_resolution(window: timedelta, max_points: int, raw_count: int) -> str:
+    '''Finest representation of the window that fits in max_points: "raw", "1m", "1h" or "1d"
+
+    "1d" is also the answer when even daily buckets do not fit; merge_points
+    then combines them down to max_points.
+    '''
+    if raw_count <= max_points:
+        return "raw"
+    for resolution, size in RESOLUTIONS.items():
+        # A window not aligned to the buckets touches one partial bucket at each end
+        if math.ceil(window / size) + 1 <= max_points:
+            return resolution
+    return "1d"
+
+
+def rollup_query(sensor_id: str, resolution: str, since: datetime):
+    return select(SensorRollup).where(
+        SensorRollup.sensor_id == sensor_id,
+        SensorRollup.resolution == resolution,
+        SensorRollup.bucket >= truncate(since, resolution)
+    ).order_by(SensorRollup.bucket.desc())
+
+
+def rollup_point(rollup: SensorRollup) -> dict:
+    '''History entry for one bucket: averages under the raw field names plus min/max'''
+    point = {"timestamp": rollup.bucket.isoformat(), "count": rollup.count}
+    for field in FIELDS:
+        point[field] = getattr(rollup, f"{field}_sum") / rollup.count
+        point[f"{field}_min"] = getattr(rollup, f"{field}_min")
+        point[f"{field}_max"] = getattr(rollup, f"{field}_max")
+    return point
+
+
+def merge_points(points: List[dict], max_points: int) -> List[dict]:
+    '''Combine runs of consecutive rollup_point entries into at most max_points
+
+    Each merged point is stamped with its oldest bucket and carries the
+    count-weighted averages and the overall min/max of its run.
+    '''
+    if len(points) <= max_points:
+        return points
+    edges = bucket_bounds(len(points), max_points)
+    merged = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        run = points[start:end]
+        count = sum(point["count"] for point in run)
+        # Points come newest first, so the run's last entry is its oldest bucket
+        point = {"timestamp": run[-1]["timestamp"], "count": count}
+        for field in FIELDS:
+            point[field] = sum(p[field] * p["count"] for p in run) / count
+            point[f"{field}_min"] = min(p[f"{field}_min"] for p in run)
+            point[f"{field}_max"] = max(p[f"{field}_max"] for p in run)
+        merged.append(point)
+    return merged
+
+
+def bucket_expression(dialect: str, resolution: str):
+    '''SQL expression truncating sensor_readings.timestamp to the bucket start'''
+    if dialect == "postgresql":
+        unit = {"1m": "minute", "1h": "hour", "1d": "day"}[resolution]
+        return func.date_trunc(unit, SensorReading.timestamp)
+    # SQLite stores DateTime as text; match SQLAlchemy's storage format exactly
+    pattern = {"1m": "%Y-%m-%d %H:%M:00.000000", "1h": "%Y-%m-%d %H:00:00.000000",
+               "1d": "%Y-%m-%d 00:00:00.000000"}[resolution]
+    return func.strftime(pattern, SensorReading.timestamp)
+
+
+def rebuild_rollups(engine, sensor_id: str = None, since: datetime = None, until: datetime = None,
+                    archive=None) -> int:
+    '''Recompute rollups from sensor_readings for whole days in [since, until); returns buckets written
+
+    With an archive, each sensor's archived days (up to Archive.boundary) are
+    left alone; sensors with archived days are rebuilt one at a time.
+    '''
+    since = truncate(since, "1d") if since else None
+    until = truncate(until, "1d") + timedelta(days=1) if until else None
+    if archive is None:
+        return rebuild_range(engine, sensor_id, since, until)
+
+    boundaries = {}
+    for archived in ([sensor_id] if sensor_id else archive.sensor_ids()):
+        boundary = archive.boundary(archived, None)
+        if boundary is not None:
+            boundaries[archived] = boundary
+
+    written = 0
+    if sensor_id is None or sensor_id not in boundaries:
+        written += rebuild_range(engine, sensor_id, since, until, exclude=list(boundaries))
+    for archived, boundary in boundaries.items():
+        start = max(since, boundary) if since else boundary
+        if until is None or start < until:
+            written += rebuild_range(engine, archived, start, until)
+    return written
+
+
+def rebuild_range(engine, sensor_id: str = None, since: datetime = None, until: datetime = None,
+                  exclude: List[str] = ()) -> int:
+    '''rebuild_rollups for day-aligned [since, until) in one transaction, skipping the sensors in exclude'''
+    dialect = engine.dialect.name
+
+    written = 0
+    with engine.begin() as conn:
+        for resolution in RESOLUTIONS:
+            cleanup = delete(SensorRollup).where(SensorRollup.resolution == resolution)
+            bucket = bucket_expression(dialect, resolution)
+            source = select(
+                SensorReading.sensor_id,
+                literal(resolution),
+                bucket,
+                func.count(),
+                *[agg(getattr(SensorReading, field))
+                  for field in FIELDS for agg in (func.sum, func.min, func.max)]
+            ).where(SensorReading.timestamp.is_not(None))
+
+            if sensor_id:
+                cleanup = cleanup.where(SensorRollup.sensor_id == sensor_id)
+                source = source.where(SensorReading.sensor_id == sensor_id)
+            if exclude:
+                cleanup = cleanup.where(SensorRollup.sensor_id.not_in(exclude))
+                source = source.where(SensorReading.sensor_id.not_in(exclude))
+            if since:
+                cleanup = cleanup.where(SensorRollup.bucket >= since)
+                source = source.where(SensorReading.timestamp >= since)
+            if until:
+                cleanup = cleanup.where(SensorRollup.bucket < until)
+                source = source.where(SensorReading.timestamp < until)
+
+            conn.execute(cleanup)
+            columns = ["sensor_id", "resolution", "bucket", "count"] + [
+                f"{field}_{agg}" for field in FIELDS for agg in ("sum", "min", "max")
+            ]
+            result = conn.execute(
+                SensorRollup.__table__.insert().from_select(columns, source.group_by(SensorReading.sensor_id, bucket))
+            )
+            written += max(result.rowcount, 0)
+    return written
+
+
+def main():
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild")
+    rebuild.add_argument("--sensor")
+    rebuild.add_argument("--since", type=datetime.fromisoformat)
+    rebuild.add_argument("--until", type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        from .archive import ARCHIVE_DIR, Archive
+
+        archive = Archive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+        written = rebuild_rollups(engine, args.sensor, args.since, args.until, archive)
+        print(f"Rebuilt {written} rollup buckets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Sliding-window statistics per sensor, maintained in Redis as readings arrive.
+
+Every reading is folded into per-minute buckets:
+
+    sensor:{id}:running:{minute}        hash: count, <field>_sum
+    sensor:{id}:running:{minute}:min    sorted set: field -> minimum (ZADD LT)
+    sensor:{id}:running:{minute}:max    sorted set: field -> maximum (ZADD GT)
+
+Buckets expire on their own shortly after they leave the largest window, so
+/stats reads a bounded number of small keys in one pipeline and never touches
+the database. Windows are minute-aligned: the oldest bucket may include up to
+a minute of readings from just before the window.
+
+Usage:
+    python -m app.running_stats backfill    # reload the buckets from the 1m rollups
+"""
+
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from .rollups import FIELDS, aggregate_rows
+
+RUNNING_STATS_ENABLED = os.getenv("RUNNING_STATS_ENABLED", "1") == "1"
+
+# Largest window /stats answers from the running buckets; longer ones query the database
+MAX_WINDOW_MINUTES = int(os.getenv("RUNNING_STATS_MAX_WINDOW_MINUTES", 60))
+
+# avg, min and max are derived from count/sum/min/max; stddev and percentiles are not
+METRICS = ("avg", "min", "max", "count")
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def minute_index(moment: datetime) -> int:
+    return int((moment - EPOCH) // timedelta(minutes=1))
+
+
+def bucket_key(sensor_id: str, minute: int) -> str:
+    return f"sensor:{sensor_id}:running:{minute}"
+
+
+def bucket_ttl() -> int:
+    return (MAX_WINDOW_MINUTES + 2) * 60
+
+
+def supports(window_minutes: int, metrics: list) -> bool:
+    '''Whether a /stats request can be answered from the running buckets'''
+    return (RUNNING_STATS_ENABLED and window_minutes <= MAX_WINDOW_MINUTES
+            and all(metric in METRICS for metric in metrics))
+
+
+def write_bucket(pipe, agg: dict, minute: int):
+    '''Queue the commands merging one 1m partial aggregate into its bucket'''
+    key = bucket_key(agg["sensor_id"], minute)
+    pipe.hincrby(key, "count", agg["count"])
+    for field in FIELDS:
+        pipe.hincrbyfloat(key, f"{field}_sum", agg[f"{field}_sum"])
+    pipe.zadd(f"{key}:min", {field: agg[f"{field}_min"] for field in FIELDS}, lt=True)
+    pipe.zadd(f"{key}:max", {field: agg[f"{field}_max"] for field in FIELDS}, gt=True)
+    for suffix in ("", ":min", ":max"):
+        pipe.expire(f"{key}{suffix}", bucket_ttl())
+
+
+def record(pipe, rows: List[dict], now: Optional[datetime] = None):
+    '''Queue bucket updates for rows on an existing pipeline (see ingest.cache_latest)'''
+    if not RUNNING_STATS_ENABLED or not rows:
+        return
+    oldest = minute_index(now or datetime.utcnow()) - MAX_WINDOW_MINUTES
+    for agg in aggregate_rows(rows, ("1m",)):
+        minute = minute_index(agg["bucket"])
+        # Late or back-filled readings outside every window would only recreate expired keys
+        if minute >= oldest:
+            write_bucket(pipe, agg, minute)
+
+
+async def read_stats(redis_client, sensor_id: str, window_minutes: int, fields: list, metrics: list,
+                     now: Optional[datetime] = None):
+    '''Same result shape as stats.compute_stats, from one pipelined read of the window's buckets'''
+    now = now or datetime.utcnow()
+    last = minute_index(now)
+    first = minute_index(now - timedelta(minutes=window_minutes))
+
+    pipe = redis_client.pipeline(transaction=False)
+    for minute in range(first, last + 1):
+        key = bucket_key(sensor_id, minute)
+        pipe.hgetall(key)
+        pipe.zrange(f"{key}:min", 0, -1, withscores=True)
+        pipe.zrange(f"{key}:max", 0, -1, withscores=True)
+    results = await pipe.execute()
+
+    count = 0
+    sums = dict.fromkeys(FIELDS, 0.0)
+    minimum, maximum = {}, {}
+    for i in range(0, len(results), 3):
+        totals, lows, highs = results[i:i + 3]
+        if not totals:
+            continue
+        count += int(totals["count"])
+        for field in FIELDS:
+            sums[field] += float(totals.get(f"{field}_sum", 0))
+        for field, value in lows:
+            minimum[field] = min(value, minimum.get(field, value))
+        for field, value in highs:
+            maximum[field] = max(value, maximum.get(field, value))
+
+    if not count:
+        return None
+
+    result = {"sample_count": count}
+    for prefix, column in fields:
+        field = column.key
+        values = {"avg": sums[field] / count, "min": minimum.get(field), "max": maximum.get(field), "count": count}
+        for metric in metrics:
+            result[f"{metric}_{prefix}"] = values[metric]
+    result["window_minutes"] = window_minutes
+    return result
+
+
+def backfill(engine, redis_client, now: Optional[datetime] = None) -> int:
+    '''Rebuild the running buckets from the 1m rollups (e.g. after a Redis flush); returns buckets written'''
+    from sqlalchemy import select
+
+    from .database import SensorRollup
+
+    now = now or datetime.utcnow()
+    since = now.replace(second=0, microsecond=0) - timedelta(minutes=MAX_WINDOW_MINUTES)
+    query = select(SensorRollup).where(SensorRollup.resolution == "1m", SensorRollup.bucket >= since)
+
+    written = 0
+    with engine.connect() as conn:
+        pipe = redis_client.pipeline(transaction=False)
+        for rollup in conn.execute(query):
+            agg = dict(rollup._mapping)
+            key = bucket_key(agg["sensor_id"], minute_index(agg["bucket"]))
+            # Replace rather than merge so a re-run does not double count
+            pipe.delete(key, f"{key}:min", f"{key}:max")
+            write_bucket(pipe, agg, minute_index(agg["bucket"]))
+            written += 1
+        pipe.execute()
+    return written
+
+
+def main():
+    import redis
+
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("backfill")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        redis_client = redis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            decode_responses=True
+        )
+        written = backfill(engine, redis_client)
+        print(f"Backfilled {written} running-stats buckets")
+
+
+if __name__ == "__main__":
+    main()
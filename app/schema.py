@@ -0,0 +1,256 @@
+"""
+Schema management for sensor_readings: indexes, native Postgres range
+partitioning and partition-based retention.
+
+Usage:
+    python -m app.schema migrate                       # create tables / indexes, partitions ahead
+    python -m app.schema partition --interval day      # convert an existing plain table
+    python -m app.schema retention --days 90           # drop partitions older than 90 days
+    python -m app.schema partitions                    # list partitions and their bounds
+"""
+
+import argparse
+import os
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+
+TABLE = "sensor_readings"
+COMPOSITE_INDEX = "ix_sensor_readings_sensor_id_timestamp"
+
+# "" disables partitioning, otherwise "day" or "week"
+PARTITION_INTERVAL = os.getenv("SENSOR_READINGS_PARTITION", "")
+PARTITIONS_AHEAD = int(os.getenv("SENSOR_READINGS_PARTITIONS_AHEAD", 7))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 0))  # 0 keeps everything
+# Oldest client timestamp ingest accepts, 0 for no limit (see check_timestamp). Partitions
+# are kept ready back to it, so accepted readings always have one; never beyond retention.
+MAX_READING_AGE_DAYS = int(os.getenv("MAX_READING_AGE_DAYS", RETENTION_DAYS or (30 if PARTITION_INTERVAL else 0)))
+if RETENTION_DAYS:
+    MAX_READING_AGE_DAYS = min(MAX_READING_AGE_DAYS or RETENTION_DAYS, RETENTION_DAYS)
+# Client timestamps further ahead than this (a device clock without NTP) are rejected
+MAX_CLOCK_SKEW = timedelta(seconds=int(os.getenv("MAX_CLOCK_SKEW_SECONDS", 300)))
+
+INTERVALS = ("day", "week")
+PARTITION_BOUND = re.compile(r"FROM \((?:MINVALUE|'([^']+)')\) TO \('([^']+)'\)")
+
+PARTITIONED_DDL = f"""
+CREATE TABLE {TABLE} (
+    id BIGSERIAL,
+    sensor_id VARCHAR,
+    co2_ppm DOUBLE PRECISION,
+    temperature DOUBLE PRECISION,
+    humidity DOUBLE PRECISION,
+    "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp")
+"""
+
+
+def check_timestamp(timestamp: datetime, now: datetime = None) -> datetime:
+    '''Raise ValueError for a client timestamp beyond MAX_CLOCK_SKEW in the future (it would hold
+    the sensor's latest and alert state) or older than MAX_READING_AGE_DAYS (no partition for it)'''
+    now = now or datetime.utcnow()
+    if timestamp > now + MAX_CLOCK_SKEW:
+        raise ValueError(f"timestamp is more than {MAX_CLOCK_SKEW.total_seconds():g}s in the future")
+    if MAX_READING_AGE_DAYS and timestamp < now - timedelta(days=MAX_READING_AGE_DAYS):
+        raise ValueError(f"timestamp is more than {MAX_READING_AGE_DAYS} days old")
+    return timestamp
+
+
+def is_postgres(engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def period_start(moment: datetime, interval: str) -> datetime:
+    '''Start of the day / ISO week (Monday) containing moment'''
+    start = datetime(moment.year, moment.month, moment.day)
+    if interval == "week":
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def period_step(interval: str) -> timedelta:
+    return timedelta(days=7 if interval == "week" else 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{TABLE}_p{start:%Y%m%d}"
+
+
+def is_partitioned(conn) -> bool:
+    return bool(conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t"),
+        {"t": TABLE}
+    ).scalar())
+
+
+def list_partitions(conn) -> list:
+    '''(name, start, end) of every sensor_readings partition, oldest first; start is None for MINVALUE'''
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t"
+    ), {"t": TABLE}).all()
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_BOUND.search(bound or "")
+        if not match:
+            continue
+        start, end = match.groups()
+        partitions.append((
+            name,
+            datetime.fromisoformat(start) if start else None,
+            datetime.fromisoformat(end),
+        ))
+    return sorted(partitions, key=lambda p: p[2])
+
+
+def ensure_partitions(engine, interval: str, start: datetime, end: datetime):
+    '''Create every missing partition covering [start, end]
+
+    Periods already covered by an existing partition (e.g. the legacy partition
+    from convert_to_partitioned) are skipped, since overlapping bounds are an error.
+    '''
+    step = period_step(interval)
+    current = period_start(start, interval)
+    with engine.begin() as conn:
+        existing = [(lo or datetime.min, hi) for _, lo, hi in list_partitions(conn)]
+        while current <= end:
+            if any(lo < current + step and current < hi for lo, hi in existing):
+                current += step
+                continue
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS {partition_name(current)} PARTITION OF {TABLE} '
+                f"FOR VALUES FROM ('{current.isoformat()}') TO ('{(current + step).isoformat()}')"
+            ))
+            current += step
+
+
+def ensure_upcoming_partitions(engine, interval: str = PARTITION_INTERVAL, ahead: int = PARTITIONS_AHEAD,
+                               max_age_days: int = MAX_READING_AGE_DAYS):
+    '''Keep the periods from max_age_days ago through the next `ahead` periods ready for inserts'''
+    now = datetime.utcnow()
+    ensure_partitions(engine, interval, now - timedelta(days=max_age_days), now + period_step(interval) * ahead)
+
+
+def drop_expired_partitions(engine, retention_days: int) -> list:
+    '''Drop whole partitions that end before now - retention_days; returns the dropped names'''
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    dropped = []
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return dropped
+        for name, start, end in list_partitions(conn):
+            if end <= cutoff:
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+    return dropped
+
+
+def maintain_partitions(engine, interval: str = PARTITION_INTERVAL, retention_days: int = RETENTION_DAYS) -> list:
+    '''Periodic job: create upcoming partitions and apply retention'''
+    ensure_upcoming_partitions(engine, interval)
+    if retention_days > 0:
+        return drop_expired_partitions(engine, retention_days)
+    return []
+
+
+def convert_to_partitioned(engine, interval: str):
+    '''Swap an existing plain sensor_readings table for a partitioned one.
+
+    The old table is renamed and attached as one partition covering every row
+    up to the start of the current period, so no data is copied.
+    '''
+    now = datetime.utcnow()
+    boundary = period_start(now, interval)
+    legacy = f"{TABLE}_legacy"
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return
+        max_id = conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {TABLE}")).scalar()
+        pkey = conn.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:t AS regclass) AND contype = 'p'"
+        ), {"t": TABLE}).scalar()
+
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+        if pkey:
+            conn.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT {pkey}"))
+        # Keep the existing composite index so ATTACH adopts it instead of rebuilding
+        conn.execute(text(f"ALTER INDEX IF EXISTS {COMPOSITE_INDEX} RENAME TO {legacy}_sensor_id_timestamp_idx"))
+        conn.execute(text(f'ALTER TABLE {legacy} ALTER COLUMN "timestamp" SET NOT NULL'))
+        conn.execute(text(f"ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT"))
+        conn.execute(text(PARTITIONED_DDL))
+        conn.execute(text(f'CREATE INDEX {COMPOSITE_INDEX} ON {TABLE} (sensor_id, "timestamp" DESC)'))
+        conn.execute(text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+        ))
+        conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), :v)"), {"v": max_id + 1})
+    ensure_upcoming_partitions(engine, interval)
+
+
+def migrate(engine, metadata, interval: str = PARTITION_INTERVAL):
+    '''Create tables and bring indexes / partitions up to date; safe to run on every start'''
+    if interval and interval not in INTERVALS:
+        raise ValueError(f"SENSOR_READINGS_PARTITION must be one of {INTERVALS}, got {interval!r}")
+
+    partitioned = bool(interval) and is_postgres(engine)
+    if partitioned and not inspect(engine).has_table(TABLE):
+        with engine.begin() as conn:
+            conn.execute(text(PARTITIONED_DDL))
+
+    metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        # create_all only creates indexes for new tables, so add the composite one explicitly
+        table = metadata.tables[TABLE]
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+        # The composite index's leading column covers sensor_id lookups
+        if is_postgres(engine):
+            conn.execute(text("DROP INDEX IF EXISTS ix_sensor_readings_sensor_id"))
+
+    if partitioned:
+        with engine.connect() as conn:
+            if not is_partitioned(conn):
+                print(f"⚠️  {TABLE} is not partitioned; run `python -m app.schema partition --interval {interval}`")
+                return
+        ensure_upcoming_partitions(engine, interval)
+
+
+def main():
+    from .database import Base, engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate")
+    partition = sub.add_parser("partition")
+    partition.add_argument("--interval", choices=INTERVALS, default=PARTITION_INTERVAL or "day")
+    retention = sub.add_parser("retention")
+    retention.add_argument("--days", type=int, default=RETENTION_DAYS)
+    sub.add_parser("partitions")
+    args = parser.parse_args()
+
+    if args.command != "migrate" and not is_postgres(engine):
+        parser.error("partitioning requires PostgreSQL")
+
+    if args.command == "migrate":
+        migrate(engine, Base.metadata)
+        print("Schema up to date")
+    elif args.command == "partition":
+        convert_to_partitioned(engine, args.interval)
+        print(f"{TABLE} partitioned by {args.interval}")
+    elif args.command == "retention":
+        if args.days <= 0:
+            parser.error("--days must be positive")
+        dropped = drop_expired_partitions(engine, args.days)
+        print(f"Dropped {len(dropped)} partitions: {', '.join(dropped) or '-'}")
+    elif args.command == "partitions":
+        with engine.connect() as conn:
+            for name, start, end in list_partitions(conn):
+                print(f"{name:<32}{start or 'MINVALUE'!s:<22}{end}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import random
 import time
 from datetime import datetime
 
+import numpy as np
+
 class SensorSimulator:
     '''Simulates CO2 sensor readings'''
     
@@ -22,3 +24,61 @@ class SensorSimulator:
             "humidity": 45 + random.uniform(-10, 10),
             "timestamp": datetime.utcnow().isoformat()
         }
+
+
+class FleetSimulator:
+    '''Simulates a whole fleet of sensors, one NumPy array per property
+
+    Every sensor has its own daily profile: an outdoor baseline plus an
+    occupancy bump (peak hour, width and height drawn per sensor) that raises
+    CO2 and temperature and lowers humidity. On top of that comes a slowly
+    drifting offset (a mean-reverting random walk, so consecutive readings are
+    correlated) and per-sensor noise. One tick for 100k sensors takes a few
+    milliseconds.
+    '''
+
+    def __init__(self, sensors=1000, prefix="SENSOR_", seed=None):
+        self.rng = np.random.default_rng(seed)
+        width = max(3, len(str(sensors)))
+        self.sensor_ids = [f"{prefix}{i:0{width}d}" for i in range(1, sensors + 1)]
+
+        rng = self.rng
+        self.base_co2 = rng.normal(420, 15, sensors)
+        self.peak_co2 = rng.uniform(100, 900, sensors)
+        self.peak_hour = rng.normal(14, 2, sensors)
+        self.occupied_hours = rng.uniform(6, 12, sensors)
+        self.base_temperature = rng.normal(21, 1, sensors)
+        self.base_humidity = rng.normal(45, 5, sensors)
+        self.noise = rng.uniform(5, 25, sensors)
+        self.drift = np.zeros(sensors)
+
+    def __len__(self):
+        return len(self.sensor_ids)
+
+    def occupancy(self, at: datetime) -> np.ndarray:
+        '''0..1 per sensor: how far into its busy period each sensor is at this (UTC) time'''
+        hour = at.hour + at.minute / 60 + at.second / 3600
+        # Signed distance to the peak in hours, wrapped around midnight
+        distance = (hour - self.peak_hour + 12) % 24 - 12
+        return np.exp(-0.5 * (distance / (self.occupied_hours / 4)) ** 2)
+
+    def tick(self, at: datetime = None):
+        '''One reading per sensor: (co2_ppm, temperature, humidity) arrays'''
+        at = at or datetime.utcnow()
+        n = len(self.sensor_ids)
+        occupancy = self.occupancy(at)
+        self.drift = 0.95 * self.drift + self.rng.normal(0, 4, n)
+
+        co2 = self.base_co2 + self.peak_co2 * occupancy + self.drift + self.rng.normal(0, self.noise)
+        temperature = self.base_temperature + 2.5 * occupancy + self.rng.normal(0, 0.2, n)
+        humidity = self.base_humidity - 8 * occupancy + self.rng.normal(0, 1, n)
+        return np.maximum(co2, 350), temperature, np.clip(humidity, 5, 95)
+
+    def rows(self, at: datetime = None) -> list:
+        '''One tick as insert rows (see ingest.reading_row), all stamped `at`'''
+        at = at or datetime.utcnow()
+        co2, temperature, humidity = self.tick(at)
+        return [
+            {"sensor_id": sensor_id, "co2_ppm": c, "temperature": t, "humidity": h, "timestamp": at}
+            for sensor_id, c, t, h in zip(self.sensor_ids, co2.tolist(), temperature.tolist(), humidity.tolist())
+        ]
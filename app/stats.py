@@ -0,0 +1,209 @@
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import ARRAY, Float, bindparam, func, select, union_all
+
+from .archive import merge_columns
+from .database import SensorReading
+from .downsample import FIELD_NAMES, rows_to_columns
+
+# Query-string field names -> (key prefix used in the response, column)
+FIELDS = {alias: (prefix, getattr(SensorReading, column)) for alias, (prefix, column) in FIELD_NAMES.items()}
+
+DEFAULT_WINDOW_MINUTES = 60
+MAX_WINDOW_MINUTES = 30 * 24 * 60
+DEFAULT_FIELDS = "co2,temp"
+DEFAULT_METRICS = "avg,min,max"
+
+BASIC_METRICS = {
+    "avg": func.avg,
+    "min": func.min,
+    "max": func.max,
+    "count": func.count,
+}
+PERCENTILE = re.compile(r"^p(\d{1,2})$")
+
+
+def parse_fields(value: str) -> list:
+    '''"co2,temp" -> [("co2", column), ("temp", column)], de-duplicated in order'''
+    fields = []
+    for name in filter(None, (part.strip() for part in value.split(","))):
+        if name not in FIELDS:
+            raise ValueError(f"Unknown field {name!r}, expected one of {sorted(FIELDS)}")
+        if FIELDS[name] not in fields:
+            fields.append(FIELDS[name])
+    if not fields:
+        raise ValueError("At least one field is required")
+    return fields
+
+
+def parse_metrics(value: str, dialect: str) -> list:
+    '''Validate metric names; stddev and percentiles (p50, p95, ...) need PostgreSQL'''
+    metrics = []
+    for name in filter(None, (part.strip() for part in value.split(","))):
+        if name not in BASIC_METRICS and name != "stddev" and not PERCENTILE.match(name):
+            raise ValueError(f"Unknown metric {name!r}, expected avg, min, max, count, stddev or pNN")
+        if name not in BASIC_METRICS and dialect != "postgresql":
+            raise ValueError(f"Metric {name!r} requires PostgreSQL")
+        if name not in metrics:
+            metrics.append(name)
+    if not metrics:
+        raise ValueError("At least one metric is required")
+    return metrics
+
+
+def aggregate(metric: str, column):
+    if metric in BASIC_METRICS:
+        return BASIC_METRICS[metric](column)
+    if metric == "stddev":
+        return func.stddev_samp(column)
+    quantile = int(PERCENTILE.match(metric).group(1)) / 100
+    return func.percentile_cont(quantile).within_group(column)
+
+
+def aggregate_values(metric: str, values: np.ndarray):
+    '''The same metric over an in-memory column (hot tier, archived readings)'''
+    if metric == "count":
+        return len(values)
+    if metric == "avg":
+        return float(values.mean())
+    if metric == "min":
+        return float(values.min())
+    if metric == "max":
+        return float(values.max())
+    if metric == "stddev":
+        # stddev_samp: NULL for a single sample
+        return float(values.std(ddof=1)) if len(values) > 1 else None
+    # percentile_cont interpolates linearly, as np.percentile does by default
+    return float(np.percentile(values, int(PERCENTILE.match(metric).group(1))))
+
+
+def column_stats(columns: dict, fields: list, metrics: list):
+    '''compute_stats' result (without window_minutes) from name -> array columns; None when empty'''
+    count = len(next(iter(columns.values())))
+    if not count:
+        return None
+    result = {"sample_count": count}
+    for prefix, column in fields:
+        for metric in metrics:
+            result[f"{metric}_{prefix}"] = aggregate_values(metric, columns[column.key])
+    return result
+
+
+def stats_query(sensor_id: str, since: datetime, fields: list, metrics: list):
+    '''One aggregate SELECT returning a single row: sample_count plus metric_field columns'''
+    columns = [func.count().label("sample_count")]
+    for prefix, column in fields:
+        for metric in metrics:
+            columns.append(aggregate(metric, column).label(f"{metric}_{prefix}"))
+    return select(*columns).where(
+        SensorReading.sensor_id == sensor_id,
+        SensorReading.timestamp >= since
+    )
+
+
+def validate_window(window_minutes: int) -> int:
+    if not 1 <= window_minutes <= MAX_WINDOW_MINUTES:
+        raise ValueError(f"window_minutes must be between 1 and {MAX_WINDOW_MINUTES}")
+    return window_minutes
+
+
+def recent_metrics(metrics: list) -> list:
+    '''What stats_query has to return for the database part of a window that reaches the
+    archive so combine() can merge it with the archived part (percentiles are separate)'''
+    needed = set(metrics) | ({"avg"} if "stddev" in metrics else set())
+    return [metric for metric in ("avg", "min", "max", "stddev") if metric in needed]
+
+
+def percentile_query(sensor_id: str, since: datetime, column, metrics: list, archived: np.ndarray):
+    '''Percentiles of a column over the database rows since `since` plus archived values
+    (passed as one float8[] parameter), in one query'''
+    recent = select(column.label("value")).where(SensorReading.sensor_id == sensor_id, SensorReading.timestamp >= since)
+    values = bindparam("archived", archived.tolist(), type_=ARRAY(Float))
+    combined = union_all(recent, select(func.unnest(values).label("value"))).subquery()
+    return select(*(
+        func.percentile_cont(int(PERCENTILE.match(metric).group(1)) / 100).within_group(combined.c.value).label(metric)
+        for metric in metrics
+    ))
+
+
+def combine(metric: str, values: np.ndarray, recent: dict, prefix: str):
+    '''A metric over archived values and the database aggregates of the rest of the window'''
+    count = recent["sample_count"]
+    if metric == "count":
+        return len(values) + count
+    if metric == "min":
+        return min(float(values.min()), float(recent[f"min_{prefix}"]))
+    if metric == "max":
+        return max(float(values.max()), float(recent[f"max_{prefix}"]))
+    archived_mean, recent_mean = float(values.mean()), float(recent[f"avg_{prefix}"])
+    total = len(values) + count
+    mean = (archived_mean * len(values) + recent_mean * count) / total
+    if metric == "avg":
+        return mean
+    # stddev: sums of squared deviations combined pairwise (Chan et al.)
+    recent_stddev = recent[f"stddev_{prefix}"]
+    squares = float(((values - archived_mean) ** 2).sum())
+    squares += float(recent_stddev) ** 2 * (count - 1) if recent_stddev is not None else 0.0
+    squares += (recent_mean - archived_mean) ** 2 * len(values) * count / total
+    return (squares / (total - 1)) ** 0.5
+
+
+async def compute_stats(db, sensor_id: str, window_minutes: int, fields: list, metrics: list, archive=None):
+    '''Compute statistics in the database; returns None when the window has no readings
+
+    When the window reaches archived days, the archived readings (with any
+    database rows before Archive.boundary merged in) are aggregated in memory
+    and combined with one aggregate query over the database from the boundary
+    on; percentiles are one query per field over both.
+    '''
+    since = datetime.utcnow() - timedelta(minutes=window_minutes)
+    boundary = archive.boundary(sensor_id, since) if archive is not None else None
+    if boundary is not None:
+        archived = await archive.fetch(sensor_id, since)
+        result = await db.execute(
+            select(SensorReading.timestamp, SensorReading.co2_ppm, SensorReading.temperature, SensorReading.humidity)
+            .where(SensorReading.sensor_id == sensor_id, SensorReading.timestamp >= since,
+                   SensorReading.timestamp < boundary)
+            .order_by(SensorReading.timestamp.asc())
+        )
+        _, columns = merge_columns(archived, rows_to_columns(result.all()))
+        archived_count = len(columns["co2_ppm"])
+        if archived_count:
+            recent = (await db.execute(stats_query(sensor_id, boundary, fields, recent_metrics(metrics)))).one()
+            recent = recent._mapping
+            if not recent["sample_count"]:
+                stats = column_stats(columns, fields, metrics)
+            else:
+                stats = {"sample_count": archived_count + recent["sample_count"]}
+                percentiles = [metric for metric in metrics if PERCENTILE.match(metric)]
+                for prefix, column in fields:
+                    for metric in metrics:
+                        if metric not in percentiles:
+                            stats[f"{metric}_{prefix}"] = combine(metric, columns[column.key], recent, prefix)
+                    if percentiles:
+                        query = percentile_query(sensor_id, boundary, column, percentiles, columns[column.key])
+                        for metric, value in (await db.execute(query)).one()._mapping.items():
+                            stats[f"{metric}_{prefix}"] = float(value)
+            stats["window_minutes"] = window_minutes
+            return stats
+
+    row = (await db.execute(stats_query(sensor_id, since, fields, metrics))).one()
+    if not row.sample_count:
+        return None
+
+    stats = {key: float(value) if isinstance(value, Decimal) else value
+             for key, value in row._mapping.items()}
+    stats["window_minutes"] = window_minutes
+    return stats
+
+
+def cache_key(sensor_id: str, window_minutes: int, fields: list, metrics: list) -> str:
+    '''Default requests keep the historical sensor:{id}:stats key'''
+    field_names = ",".join(prefix for prefix, _ in fields)
+    metric_names = ",".join(metrics)
+    if (window_minutes, field_names, metric_names) == (DEFAULT_WINDOW_MINUTES, DEFAULT_FIELDS, DEFAULT_METRICS):
+        return f"sensor:{sensor_id}:stats"
+    return f"sensor:{sensor_id}:stats:{window_minutes}:{field_names}:{metric_names}"
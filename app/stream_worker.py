@@ -0,0 +1,260 @@
+"""
+Redis Streams writer: drains sensor:readings:stream into PostgreSQL.
+
+With INGEST_MODE=stream the API only XADDs readings (and updates the Redis
+latest/push/running-stats keys). Any number of these workers share the
+consumer group sensor-writers:
+
+- XREADGROUP hands each entry to exactly one worker.
+- A batch is inserted with store_readings, then XACK'ed and XDEL'ed, so the
+  stream only holds the backlog.
+- Entries left pending by a crashed worker are taken over with XAUTOCLAIM once
+  they have been idle for STREAM_CLAIM_IDLE_MS. This is what recovers them:
+  the consumer name (STREAM_CONSUMER, default the hostname) changes across
+  restarts of a Deployment's pods. Where it is stable (StatefulSet pods, a
+  fixed STREAM_CONSUMER) a restarted worker also drains its own pending
+  entries right away instead of after the idle time.
+- Since every Deployment pod restart leaves a consumer name behind, consumers
+  idle for STREAM_CONSUMER_IDLE_MS with nothing pending are deleted from the
+  group (XGROUP DELCONSUMER) on the same schedule as the XAUTOCLAIM sweep.
+
+While PostgreSQL is unavailable the batch is retried and new readings simply
+accumulate in the stream (bounded by Redis memory). Readings the database
+rejects outright (a value out of range, a timestamp with no partition) are not
+retried: they go to the dead-letter stream (ingest.DEAD_LETTER_KEY) and are
+acknowledged with the rest of the batch. Delivery is at-least-once:
+a crash between commit and XACK re-inserts that batch.
+
+Usage:
+    python -m app.stream_worker
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+from . import logs
+from .ingest import STREAM_GROUP, STREAM_KEY, dead_letter, decode_stream_entry, store_isolating
+
+logger = logging.getLogger("app.stream_worker")
+# Invalid entries are counted; only a sample of them is logged
+invalid_log = logs.SampledLogger("app.stream_worker")
+
+
+class StreamIngestWorker:
+    def __init__(self, session_factory, redis_client, stream=STREAM_KEY, group=STREAM_GROUP, consumer=None,
+                 batch_size=500, block_ms=1000, claim_idle_ms=60000, consumer_idle_ms=3600000, retry_delay=1.0):
+        self.session_factory = session_factory
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        # Unique per running worker; pending entries of a previous name are recovered by XAUTOCLAIM
+        self.consumer = consumer or socket.gethostname()
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer_idle_ms = consumer_idle_ms
+        self.retry_delay = retry_delay
+        self._stopping = asyncio.Event()
+
+        # Counters reported by stats()
+        self.stored = 0
+        self.invalid = 0
+        self.claimed = 0
+        self.deleted_consumers = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+
+    def stats(self) -> dict:
+        return {
+            "consumer": self.consumer,
+            "stored": self.stored,
+            "invalid": self.invalid,
+            "claimed": self.claimed,
+            "deleted_consumers": self.deleted_consumers,
+            "failed_flushes": self.failed_flushes,
+            "dead_lettered": self.dead_lettered,
+        }
+
+    def stop(self):
+        self._stopping.set()
+
+    async def ensure_group(self):
+        from redis.exceptions import ResponseError
+
+        try:
+            await self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self):
+        await self.ensure_group()
+        # Entries delivered under this consumer name before a restart (only with stable names)
+        await self._drain_own_pending()
+        loop = asyncio.get_running_loop()
+        next_claim = 0.0
+        while not self._stopping.is_set():
+            if loop.time() >= next_claim:
+                await self.claim_abandoned()
+                await self.delete_idle_consumers()
+                next_claim = loop.time() + self.claim_idle_ms / 1000
+            await self.read_batch()
+
+    async def read_batch(self, block_ms=None) -> int:
+        response = await self.redis_client.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=self.batch_size,
+            block=self.block_ms if block_ms is None else block_ms
+        )
+        entries = response[0][1] if response else []
+        await self.process(entries)
+        return len(entries)
+
+    async def claim_abandoned(self) -> int:
+        '''Take over entries other consumers left pending for longer than claim_idle_ms'''
+        total = 0
+        start = "0-0"
+        while not self._stopping.is_set():
+            result = await self.redis_client.xautoclaim(
+                self.stream, self.group, self.consumer, self.claim_idle_ms, start_id=start, count=self.batch_size
+            )
+            start, entries = result[0], result[1]
+            if entries:
+                self.claimed += len(entries)
+                total += len(entries)
+                await self.process(entries)
+            if start in ("0-0", b"0-0"):
+                break
+        return total
+
+    async def delete_idle_consumers(self) -> int:
+        '''XGROUP DELCONSUMER consumers idle for consumer_idle_ms that have no pending entries
+
+        Run after claim_abandoned, which leaves dead consumers with nothing
+        pending. A live consumer that happens to be removed is recreated by its
+        next XREADGROUP.
+        '''
+        deleted = 0
+        for info in await self.redis_client.xinfo_consumers(self.stream, self.group):
+            if info["name"] == self.consumer or info["pending"] or info["idle"] < self.consumer_idle_ms:
+                continue
+            # A count > 0 means it read again since XINFO: the entries leave the PEL, but that
+            # consumer is alive and still stores, XACKs and XDELs them
+            pending = await self.redis_client.xgroup_delconsumer(self.stream, self.group, info["name"])
+            if pending:
+                logger.warning("deleted a stream consumer that was holding entries",
+                               extra={"fields": {"consumer": info["name"], "pending": pending}})
+            deleted += 1
+        self.deleted_consumers += deleted
+        return deleted
+
+    async def _drain_own_pending(self):
+        while not self._stopping.is_set():
+            response = await self.redis_client.xreadgroup(
+                self.group, self.consumer, {self.stream: "0"}, count=self.batch_size
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                break
+            await self.process(entries)
+
+    async def process(self, entries: list):
+        '''Insert a batch of (id, fields) entries, then acknowledge and delete them'''
+        # XAUTOCLAIM reports entries deleted meanwhile as (id, None)
+        entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+        if not entries:
+            return
+        rows, done = [], []
+        for entry_id, fields in entries:
+            try:
+                rows.append(decode_stream_entry(fields))
+            except ValueError as e:
+                self.invalid += 1
+                invalid_log.warning("dropping invalid stream entry", entry_id=entry_id, error=str(e))
+            done.append(entry_id)
+
+        # Only connection-class errors are retried, see ingest.store_isolating
+        stored, rejected = not rows, []
+        while not stored:
+            try:
+                rejected = await store_isolating(self.session_factory, rows)
+                stored = True
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.warning("stream batch failed", extra={"fields": {"rows": len(rows), "error": str(e)}})
+                if self._stopping.is_set():
+                    # Left pending: this consumer or XAUTOCLAIM picks them up again
+                    return
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.retry_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+        if rejected:
+            self.dead_lettered += len(rejected)
+            logger.error("dead-lettering stream readings the database rejected",
+                         extra={"fields": {"rows": len(rejected), "error": rejected[0][1]}})
+            await dead_letter(self.redis_client, rejected, "stream")
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xack(self.stream, self.group, *done)
+        pipe.xdel(self.stream, *done)
+        await pipe.execute()
+        self.stored += len(rows) - len(rejected)
+
+
+async def stream_stats(redis_client, stream=STREAM_KEY, group=STREAM_GROUP) -> dict:
+    '''Backlog of the ingest stream: entries not yet written and entries being written'''
+    from redis.exceptions import ResponseError
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xlen(stream)
+    pipe.xpending(stream, group)
+    try:
+        length, pending = await pipe.execute()
+    except ResponseError:
+        # No consumer group yet: no worker has started
+        return {"length": await redis_client.xlen(stream), "pending": None, "consumers": 0}
+    return {"length": length, "pending": pending["pending"], "consumers": len(pending["consumers"] or [])}
+
+
+def main():
+    import redis.asyncio as aioredis
+
+    from .database import AsyncSessionLocal, async_engine
+
+    logs.configure()
+    redis_client = aioredis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        decode_responses=True
+    )
+    worker = StreamIngestWorker(
+        AsyncSessionLocal,
+        redis_client,
+        consumer=os.getenv("STREAM_CONSUMER"),
+        batch_size=int(os.getenv("STREAM_BATCH_SIZE", 500)),
+        block_ms=int(os.getenv("STREAM_BLOCK_MS", 1000)),
+        claim_idle_ms=int(os.getenv("STREAM_CLAIM_IDLE_MS", 60000)),
+        consumer_idle_ms=int(os.getenv("STREAM_CONSUMER_IDLE_MS", 3600000))
+    )
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        print(f"🗃️  Stream writer {worker.consumer} reading {worker.stream} as {worker.group}")
+        try:
+            await worker.run()
+        finally:
+            print(f"Stream writer stopped: {worker.stats()}")
+            await redis_client.aclose()
+            await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Alert rule evaluation cost per reading: --sensors sensors x --rules rules
+
+Builds a rule set mixing threshold, rate and sustained rules over all three
+fields (a fifth of them limited to a subset of sensors), then feeds
+FleetSimulator ticks through AlertEngine the way the ingest paths do:
+
+  tick      one reading per sensor per call (simulator, a fleet-wide batch)
+  batch     --batch-size readings per call (POST /readings/batch, write-behind flushes)
+  single    one reading per call (POST /readings)
+
+"rows" times evaluate_rows (insert dicts in, as ingest.cache_latest calls it),
+"arrays" times evaluate on columns already converted. No database or Redis
+needed.
+
+Usage:
+    python benchmarks/bench_alerts.py --sensors 10000 --rules 100
+    python benchmarks/bench_alerts.py --sensors 10000 --rules 100 --ticks 50 --batch-size 500
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.alerts import AlertEngine
+from app.sensor_simulator import FleetSimulator
+
+START = datetime(2024, 1, 1, 9)
+
+
+def make_rules(count: int, sensor_ids: list, seed: int = 1) -> list:
+    rng = np.random.default_rng(seed)
+    # Out in the tails of the simulated fleet, so alerts are occasional rather than constant
+    limits = {"co2": (1300, 2000), "temp": (25, 28), "humidity": (15, 25)}
+    rate_limits = {"co2": (800, 1500), "temp": (5, 10), "humidity": (30, 50)}  # per minute
+    rules = []
+    for i in range(count):
+        rule_type = ("threshold", "threshold", "rate", "sustained")[i % 4]
+        field = ("co2", "temp", "humidity")[i % 3]
+        low, high = (rate_limits if rule_type == "rate" else limits)[field]
+        rule = {"id": f"rule-{i:03d}", "type": rule_type, "field": field,
+                "op": "<" if field == "humidity" and rule_type != "rate" else ">",
+                "value": round(float(rng.uniform(low, high)), 1)}
+        if rule_type != "threshold":
+            rule["minutes"] = int(rng.choice([1, 5, 15]))
+        if rule_type == "rate":
+            rule["value"] = round(rule["value"] * rule["minutes"], 1)
+        if i % 5 == 4:
+            rule["sensors"] = sorted(rng.choice(sensor_ids, size=max(1, len(sensor_ids) // 100), replace=False))
+        rules.append(rule)
+    return rules
+
+
+def fleet_ticks(fleet, ticks: int, interval: float):
+    '''[(rows, micros, values)] for consecutive ticks of the whole fleet'''
+    result = []
+    for i in range(ticks):
+        at = START + timedelta(seconds=i * interval)
+        co2, temperature, humidity = fleet.tick(at)
+        rows = [
+            {"sensor_id": sensor_id, "co2_ppm": c, "temperature": t, "humidity": h, "timestamp": at}
+            for sensor_id, c, t, h in zip(fleet.sensor_ids, co2.tolist(), temperature.tolist(), humidity.tolist())
+        ]
+        micros = np.full(len(rows), int((at - datetime(1970, 1, 1)) / timedelta(microseconds=1)), dtype=np.int64)
+        result.append((rows, micros, np.vstack([co2, temperature, humidity])))
+    return result
+
+
+def run(engine, ticks, batch_size: int, use_rows: bool):
+    '''Seconds spent evaluating, readings evaluated, events produced'''
+    sensor_ids = [row["sensor_id"] for row in ticks[0][0]]
+    seconds, readings, events = 0.0, 0, 0
+    for rows, micros, values in ticks:
+        for start in range(0, len(rows), batch_size):
+            end = start + batch_size
+            started = time.perf_counter()
+            if use_rows:
+                produced = engine.evaluate_rows(rows[start:end])
+            else:
+                produced = engine.evaluate(sensor_ids[start:end], micros[start:end], values[:, start:end])
+            seconds += time.perf_counter() - started
+            readings += min(end, len(rows)) - start
+            events += len(produced)
+    return seconds, readings, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensors", type=int, default=10000)
+    parser.add_argument("--rules", type=int, default=100)
+    parser.add_argument("--ticks", type=int, default=30, help="fleet ticks fed per mode")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between ticks")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--single-readings", type=int, default=20000, help="readings fed one at a time")
+    args = parser.parse_args()
+
+    fleet = FleetSimulator(args.sensors, seed=1)
+    rules = make_rules(args.rules, fleet.sensor_ids)
+    ticks = fleet_ticks(fleet, args.ticks * 2 + 1, args.interval)
+    single_ticks = -(-args.single_readings // args.sensors)
+
+    print(f"{args.sensors:,} sensors x {args.rules} rules, {args.ticks} ticks per mode\n")
+    print(f"{'mode':<8}{'input':<8}{'batch':>7}{'us/batch':>11}{'ns/reading':>12}{'ns/reading-rule':>17}"
+          f"{'events/tick':>13}")
+    modes = [("tick", args.sensors), ("batch", args.batch_size), ("single", 1)]
+    for name, batch_size in modes:
+        for use_rows in (True, False):
+            engine = AlertEngine(rules)
+            # First tick registers the sensors; timed ticks start after it
+            run(engine, ticks[:1], args.sensors, use_rows)
+            timed = ticks[1:1 + (single_ticks if name == "single" else args.ticks)]
+            if name == "single":
+                timed = [(rows[:args.single_readings], micros[:args.single_readings],
+                          values[:, :args.single_readings]) for rows, micros, values in timed]
+            seconds, readings, events = run(engine, timed, batch_size, use_rows)
+            calls = -(-readings // batch_size)
+            print(f"{name:<8}{'rows' if use_rows else 'arrays':<8}{batch_size:>7}{seconds / calls * 1e6:>11,.1f}"
+                  f"{seconds / readings * 1e9:>12,.0f}{seconds / readings / args.rules * 1e9:>17,.2f}"
+                  f"{events / len(timed):>13,.0f}")
+
+    engine = AlertEngine(rules)
+    run(engine, ticks[:1], args.sensors, False)
+    print(f"\nstate arrays: {engine.nbytes / 2**20:.1f} MiB "
+          f"({engine.nbytes / args.sensors / args.rules:.1f} bytes per sensor-rule)")
+
+
+if __name__ == "__main__":
+    main()
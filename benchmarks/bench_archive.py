@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Cold-storage archive: bytes on disk per reading and scan speed of a 30-day window
+
+Simulates --sensors sensors (FleetSimulator) reporting every --interval
+seconds for --days days, writes them through Archive.write_day (one Parquet
+file per sensor and day) and then reads them back the way /readings/history
+and /stats do:
+
+  window    Archive.read_window over the whole --window-days (default 30)
+  stats     the same plus avg/min/max/p95 of every field (stats.column_stats)
+  1 hour    a 1-hour window inside one day (row-group pruning on timestamp)
+
+Simulated values are full-precision floats, the worst case for compression;
+--decimals rounds them like sensor firmware does. With --database, the size
+of sensor_readings per row (table + indexes) in DATABASE_URL is printed for
+comparison (PostgreSQL only).
+
+Usage:
+    python benchmarks/bench_archive.py --sensors 20 --days 30
+    python benchmarks/bench_archive.py --sensors 5 --days 30 --decimals 1 --compression zstd snappy
+    python benchmarks/bench_archive.py --database
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.archive import FIELDS, Archive
+from app.sensor_simulator import FleetSimulator
+from app.stats import column_stats, parse_fields
+
+START = datetime(2024, 1, 1)
+
+
+def simulate_day(fleet, day: datetime, interval: float, decimals):
+    '''(timestamps, [sensor] -> fields) for one day of the whole fleet'''
+    ticks = int(86400 / interval)
+    offsets = (np.arange(ticks) * interval * 1e6).astype("timedelta64[us]")
+    timestamps = np.datetime64(day, "us") + offsets
+    values = np.empty((ticks, len(FIELDS), len(fleet)))
+    for i in range(ticks):
+        values[i] = fleet.tick(day + timedelta(seconds=i * interval))
+    if decimals is not None:
+        values = values.round(decimals)
+    return timestamps, values
+
+
+def write_archive(archive, fleet, args) -> tuple:
+    readings, seconds = 0, 0.0
+    for d in range(args.days):
+        day = START + timedelta(days=d)
+        timestamps, values = simulate_day(fleet, day, args.interval, args.decimals)
+        for s, sensor_id in enumerate(fleet.sensor_ids):
+            fields = {name: np.ascontiguousarray(values[:, f, s]) for f, name in enumerate(FIELDS)}
+            started = time.perf_counter()
+            readings += archive.write_day(sensor_id, day.date(), timestamps, fields)
+            seconds += time.perf_counter() - started
+    return readings, seconds
+
+
+def best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def database_bytes_per_row():
+    from sqlalchemy import text
+
+    from app.database import engine
+
+    if engine.dialect.name != "postgresql":
+        return None
+    with engine.connect() as conn:
+        size = conn.execute(text("SELECT pg_total_relation_size('sensor_readings')")).scalar()
+        rows = conn.execute(text("SELECT count(*) FROM sensor_readings")).scalar()
+    return size / rows if rows else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensors", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--window-days", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between readings of one sensor")
+    parser.add_argument("--decimals", type=int, help="round simulated values to this many decimals")
+    parser.add_argument("--compression", nargs="+", default=["zstd"], help="Parquet codecs to compare")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database", action="store_true", help="also print sensor_readings bytes per row")
+    parser.add_argument("--dir", help="archive directory to use (default: a temporary one, removed afterwards)")
+    args = parser.parse_args()
+
+    print(f"{args.sensors} sensors x {args.days} days every {args.interval:g}s, "
+          f"{'full precision' if args.decimals is None else f'{args.decimals} decimals'}\n")
+    window_days = min(args.window_days, args.days)
+    print(f"{'codec':<8}{'bytes/reading':>14}{'write/s':>12}{f'{window_days}d window ms':>15}{'readings/s':>14}"
+          f"{f'{window_days}d stats ms':>14}{'1h window ms':>14}")
+
+    fields = parse_fields("co2,temp,humidity")
+    for codec in args.compression:
+        root = Path(args.dir) / codec if args.dir else Path(tempfile.mkdtemp(prefix="sensor-archive-"))
+        try:
+            archive = Archive(root, compression=codec)
+            fleet = FleetSimulator(args.sensors, seed=1)
+            readings, write_seconds = write_archive(archive, fleet, args)
+            size = archive.stats()["bytes"]
+
+            end = START + timedelta(days=args.days)
+            since = end - timedelta(days=window_days)
+            sensor_id = fleet.sensor_ids[0]
+            window_seconds, (timestamps, _) = best_of(args.repeat, lambda: archive.read_window(sensor_id, since, end))
+            stats_seconds, _ = best_of(args.repeat, lambda: column_stats(
+                archive.read_window(sensor_id, since, end)[1], fields, ["avg", "min", "max", "p95"]))
+            hour = since + timedelta(days=window_days // 2, hours=12)
+            hour_seconds, _ = best_of(args.repeat, lambda: archive.read_window(sensor_id, hour, hour + timedelta(hours=1)))
+
+            print(f"{codec:<8}{size / readings:>14.2f}{readings / write_seconds:>12,.0f}"
+                  f"{window_seconds * 1000:>15.1f}{len(timestamps) / window_seconds:>14,.0f}"
+                  f"{stats_seconds * 1000:>14.1f}{hour_seconds * 1000:>14.2f}")
+        finally:
+            if not args.dir:
+                shutil.rmtree(root, ignore_errors=True)
+
+    print(f"\nuncompressed columns: {8 * (1 + len(FIELDS))} bytes/reading")
+    if args.database:
+        per_row = database_bytes_per_row()
+        print(f"sensor_readings (table + indexes): "
+              f"{f'{per_row:.1f} bytes/row' if per_row else 'n/a (needs PostgreSQL with rows)'}")
+
+
+if __name__ == "__main__":
+    main()
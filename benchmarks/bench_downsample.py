@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Payload size and build time of /readings/history: raw rows vs server-side downsampling
+
+Synthesizes a --rows window (1M by default) of readings in memory and times
+the work the endpoint does after the query: building the response body and
+encoding it as JSON. No database or API needed.
+
+Usage:
+    python benchmarks/bench_downsample.py --rows 1000000 --max-points 1000
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app import downsample
+
+
+def synthetic_rows(count):
+    start = datetime(2024, 1, 1)
+    t = np.arange(count)
+    co2 = 600 + 200 * np.sin(t / 8640 * 2 * np.pi) + np.random.normal(0, 15, count)
+    temperature = 21 + 2 * np.sin(t / 8640 * 2 * np.pi) + np.random.normal(0, 0.2, count)
+    humidity = 45 + np.random.normal(0, 3, count)
+    timestamps = [start + timedelta(seconds=10 * i) for i in range(count)]
+    return list(zip(timestamps, co2.tolist(), temperature.tolist(), humidity.tolist()))
+
+
+def raw_body(rows):
+    readings = [
+        {"co2_ppm": co2, "temperature": temp, "humidity": hum, "timestamp": ts.isoformat()}
+        for ts, co2, temp, hum in reversed(rows)
+    ]
+    return json.dumps({"count": len(readings), "readings": readings})
+
+
+def downsampled_body(rows, max_points, method):
+    timestamps, fields = downsample.rows_to_columns(rows)
+    timestamps, fields = downsample.downsample_readings(timestamps, fields, max_points, method)
+    points = downsample.to_points(timestamps, fields)
+    return json.dumps({"count": len(points), "readings": points})
+
+
+def measure(build, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = build()
+        best = min(best, time.perf_counter() - start)
+    return best, len(body.encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--max-points", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows)
+    print(f"{args.rows:,} rows, max_points={args.max_points}\n")
+    print(f"{'output':<10}{'time ms':>10}{'payload':>14}{'points':>10}")
+
+    elapsed, size = measure(lambda: raw_body(rows), args.repeat)
+    print(f"{'raw':<10}{elapsed * 1000:>10.1f}{size:>14,}{args.rows:>10,}")
+    for method in downsample.METHODS:
+        elapsed, size = measure(lambda: downsampled_body(rows, args.max_points, method), args.repeat)
+        print(f"{method:<10}{elapsed * 1000:>10.1f}{size:>14,}{args.max_points:>10,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Ingest throughput benchmark: POST /readings vs POST /readings/batch
+
+Runs against a live API (docker-compose up) and reports rows/sec for the
+single-reading path and the batch path.
+
+Usage:
+    python benchmarks/bench_ingest.py --url http://localhost:8000 --rows 5000 --batch-size 500
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.sensor_simulator import SensorSimulator
+
+
+def make_readings(count, sensors):
+    simulators = [SensorSimulator(f"BENCH_{i:04d}") for i in range(sensors)]
+    readings = []
+    for i in range(count):
+        reading = simulators[i % sensors].get_reading()
+        reading.pop("timestamp")
+        readings.append(reading)
+    return readings
+
+
+def bench_single(client, readings):
+    start = time.perf_counter()
+    for reading in readings:
+        client.post("/readings", json=reading).raise_for_status()
+    return time.perf_counter() - start
+
+
+def bench_batch(client, readings, batch_size, ndjson=False):
+    start = time.perf_counter()
+    for i in range(0, len(readings), batch_size):
+        chunk = readings[i:i + batch_size]
+        if ndjson:
+            body = "\n".join(json.dumps(r) for r in chunk)
+            response = client.post("/readings/batch", content=body,
+                                   headers={"Content-Type": "application/x-ndjson"})
+        else:
+            response = client.post("/readings/batch", json=chunk)
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--sensors", type=int, default=50)
+    args = parser.parse_args()
+
+    readings = make_readings(args.rows, args.sensors)
+
+    with httpx.Client(base_url=args.url, timeout=60) as client:
+        results = {
+            "single": bench_single(client, readings),
+            "batch (json)": bench_batch(client, readings, args.batch_size),
+            "batch (ndjson)": bench_batch(client, readings, args.batch_size, ndjson=True),
+        }
+
+    baseline = args.rows / results["single"]
+    print(f"{'path':<16}{'seconds':>10}{'rows/sec':>12}{'speedup':>10}")
+    for name, elapsed in results.items():
+        rate = args.rows / elapsed
+        print(f"{name:<16}{elapsed:>10.2f}{rate:>12.0f}{rate / baseline:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
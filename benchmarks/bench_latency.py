@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark under concurrency for POST /readings and GET /readings/latest/{sensor_id}
+
+Fires --requests requests per endpoint with at most --concurrency in flight and
+reports p50/p99 latency and throughput. Save a run with --output and pass it as
+--baseline on a later run (e.g. before/after a change) to print the deltas.
+
+Usage:
+    python benchmarks/bench_latency.py --url http://localhost:8000 --concurrency 200 --output after.json
+    python benchmarks/bench_latency.py --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.sensor_simulator import SensorSimulator
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_endpoint(client, make_request, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+    }
+
+
+async def main_async(args):
+    simulators = [SensorSimulator(f"BENCH_{i:04d}") for i in range(args.sensors)]
+
+    async def post_reading(client, i):
+        reading = simulators[i % args.sensors].get_reading()
+        reading.pop("timestamp")
+        return await client.post("/readings", json=reading)
+
+    async def get_latest(client, i):
+        return await client.get(f"/readings/latest/BENCH_{i % args.sensors:04d}")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        return {
+            "POST /readings": await run_endpoint(client, post_reading, args.requests, args.concurrency),
+            "GET /readings/latest/{id}": await run_endpoint(client, get_latest, args.requests, args.concurrency),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--sensors", type=int, default=50)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else {}
+
+    print(f"{'endpoint':<28}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<28}{r['rps']:>10.0f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['errors']:>8}")
+        if name in baseline:
+            b = baseline[name]
+            print(f"{'  vs baseline':<28}{r['rps'] / b['rps']:>9.2f}x"
+                  f"{r['p50_ms'] / b['p50_ms']:>9.2f}x{r['p99_ms'] / b['p99_ms']:>9.2f}x")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Requests/sec per core of the POST /readings parse + serialize path
+
+Drives two minimal FastAPI apps directly over ASGI on one core, with storage
+and Redis left out so only the per-request CPU work is compared:
+
+  pydantic  the previous handler: SensorReadingInput body model, a separate
+            reading_data dict, json.dumps for the Redis value and the default
+            JSON response encoder
+  orjson    the current handler: ingest.decode_reading, one orjson-encoded
+            payload reused as Redis value and response body
+
+No database, Redis or running API needed.
+
+Usage:
+    python benchmarks/bench_parse.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import orjson
+from fastapi import FastAPI, Request, Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Importing the app creates the schema; nothing here touches it, so keep it in memory
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+from app.ingest import decode_reading, latest_payload, reading_row
+from app.main import SensorReadingInput
+
+BODY = json.dumps({"sensor_id": "SENSOR_001", "co2_ppm": 612.4, "temperature": 21.7, "humidity": 44.2}).encode()
+
+
+def pydantic_app():
+    app = FastAPI()
+
+    @app.post("/readings")
+    async def create_reading(reading: SensorReadingInput):
+        received_at = datetime.utcnow()
+        reading_data = {
+            "sensor_id": reading.sensor_id,
+            "co2_ppm": reading.co2_ppm,
+            "temperature": reading.temperature,
+            "humidity": reading.humidity,
+            "timestamp": received_at.isoformat()
+        }
+        row = reading_row(reading.sensor_id, reading.co2_ppm, reading.temperature, reading.humidity, received_at)
+        json.dumps(latest_payload(row))  # Redis value
+        return {"status": "success", "reading": reading_data}
+
+    return app
+
+
+def orjson_app():
+    app = FastAPI()
+
+    @app.post("/readings")
+    async def create_reading(request: Request):
+        sensor_id, co2_ppm, temperature, humidity = decode_reading(await request.body())
+        row = reading_row(sensor_id, co2_ppm, temperature, humidity, datetime.utcnow())
+        payload = orjson.dumps(latest_payload(row))  # Redis value, reused below
+        return Response(content=b'{"status":"success","reading":' + payload + b"}", media_type="application/json")
+
+    return app
+
+
+async def call(app, body):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/readings", "raw_path": b"/readings", "query_string": b"",
+        "root_path": "", "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 8000),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    assert status == [200], status
+
+
+async def measure(app, requests):
+    for _ in range(min(1000, requests)):
+        await call(app, BODY)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, BODY)
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'handler':<10}{'req/s/core':>12}")
+    results = {}
+    for name, factory in (("pydantic", pydantic_app), ("orjson", orjson_app)):
+        results[name] = asyncio.run(measure(factory(), args.requests))
+        print(f"{name:<10}{results[name]:>12,.0f}")
+    print(f"\nspeedup: {results['orjson'] / results['pydantic']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+History / stats query latency on a large sensor_readings table
+
+Seeds --rows readings spread over --sensors sensors and --days days using
+server-side generate_series (no client round trips), then times the range
+scans issued by GET /readings/history/{id} and GET /stats/{id}.
+
+Run once on a plain table and once after `python -m app.schema partition`
+to compare layouts.
+
+Usage:
+    DATABASE_URL=postgresql://... python benchmarks/bench_queries.py --rows 50000000 --seed
+    DATABASE_URL=postgresql://... python benchmarks/bench_queries.py --queries 200
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import func, select, text
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.database import SensorReading, engine
+from app import schema
+
+SEED_SQL = """
+INSERT INTO sensor_readings (sensor_id, co2_ppm, temperature, humidity, "timestamp")
+SELECT
+    'BENCH_' || lpad((g % :sensors)::text, 5, '0'),
+    400 + random() * 600,
+    18 + random() * 8,
+    35 + random() * 30,
+    :end_ts - (g * :step_seconds) * interval '1 second'
+FROM generate_series(:lo, :hi - 1) AS g
+"""
+
+
+def seed(rows, sensors, days, chunk):
+    end_ts = datetime.utcnow()
+    step_seconds = days * 86400 / rows
+    if schema.PARTITION_INTERVAL:
+        schema.ensure_partitions(engine, schema.PARTITION_INTERVAL, end_ts - timedelta(days=days + 1), end_ts)
+
+    start = time.perf_counter()
+    for lo in range(0, rows, chunk):
+        hi = min(rows, lo + chunk)
+        with engine.begin() as conn:
+            conn.execute(text(SEED_SQL), {
+                "sensors": sensors, "end_ts": end_ts, "step_seconds": step_seconds,
+                "lo": lo, "hi": hi
+            })
+        done = hi / rows
+        print(f"\rseeded {hi:,}/{rows:,} rows ({done:.0%}, {hi / (time.perf_counter() - start):,.0f} rows/s)",
+              end="", flush=True)
+    print()
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE sensor_readings"))
+
+
+def history_query(sensor_id, hours):
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    return select(SensorReading).where(
+        SensorReading.sensor_id == sensor_id,
+        SensorReading.timestamp >= cutoff
+    ).order_by(SensorReading.timestamp.desc())
+
+
+def stats_query(sensor_id):
+    cutoff = datetime.utcnow() - timedelta(hours=1)
+    return select(SensorReading).where(
+        SensorReading.sensor_id == sensor_id,
+        SensorReading.timestamp >= cutoff
+    )
+
+
+def time_queries(name, make_query, sensors, queries):
+    latencies = []
+    rows = 0
+    with engine.connect() as conn:
+        for _ in range(queries):
+            sensor_id = f"BENCH_{random.randrange(sensors):05d}"
+            start = time.perf_counter()
+            rows += len(conn.execute(make_query(sensor_id)).all())
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{name:<22}{p50:>10.2f}{p99:>10.2f}{rows / queries:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--sensors", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--chunk", type=int, default=1_000_000)
+    parser.add_argument("--seed", action="store_true", help="insert --rows synthetic readings first")
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    if not schema.is_postgres(engine):
+        parser.error("this benchmark needs PostgreSQL (generate_series)")
+
+    if args.seed:
+        seed(args.rows, args.sensors, args.days, args.chunk)
+
+    with engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(SensorReading)).scalar()
+        partitioned = schema.is_partitioned(conn)
+    print(f"{total:,} rows, {'partitioned' if partitioned else 'plain'} table\n")
+
+    print(f"{'query':<22}{'p50 ms':>10}{'p99 ms':>10}{'rows/query':>12}")
+    time_queries("history 1h", lambda s: history_query(s, 1), args.sensors, args.queries)
+    time_queries("history 24h", lambda s: history_query(s, 24), args.sensors, args.queries)
+    time_queries("stats 1h", stats_query, args.sensors, args.queries)
+
+
+if __name__ == "__main__":
+    main()
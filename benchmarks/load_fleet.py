@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Fleet load generator: N simulated sensors against the API or straight into the database
+
+Every round, each of --sensors sensors produces one reading (FleetSimulator:
+per-sensor daily profiles, vectorized with NumPy). Rounds start every
+--interval seconds (0 = back to back) for --duration seconds, so the offered
+load is sensors / interval readings per second. Readings go out as:
+
+  single    one POST /readings per reading
+  batch     POST /readings/batch with --batch-size readings each
+  db        store_readings() into DATABASE_URL, --batch-size rows per transaction
+  generate  nothing: measures how fast the simulator itself produces rows
+
+with at most --concurrency requests (or transactions) in flight. Prints the
+achieved throughput, how far the sender fell behind the schedule and a latency
+histogram per request / transaction; --output saves the same as JSON.
+
+Usage:
+    python benchmarks/load_fleet.py --sensors 10000 --interval 10 --duration 60 --mode batch
+    python benchmarks/load_fleet.py --sensors 1000 --interval 1 --mode single --concurrency 200
+    python benchmarks/load_fleet.py --sensors 50000 --interval 0 --mode db --concurrency 8
+    python benchmarks/load_fleet.py --sensors 100000 --interval 0 --mode generate --output fleet.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import orjson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.sensor_simulator import FleetSimulator
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+FIELDS = ("sensor_id", "co2_ppm", "temperature", "humidity")
+
+
+def histogram(latencies_ms) -> dict:
+    counts = np.bincount(np.searchsorted(BUCKETS_MS, latencies_ms), minlength=len(BUCKETS_MS) + 1)
+    labels = [f"<={bound}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+    return dict(zip(labels, counts.tolist()))
+
+
+def summarize(latencies_ms) -> dict:
+    if not len(latencies_ms):
+        return {}
+    p50, p90, p99 = np.percentile(latencies_ms, (50, 90, 99))
+    return {
+        "mean_ms": float(np.mean(latencies_ms)),
+        "p50_ms": float(p50),
+        "p90_ms": float(p90),
+        "p99_ms": float(p99),
+        "max_ms": float(np.max(latencies_ms)),
+        "histogram": histogram(latencies_ms),
+    }
+
+
+def http_sender(client, mode):
+    '''Coroutine function sending one chunk of rows; the API stamps readings on arrival'''
+    async def single(rows):
+        row = rows[0]
+        response = await client.post("/readings", content=orjson.dumps({f: row[f] for f in FIELDS}),
+                                     headers={"content-type": "application/json"})
+        return response.status_code < 400
+
+    async def batch(rows):
+        body = orjson.dumps([{f: row[f] for f in FIELDS} for row in rows])
+        response = await client.post("/readings/batch", content=body, headers={"content-type": "application/json"})
+        return response.status_code < 400
+
+    return single if mode == "single" else batch
+
+
+def db_sender():
+    from app.database import AsyncSessionLocal
+    from app.ingest import store_readings
+
+    async def send(rows):
+        async with AsyncSessionLocal() as db:
+            await store_readings(db, rows)
+        return True
+
+    return send
+
+
+async def run(fleet, send, chunk_size, args) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    in_flight = set()
+    latencies_ms = []
+    errors = 0
+
+    async def one(chunk):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            if not await send(chunk):
+                errors += 1
+        except Exception as e:
+            errors += 1
+            if errors <= 5:
+                print(f"send failed: {e!r}", file=sys.stderr)
+        finally:
+            latencies_ms.append((time.perf_counter() - started) * 1000)
+            semaphore.release()
+
+    rounds = readings = 0
+    max_behind = generate_seconds = 0.0
+    start = time.perf_counter()
+    while True:
+        due = rounds * args.interval
+        now = time.perf_counter() - start
+        if max(due, now) >= args.duration:
+            break
+        if due > now:
+            await asyncio.sleep(due - now)
+        elif args.interval:
+            max_behind = max(max_behind, now - due)
+
+        generated = time.perf_counter()
+        rows = fleet.rows()
+        generate_seconds += time.perf_counter() - generated
+        rounds += 1
+        readings += len(rows)
+        if send is None:
+            continue
+        for i in range(0, len(rows), chunk_size):
+            # Waiting for a free slot is what makes the sender fall behind schedule
+            await semaphore.acquire()
+            task = asyncio.create_task(one(rows[i:i + chunk_size]))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": args.mode,
+        "sensors": len(fleet),
+        "rounds": rounds,
+        "readings": readings,
+        "requests": len(latencies_ms),
+        "errors": errors,
+        "seconds": elapsed,
+        "offered_per_s": len(fleet) / args.interval if args.interval else None,
+        "readings_per_s": readings / elapsed,
+        "readings_per_min": readings / elapsed * 60,
+        "generate_seconds": generate_seconds,
+        "max_behind_schedule_s": max_behind,
+        "latency": summarize(np.array(latencies_ms)),
+    }
+
+
+async def main_async(args) -> dict:
+    fleet = FleetSimulator(args.sensors, prefix=args.prefix, seed=args.seed)
+
+    if args.mode == "generate":
+        return await run(fleet, None, args.batch_size, args)
+    if args.mode == "db":
+        return await run(fleet, db_sender(), args.batch_size, args)
+
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        chunk_size = 1 if args.mode == "single" else args.batch_size
+        return await run(fleet, http_sender(client, args.mode), chunk_size, args)
+
+
+def print_report(result):
+    print(f"mode             {result['mode']}")
+    print(f"sensors          {result['sensors']:,}")
+    offered = f" (offered {result['offered_per_s']:,.0f}/s)" if result["offered_per_s"] else ""
+    print(f"readings         {result['readings']:,} in {result['seconds']:.1f}s{offered}")
+    print(f"throughput       {result['readings_per_s']:,.0f}/s ({result['readings_per_min']:,.0f}/min)")
+    print(f"simulator time   {result['generate_seconds']:.2f}s")
+    print(f"behind schedule  {result['max_behind_schedule_s']:.2f}s (max)")
+    latency = result["latency"]
+    if not latency:
+        return
+    print(f"requests         {result['requests']:,} ({result['errors']:,} errors)")
+    print(f"latency ms       p50 {latency['p50_ms']:.1f}  p90 {latency['p90_ms']:.1f}  "
+          f"p99 {latency['p99_ms']:.1f}  max {latency['max_ms']:.1f}")
+    widest = max(latency["histogram"].values())
+    for label, count in latency["histogram"].items():
+        print(f"  {label:>9} {count:>9,} {'#' * round(40 * count / widest) if widest else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("single", "batch", "db", "generate"), default="batch")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--sensors", type=int, default=10000)
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between readings of one sensor")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--prefix", default="LOAD_", help="sensor id prefix")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    print_report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
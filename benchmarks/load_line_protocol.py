@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Sustained load against the line-protocol listener
+
+Generates readings with SensorSimulator, sends them over UDP (or TCP) at
+--rate readings/sec for --duration seconds, then reads /ingest/stats to see
+how many the API parsed, dropped and flushed to the database.
+
+Start the API with a listener first, e.g.
+    LINE_PROTOCOL_UDP_PORT=8089 LINE_PROTOCOL_TCP_PORT=8089 uvicorn app.main:app
+
+Usage:
+    python benchmarks/load_line_protocol.py --rate 20000 --duration 30 --sensors 200
+    python benchmarks/load_line_protocol.py --transport tcp --rate 50000
+"""
+
+import argparse
+import socket
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.sensor_simulator import SensorSimulator
+
+# Stay well below typical MTU-sized datagrams to avoid IP fragmentation
+MAX_DATAGRAM = 1400
+
+
+def to_line(reading) -> bytes:
+    return (f"co2,sensor={reading['sensor_id']} ppm={reading['co2_ppm']:.1f},"
+            f"temp={reading['temperature']:.2f},hum={reading['humidity']:.1f}\n").encode()
+
+
+def line_stats(client):
+    stats = client.get("/ingest/stats").json().get("line_protocol")
+    if stats is None:
+        sys.exit("The API has no line-protocol listener (set LINE_PROTOCOL_UDP_PORT / LINE_PROTOCOL_TCP_PORT)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--transport", choices=("udp", "tcp"), default="udp")
+    parser.add_argument("--rate", type=int, default=10000, help="readings per second")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--sensors", type=int, default=100)
+    args = parser.parse_args()
+
+    simulators = [SensorSimulator(f"LOAD_{i:04d}") for i in range(args.sensors)]
+    # Pre-generate one round of lines per sensor so the sender is not bound by the simulator
+    lines = [to_line(simulator.get_reading()) for simulator in simulators]
+
+    if args.transport == "udp":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((args.host, args.port))
+    else:
+        sock = socket.create_connection((args.host, args.port))
+
+    client = httpx.Client(base_url=args.url, timeout=30)
+    before = line_stats(client)
+
+    sent = 0
+    start = time.perf_counter()
+    tick = 0.01
+    while (elapsed := time.perf_counter() - start) < args.duration:
+        # Catch up to the target count for the elapsed time, in datagram-sized chunks
+        due = int(elapsed * args.rate) - sent
+        chunk = []
+        size = 0
+        for i in range(due):
+            line = lines[(sent + i) % len(lines)]
+            if args.transport == "udp" and size + len(line) > MAX_DATAGRAM:
+                sock.send(b"".join(chunk))
+                chunk, size = [], 0
+            chunk.append(line)
+            size += len(line)
+        if chunk:
+            sock.send(b"".join(chunk))
+        sent += due
+        time.sleep(tick)
+    send_seconds = time.perf_counter() - start
+    sock.close()
+
+    # Give the listener time to flush what it accepted
+    time.sleep(3)
+    after = line_stats(client)
+
+    received = after["lines"] - before["lines"]
+    dropped = after["dropped"] - before["dropped"]
+    errors = after["parse_errors"] - before["parse_errors"]
+    flushed = after["buffer"]["flushed_rows"] - before["buffer"]["flushed_rows"]
+    lost_in_transit = max(sent - received, 0)
+
+    print(f"transport        {args.transport}")
+    print(f"sent             {sent:,} readings ({sent / send_seconds:,.0f}/s)")
+    print(f"received         {received:,} lines ({errors} parse errors)")
+    print(f"dropped (full)   {dropped:,}")
+    print(f"lost in transit  {lost_in_transit:,}")
+    print(f"stored           {flushed:,} rows ({flushed / send_seconds:,.0f}/s sustained)")
+    print(f"drop rate        {(sent - flushed) / sent:.2%}" if sent else "drop rate        -")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Fixtures for the hot-path benchmark suite (pytest-benchmark)
+
+--bench-backend=fake (default) runs the API against a throwaway SQLite file and
+an in-process fakeredis server, so the suite needs no services. With
+--bench-backend=live it uses whatever DATABASE_URL / REDIS_HOST point at (e.g.
+the docker-compose containers); readings seeded by the suite use BENCH_ sensor
+ids and are deleted again at the end.
+
+Requests go through the ASGI app in process (httpx.ASGITransport) on the
+TestClient's event loop, so HTTP parsing and the network are left out.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+HISTORY_ROWS = "1000,100000,1000000"
+SEED_CHUNK = 50000
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("hot-path benchmarks")
+    group.addoption("--bench-backend", choices=("fake", "live"), default="fake",
+                    help="fake: SQLite + fakeredis (default); live: DATABASE_URL / REDIS_HOST")
+    group.addoption("--bench-history-rows", default=HISTORY_ROWS,
+                    help=f"comma-separated table sizes for the history benchmarks (default {HISTORY_ROWS})")
+
+
+def pytest_configure(config):
+    # Must happen before app.main is imported: engines and the simulator read these at import
+    if config.getoption("--bench-backend") == "fake":
+        config._bench_dir = tempfile.mkdtemp(prefix="sensor-bench-")
+        # SQLite serializes writers; concurrent requests wait for the lock instead of failing
+        os.environ["DATABASE_URL"] = f"sqlite:///{config._bench_dir}/bench.db?timeout=60"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+    # One simulated reading at startup, none while measuring
+    os.environ["SIMULATOR_INTERVAL"] = "86400"
+
+
+def pytest_unconfigure(config):
+    bench_dir = getattr(config, "_bench_dir", None)
+    if bench_dir:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+
+def pytest_benchmark_update_machine_info(config, machine_info):
+    from app.database import engine
+
+    machine_info["bench_backend"] = config.getoption("--bench-backend")
+    machine_info["database"] = engine.dialect.name
+
+
+def pytest_generate_tests(metafunc):
+    if "history_rows" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("--bench-history-rows").split(",") if size]
+        metafunc.parametrize("history_rows", sizes, ids=[label(size) for size in sizes])
+
+
+def label(rows: int) -> str:
+    for divisor, suffix in ((1_000_000, "M"), (1000, "k")):
+        if rows >= divisor and rows % divisor == 0:
+            return f"{rows // divisor}{suffix}"
+    return str(rows)
+
+
+class Api:
+    '''Runs coroutines against the app on its own event loop; `http` is an in-process client'''
+
+    def __init__(self, main, portal, http):
+        self.main = main
+        self.portal = portal
+        self.http = http
+
+    def run(self, func, *args):
+        return self.portal.call(func, *args)
+
+
+@pytest.fixture(scope="session")
+def api(request):
+    import httpx
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    if request.config.getoption("--bench-backend") == "fake":
+        import fakeredis
+
+        # Point the app's shared pool at an in-process server; every client built on it follows
+        fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+        main.redis_pool.connection_class = fake.connection_pool.connection_class
+        main.redis_pool.connection_kwargs = dict(fake.connection_pool.connection_kwargs)
+
+    with TestClient(main.app) as client:
+        async def open_http():
+            return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+
+        http = client.portal.call(open_http)
+        yield Api(main, client.portal, http)
+        client.portal.call(http.aclose)
+
+        if request.config.getoption("--bench-backend") == "live":
+            delete_seeded(main.engine)
+
+
+def delete_seeded(engine):
+    from sqlalchemy import delete
+
+    from app.database import SensorReading, SensorRollup
+
+    with engine.begin() as conn:
+        conn.execute(delete(SensorReading).where(SensorReading.sensor_id.like("BENCH_%")))
+        conn.execute(delete(SensorRollup).where(SensorRollup.sensor_id.like("BENCH_%")))
+
+
+@pytest.fixture(scope="session")
+def seed_history(api):
+    '''seed_history(rows) -> sensor id with `rows` readings spread over the last 23 hours'''
+    from sqlalchemy import insert
+
+    from app import rollups, schema
+    from app.database import SensorReading, engine
+
+    seeded = {}
+
+    def seed(rows: int) -> str:
+        if rows in seeded:
+            return seeded[rows]
+        sensor_id = f"BENCH_HIST_{label(rows)}"
+        end = datetime.utcnow() - timedelta(minutes=1)
+        start = end - timedelta(hours=23)
+        if schema.PARTITION_INTERVAL and schema.is_postgres(engine):
+            schema.ensure_partitions(engine, schema.PARTITION_INTERVAL, start, end)
+
+        rng = np.random.default_rng(rows)
+        offsets = np.linspace(0, (end - start).total_seconds(), rows)
+        for lo in range(0, rows, SEED_CHUNK):
+            hi = min(rows, lo + SEED_CHUNK)
+            co2 = rng.uniform(400, 1000, hi - lo).tolist()
+            temperature = rng.uniform(18, 26, hi - lo).tolist()
+            humidity = rng.uniform(35, 65, hi - lo).tolist()
+            with engine.begin() as conn:
+                conn.execute(insert(SensorReading), [
+                    {"sensor_id": sensor_id, "co2_ppm": c, "temperature": t, "humidity": h,
+                     "timestamp": start + timedelta(seconds=offset)}
+                    for c, t, h, offset in zip(co2, temperature, humidity, offsets[lo:hi].tolist())
+                ])
+        if rollups.ROLLUPS_ENABLED:
+            rollups.rebuild_rollups(engine, sensor_id=sensor_id, since=start, until=end)
+        seeded[rows] = sensor_id
+        return sensor_id
+
+    return seed
@@ -0,0 +1,39 @@
+"""POST /readings: one request at a time, and many in flight on one event loop
+
+On the SQLite backend the concurrent case mostly measures writers queueing for
+the database lock; run it with --bench-backend=live for meaningful numbers.
+"""
+
+import orjson
+
+CONCURRENT_REQUESTS = 100
+HEADERS = {"content-type": "application/json"}
+
+
+def body(sensor_id: str) -> bytes:
+    return orjson.dumps({"sensor_id": sensor_id, "co2_ppm": 612.4, "temperature": 21.7, "humidity": 44.2})
+
+
+def test_create_reading(benchmark, api):
+    payload = body("BENCH_INGEST")
+
+    async def post():
+        response = await api.http.post("/readings", content=payload, headers=HEADERS)
+        assert response.status_code == 200
+
+    benchmark(api.run, post)
+
+
+def test_create_reading_concurrent(benchmark, api):
+    import asyncio
+
+    payloads = [body(f"BENCH_INGEST_{i:03d}") for i in range(CONCURRENT_REQUESTS)]
+
+    async def post_all():
+        responses = await asyncio.gather(*(
+            api.http.post("/readings", content=payload, headers=HEADERS) for payload in payloads
+        ))
+        assert all(response.status_code == 200 for response in responses)
+
+    benchmark.extra_info["requests_per_round"] = CONCURRENT_REQUESTS
+    benchmark(api.run, post_all)
@@ -0,0 +1,74 @@
+"""Read paths: latest reading, history at several table sizes, /stats with a cold and a warm cache"""
+
+import pytest
+
+from app import stats
+
+# History rounds per table size: the largest responses take seconds each
+HISTORY_ROUNDS = {1000: 50, 100_000: 5}
+STATS_ROWS = 100_000
+# Longer than RUNNING_STATS_MAX_WINDOW_MINUTES, so /stats takes the SQL + cache path
+STATS_WINDOW_MINUTES = 1440
+
+
+def test_get_latest_reading(benchmark, api):
+    async def post():
+        reading = {"sensor_id": "BENCH_LATEST", "co2_ppm": 500, "temperature": 21, "humidity": 45}
+        assert (await api.http.post("/readings", json=reading)).status_code == 200
+
+    async def latest():
+        response = await api.http.get("/readings/latest/BENCH_LATEST")
+        assert response.json()["source"] == "cache"
+
+    api.run(post)
+    benchmark(api.run, latest)
+
+
+@pytest.mark.parametrize("max_points", [None, 500], ids=["raw", "max_points=500"])
+def test_get_reading_history(benchmark, api, seed_history, history_rows, max_points):
+    sensor_id = seed_history(history_rows)
+    params = {"hours": 24}
+    if max_points:
+        params["max_points"] = max_points
+
+    async def history():
+        response = await api.http.get(f"/readings/history/{sensor_id}", params=params)
+        return response.json()["count"]
+
+    benchmark.extra_info["rows"] = history_rows
+    count = benchmark.pedantic(api.run, args=(history,), rounds=HISTORY_ROUNDS.get(history_rows, 2),
+                               warmup_rounds=1)
+    assert count == history_rows if max_points is None else count <= max_points
+
+
+@pytest.fixture(scope="module")
+def stats_sensor(seed_history):
+    return seed_history(STATS_ROWS)
+
+
+def stats_request(api, sensor_id):
+    async def get():
+        response = await api.http.get(f"/stats/{sensor_id}", params={"window_minutes": STATS_WINDOW_MINUTES})
+        return response.json()["source"]
+
+    return get
+
+
+def test_get_statistics_cold(benchmark, api, stats_sensor):
+    key = stats.cache_key(stats_sensor, STATS_WINDOW_MINUTES, stats.parse_fields(stats.DEFAULT_FIELDS),
+                          stats.parse_metrics(stats.DEFAULT_METRICS, api.main.async_engine.dialect.name))
+
+    def evict():
+        api.run(api.main.stats_cache.invalidate, key)
+
+    benchmark.extra_info["rows"] = STATS_ROWS
+    source = benchmark.pedantic(api.run, args=(stats_request(api, stats_sensor),), setup=evict, rounds=20)
+    assert source == "database"
+
+
+def test_get_statistics_warm(benchmark, api, stats_sensor):
+    get = stats_request(api, stats_sensor)
+    api.run(get)
+
+    benchmark.extra_info["rows"] = STATS_ROWS
+    assert benchmark(api.run, get) == "cache"
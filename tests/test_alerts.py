@@ -0,0 +1,115 @@
+import os
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+from app.alerts import ALERTS_ACTIVE_KEY, ALERTS_CHANNEL, AlertEngine, parse_rule, queue_events
+
+START = datetime(2024, 1, 1)
+
+
+def rows(*readings):
+    '''(sensor_id, minute, co2, temperature) -> insert rows'''
+    return [{"sensor_id": sensor_id, "co2_ppm": co2, "temperature": temperature, "humidity": 40.0,
+             "timestamp": START + timedelta(minutes=minute)}
+            for sensor_id, minute, co2, temperature in readings]
+
+
+def transitions(events):
+    return [(event["rule"], event["sensor_id"], event["state"]) for event in events]
+
+
+def test_threshold_fires_once_and_resolves_on_newest_reading():
+    engine = AlertEngine([{"id": "co2", "field": "co2", "op": ">", "value": 1000},
+                          {"id": "cold", "field": "temp", "op": "<", "value": 15, "sensors": ["B"]}])
+    events = engine.evaluate_rows(rows(("A", 0, 1200, 20), ("B", 0, 500, 10), ("C", 0, 500, 10)))
+    assert transitions(events) == [("co2", "A", "firing"), ("cold", "B", "firing")]
+    assert events[0]["value"] == 1200 and events[0]["timestamp"] == "2024-01-01T00:00:00"
+
+    # Still above: no new event; back-dated readings are not evaluated
+    assert engine.evaluate_rows(rows(("A", 1, 1100, 20), ("A", -5, 400, 20))) == []
+    # Out of order within a batch: the newest reading decides
+    assert transitions(engine.evaluate_rows(rows(("A", 3, 900, 20), ("A", 2, 1300, 20)))) == [("co2", "A", "resolved")]
+    # Above and back below inside one batch: both transitions
+    assert transitions(engine.evaluate_rows(rows(("A", 4, 1500, 20), ("A", 5, 800, 20)))) == [
+        ("co2", "A", "firing"), ("co2", "A", "resolved")]
+    assert engine.stats()["active"] == 1
+
+
+def test_rate_and_sustained_rules_carry_state_across_batches():
+    engine = AlertEngine([
+        {"id": "rise", "type": "rate", "field": "co2", "op": ">", "value": 200, "minutes": 5},
+        {"id": "warm", "type": "sustained", "field": "temp", "op": ">", "value": 26, "minutes": 10},
+    ])
+    assert engine.evaluate_rows(rows(("A", 0, 500, 27))) == []
+    # 500 -> 560 in one minute is 300 per 5 minutes
+    events = engine.evaluate_rows(rows(("A", 1, 560, 27), ("A", 6, 560, 27)))
+    assert transitions(events) == [("rise", "A", "firing"), ("rise", "A", "resolved")]
+    assert events[0]["value"] == pytest.approx(300)
+
+    events = engine.evaluate_rows(rows(("A", 10, 560, 28)))
+    assert transitions(events) == [("warm", "A", "firing")]
+    # A reading below the limit restarts the clock
+    engine.evaluate_rows(rows(("A", 11, 560, 25), ("A", 12, 560, 27)))
+    assert transitions(engine.evaluate_rows(rows(("A", 21, 560, 27)))) == []
+    assert transitions(engine.evaluate_rows(rows(("A", 22, 560, 27)))) == [("warm", "A", "firing")]
+
+
+def test_rule_file_reloads_without_losing_unchanged_state(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_bytes(orjson.dumps([{"id": "co2", "field": "co2", "op": ">", "value": 1000},
+                                   {"id": "hot", "field": "temp", "op": ">", "value": 30}]))
+    engine = AlertEngine(path=path, check_interval=0)
+    engine.evaluate_rows(rows(("A", 0, 1200, 35)))
+
+    path.write_bytes(orjson.dumps([{"id": "co2", "field": "co2", "op": ">", "value": 1000},
+                                   {"id": "hot", "field": "temp", "op": ">", "value": 40}]))
+    os.utime(path, ns=(1, 1))
+    # The changed rule's alert resolves; the unchanged one stays active without firing again
+    assert transitions(engine.evaluate_rows(rows(("A", 1, 1200, 35)))) == [("hot", "A", "resolved")]
+    assert engine.stats()["reloads"] == 1 and engine.stats()["active"] == 1
+
+    path.write_text("[{\"id\": \"broken\"")
+    os.utime(path, ns=(2, 2))
+    assert engine.evaluate_rows(rows(("A", 2, 1200, 35))) == []
+    assert [rule["id"] for rule in engine.rules] == ["co2", "hot"]
+    assert engine.stats()["reload_errors"] == 1
+
+    with pytest.raises(ValueError):
+        parse_rule({"id": "x", "type": "sustained", "field": "co2", "value": 1})
+
+
+def test_queue_events_updates_active_hash_and_publishes():
+    class Pipe:
+        def __init__(self):
+            self.commands = []
+
+        def __getattr__(self, name):
+            return lambda *args: self.commands.append((name, *args))
+
+    engine = AlertEngine()
+    pipe = Pipe()
+    queue_events(pipe, engine.evaluate_rows(rows(("A", 0, 2500, 20))))
+    queue_events(pipe, engine.evaluate_rows(rows(("A", 1, 1500, 20))))
+    names = [(command[0], command[2]) for command in pipe.commands if command[0] != "publish"]
+    assert names == [("hset", "co2-high:A"), ("hset", "co2-critical:A"), ("hdel", "co2-critical:A")]
+    assert all(command[1] == ALERTS_ACTIVE_KEY for command in pipe.commands if command[0] != "publish")
+    assert [command[1] for command in pipe.commands if command[0] == "publish"] == [ALERTS_CHANNEL] * 2
+
+
+def test_restore_resolves_alerts_active_before_a_restart():
+    rules = [{"id": "co2", "field": "co2", "op": ">", "value": 1000},
+             {"id": "warm", "type": "sustained", "field": "temp", "op": ">", "value": 26, "minutes": 10}]
+    entries = AlertEngine(rules).evaluate_rows(rows(("A", 0, 1200, 27), ("A", 10, 1200, 27)))
+    assert transitions(entries) == [("co2", "A", "firing"), ("warm", "A", "firing")]
+    removed = dict(entries[0], rule="gone")
+
+    after = AlertEngine(rules)
+    stale = after.restore(entries + [removed])
+    assert transitions(stale) == [("gone", "A", "resolved")]
+    assert after.stats()["active"] == 2
+    # Still holding: no new events; the sustained run carries over the restart
+    assert after.evaluate_rows(rows(("A", 11, 1200, 27))) == []
+    assert transitions(after.evaluate_rows(rows(("A", 12, 900, 25)))) == [
+        ("co2", "A", "resolved"), ("warm", "A", "resolved")]
@@ -1,20 +1,208 @@
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
-client = TestClient(app)
+@pytest.fixture(scope="module")
+def client():
+    # Run every request on one event loop so pooled async DB/Redis connections stay valid
+    with TestClient(app) as test_client:
+        yield test_client
 
-def test_read_root():
+def test_read_root(client):
     response = client.get("/")
     assert response.status_code == 200
+    assert "IoT Sensor Dashboard" in response.text
+
+    response = client.get("/health")
+    assert response.status_code == 200
     assert "status" in response.json()
 
-def test_create_reading():
-    response = client.post("/readings")
+def test_create_reading(client):
+    reading = {"sensor_id": "SENSOR_001", "co2_ppm": 612.4, "temperature": 21.7, "humidity": 44.2}
+    response = client.post("/readings", json=reading)
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+    assert response.json()["reading"]["co2_ppm"] == 612.4
+
+def test_create_reading_validation(client):
+    reading = {"sensor_id": "SENSOR_004", "co2_ppm": 415, "temperature": "21.5", "humidity": 40.0}
+    response = client.post("/readings", json=reading)
     assert response.status_code == 200
-    assert "reading" in response.json()
+    assert response.json()["reading"]["temperature"] == 21.5
+    assert response.json()["reading"]["co2_ppm"] == 415.0
+
+    reading["timestamp"] = "2024-01-01T10:00:00+01:00"
+    response = client.post("/readings", json=reading)
+    assert response.json()["reading"]["timestamp"] == "2024-01-01T09:00:00"
+
+    del reading["humidity"]
+    response = client.post("/readings", json=reading)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "humidity"]
+
+def test_create_reading_rejects_timestamps_out_of_bounds(client, monkeypatch):
+    from datetime import datetime, timedelta
+
+    reading = {"sensor_id": "SENSOR_CLOCK", "co2_ppm": 415, "temperature": 21.5, "humidity": 40.0}
+    now = datetime.utcnow()
+    reading["timestamp"] = (now + timedelta(minutes=4)).isoformat()
+    assert client.post("/readings", json=reading).status_code == 200
+    reading["timestamp"] = (now + timedelta(minutes=6)).isoformat()
+    response = client.post("/readings", json=reading)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "timestamp"]
+
+    monkeypatch.setattr("app.schema.MAX_READING_AGE_DAYS", 30)
+    reading["timestamp"] = (now - timedelta(days=29)).isoformat()
+    assert client.post("/readings", json=reading).status_code == 200
+    reading["timestamp"] = (now - timedelta(days=31)).isoformat()
+    assert client.post("/readings", json=reading).status_code == 422
 
-def test_get_latest_reading():
-    client.post("/readings")
+def test_create_readings_binary(client):
+    import msgpack
+    from app.frames import FRAME_CONTENT_TYPE, encode_frame
+
+    frame = encode_frame("SENSOR_BIN", [(5000, 700.0, 22.0, 41.0), (0, 710.0, 22.5, 41.5)])
+    response = client.post("/readings", content=frame, headers={"Content-Type": FRAME_CONTENT_TYPE})
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 2
+    assert client.get("/readings/latest/SENSOR_BIN").json()["data"]["co2_ppm"] == 710.0
+
+    body = msgpack.packb([{"sensor_id": "SENSOR_MP", "co2_ppm": 520, "temperature": 20.5, "humidity": 50}])
+    response = client.post("/readings", content=body, headers={"Content-Type": "application/msgpack"})
+    assert response.json()["sensor_ids"] == ["SENSOR_MP"]
+
+    response = client.post("/readings", content=b"SR\x09", headers={"Content-Type": FRAME_CONTENT_TYPE})
+    assert response.status_code == 400
+
+def test_get_latest_reading(client):
+    reading = {"sensor_id": "SENSOR_001", "co2_ppm": 455.0, "temperature": 20.5, "humidity": 41.0}
+    client.post("/readings", json=reading)
     response = client.get("/readings/latest/SENSOR_001")
     assert response.status_code == 200
+    assert response.json()["data"]["co2_ppm"] == 455.0
+
+def test_create_readings_batch(client):
+    readings = [
+        {"sensor_id": "SENSOR_001", "co2_ppm": 420.5, "temperature": 21.0, "humidity": 40.0},
+        {"sensor_id": "SENSOR_002", "co2_ppm": 650.0, "temperature": 22.5, "humidity": 45.0},
+        {"sensor_id": "SENSOR_002", "temperature": 22.5},
+    ]
+    response = client.post("/readings/batch", json=readings)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["accepted"] == 2
+    assert body["rejected"] == 1
+    assert [r["status"] for r in body["results"]] == ["success", "success", "error"]
+
+def test_create_readings_batch_ndjson(client):
+    body = '{"sensor_id": "SENSOR_003", "co2_ppm": 500, "temperature": 20, "humidity": 50}\n'
+    response = client.post("/readings/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 1
+    latest = client.get("/readings/latest/SENSOR_003").json()
+    assert latest["data"]["co2_ppm"] == 500
+
+def test_get_latest_readings_multi(client):
+    client.post("/readings/batch", json=[
+        {"sensor_id": sensor_id, "co2_ppm": 410, "temperature": 21.0, "humidity": 40.0}
+        for sensor_id in ("SENSOR_M1", "SENSOR_M2")
+    ])
+    response = client.get("/readings/latest?sensor_ids=SENSOR_M1,SENSOR_M2,SENSOR_GONE")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 3
+    assert body["data"]["SENSOR_M1"]["co2_ppm"] == 410
+    assert body["expired"] == ["SENSOR_GONE"]
+
+    known = client.get("/readings/latest").json()
+    assert {"SENSOR_M1", "SENSOR_M2"} <= set(known["data"])
+
+def test_get_statistics_custom_metrics(client):
+    client.post("/readings/batch", json=[
+        {"sensor_id": "SENSOR_STATS", "co2_ppm": co2, "temperature": 21.0, "humidity": 40.0}
+        for co2 in (400, 500, 600)
+    ])
+    response = client.get("/stats/SENSOR_STATS?window_minutes=10&fields=co2,humidity&metrics=min,max,count")
+    assert response.status_code == 200
+    assert response.json()["source"] == "running"
+    stats = response.json()["stats"]
+    assert stats["sample_count"] == 3
+    assert stats["min_co2"] == 400
+    assert stats["max_co2"] == 600
+    assert stats["count_humidity"] == 3
+
+    # Beyond the running window the same numbers come from the database
+    response = client.get("/stats/SENSOR_STATS?window_minutes=1440&fields=co2&metrics=min,max,count")
+    assert response.json()["source"] == "database"
+    assert response.json()["stats"]["max_co2"] == 600
+
+def test_get_statistics_rejects_unknown_metric(client):
+    response = client.get("/stats/SENSOR_STATS?metrics=median")
+    assert response.status_code == 400
+
+def test_get_reading_history_uses_rollups(client):
+    client.post("/readings/batch", json=[
+        {"sensor_id": "SENSOR_ROLLUP", "co2_ppm": 400 + i, "temperature": 21.0, "humidity": 40.0}
+        for i in range(20)
+    ])
+    raw = client.get("/readings/history/SENSOR_ROLLUP?hours=1").json()
+    assert raw["resolution"] == "raw"
+    assert raw["count"] == 20
+
+    rolled = client.get("/readings/history/SENSOR_ROLLUP?hours=1&max_points=5").json()
+    assert rolled["resolution"] == "1h"
+    assert sum(point["count"] for point in rolled["readings"]) == 20
+
+def test_export_readings_streams_ndjson_and_csv(client):
+    client.post("/readings/batch", json=[
+        {"sensor_id": "SENSOR_EXPORT", "co2_ppm": 400 + i, "temperature": 21.0, "humidity": 40.0}
+        for i in range(5)
+    ])
+    ndjson = client.get("/readings/export/SENSOR_EXPORT")
+    assert ndjson.status_code == 200
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    assert len(ndjson.text.splitlines()) == 5
+
+    csv_lines = client.get("/readings/export/SENSOR_EXPORT?format=csv").text.splitlines()
+    assert csv_lines[0] == "timestamp,co2_ppm,temperature,humidity"
+    assert len(csv_lines) == 6
+
+def test_export_readings_converts_offset_bounds_to_utc(client):
+    client.post("/readings/batch", json=[
+        {"sensor_id": "SENSOR_EXPORT_TZ", "co2_ppm": 400 + i, "temperature": 21.0, "humidity": 40.0,
+         "timestamp": f"2024-01-01T{9 + i:02d}:30:00"}
+        for i in range(5)
+    ])
+    # 12:00+02:00 to 13:00+02:00 is 10:00 to 11:00 UTC
+    response = client.get("/readings/export/SENSOR_EXPORT_TZ",
+                          params={"start": "2024-01-01T12:00:00+02:00", "end": "2024-01-01T13:00:00+02:00"})
+    assert response.status_code == 200
+    assert [json.loads(line)["co2_ppm"] for line in response.text.splitlines()] == [401]
+
+def test_metrics_endpoint(client):
+    client.post("/readings", json={"sensor_id": "SENSOR_METRICS", "co2_ppm": 480, "temperature": 21, "humidity": 40})
+    client.get("/stats/SENSOR_METRICS?window_minutes=1440")
+    client.get("/stats/SENSOR_METRICS?window_minutes=1440")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'http_request_duration_seconds_count{endpoint="create_reading",method="POST",status="200"}' in text
+    assert 'db_operation_duration_seconds_count{operation="insert"}' in text
+    assert 'db_operation_duration_seconds_count{operation="commit"}' in text
+    assert 'redis_command_duration_seconds_count{command="PIPELINE"}' in text
+    assert 'readings_ingested_total{source="single"}' in text
+    assert 'stats_cache_lookups_total{result="hit",tier="local"}' in text
+
+def test_alerts_fire_on_ingest(client):
+    client.post("/readings", json={"sensor_id": "SENSOR_ALERT", "co2_ppm": 2400, "temperature": 21, "humidity": 40})
+    alerts = client.get("/alerts?sensor_id=SENSOR_ALERT").json()["alerts"]
+    assert {alert["rule"] for alert in alerts} == {"co2-high", "co2-critical"}
+
+    client.post("/readings", json={"sensor_id": "SENSOR_ALERT", "co2_ppm": 450, "temperature": 21, "humidity": 40})
+    assert client.get("/alerts?sensor_id=SENSOR_ALERT").json()["count"] == 0
+    assert client.get("/alerts/rules").json()["engine"]["rules"] == 2
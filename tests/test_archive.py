@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.archive import Archive
+from app.database import Base, SensorReading
+from app.stats import compute_stats, parse_fields
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+
+def reading(sensor_id, days_ago, co2, hours=0):
+    return {"sensor_id": sensor_id, "co2_ppm": co2, "temperature": 21.0, "humidity": 40.0,
+            "timestamp": NOW - timedelta(days=days_ago, hours=hours)}
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "archive.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    return engine, path
+
+
+def count(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(SensorReading)).scalar()
+
+
+def test_run_moves_whole_old_days_and_merges_late_rows(database, tmp_path):
+    engine, _ = database
+    with engine.begin() as conn:
+        conn.execute(insert(SensorReading), [
+            reading("S/1", 40, 500), reading("S/1", 40, 510, hours=1), reading("S/1", 35, 520),
+            reading("S/1", 1, 600), reading("S2", 33, 700),
+        ])
+    archive = Archive(tmp_path / "archive")
+
+    result = archive.run(engine, older_than_days=30, sensor_ids=["S/1", "S2"], now=NOW)
+    assert (result["days"], result["readings"]) == (3, 4)
+    assert count(engine) == 1
+    assert archive.run(engine, older_than_days=30, sensor_ids=["S/1", "S2"], now=NOW)["readings"] == 0
+
+    # A back-dated reading for an archived day joins its file on the next run
+    with engine.begin() as conn:
+        conn.execute(insert(SensorReading), [reading("S/1", 40, 505, hours=2)])
+    archive.run(engine, older_than_days=30, sensor_ids=["S/1"], now=NOW)
+    timestamps, fields = archive.read_window("S/1", NOW - timedelta(days=41))
+    assert fields["co2_ppm"].tolist() == [505, 510, 500, 520]
+    assert timestamps[0] == NOW - timedelta(days=40, hours=2)
+    assert archive.stats()["files"] == 3
+
+
+def test_read_window_filters_by_time(tmp_path):
+    import numpy as np
+
+    archive = Archive(tmp_path)
+    day = datetime(2024, 1, 1)
+    timestamps = np.array([day + timedelta(hours=h) for h in range(24)], dtype="datetime64[us]")
+    fields = {name: np.arange(24, dtype=np.float64) for name in ("co2_ppm", "temperature", "humidity")}
+    archive.write_day("S1", day.date(), timestamps, fields)
+    # Writing the same readings again keeps one copy
+    assert archive.write_day("S1", day.date(), timestamps, fields) == 24
+
+    _, window = archive.read_window("S1", day + timedelta(hours=20), day + timedelta(hours=22))
+    assert window["co2_ppm"].tolist() == [20, 21]
+    assert archive.read_window("S1", day + timedelta(days=1)) is None
+    assert archive.read_window("S2", day) is None
+
+
+def test_compute_stats_spans_database_and_archive(database, tmp_path):
+    engine, path = database
+    with engine.begin() as conn:
+        conn.execute(insert(SensorReading), [reading("S1", 12, 400), reading("S1", 11, 500), reading("S1", 0, 900)])
+    archive = Archive(tmp_path / "archive")
+    archive.run(engine, older_than_days=10, sensor_ids=["S1"], now=NOW)
+    assert count(engine) == 1
+
+    async def scenario():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async with async_sessionmaker(async_engine)() as db:
+            spanning = await compute_stats(db, "S1", 20 * 24 * 60, parse_fields("co2"),
+                                           ["avg", "min", "max", "count"], archive)
+            recent = await compute_stats(db, "S1", 60, parse_fields("co2"), ["avg"], archive)
+        await async_engine.dispose()
+        return spanning, recent
+
+    spanning, recent = asyncio.run(scenario())
+    assert spanning == {"sample_count": 3, "avg_co2": 600.0, "min_co2": 400.0, "max_co2": 900.0,
+                        "count_co2": 3, "window_minutes": 20 * 24 * 60}
+    assert recent["avg_co2"] == 900.0
+
+
+def test_rows_left_in_both_tiers_are_read_once(database, tmp_path):
+    from app import export
+
+    engine, path = database
+    rows = [reading("S1", 12, 400), reading("S1", 12, 420, hours=1), reading("S1", 0, 900)]
+    with engine.begin() as conn:
+        conn.execute(insert(SensorReading), rows)
+    archive = Archive(tmp_path / "archive")
+    archive.run(engine, older_than_days=10, sensor_ids=["S1"], now=NOW)
+    # An interrupted run: the file was written but the DELETE never committed
+    with engine.begin() as conn:
+        conn.execute(insert(SensorReading), rows[:2] + [reading("S1", 11, 500)])
+
+    async def scenario():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        session_factory = async_sessionmaker(async_engine)
+        async with session_factory() as db:
+            stats = await compute_stats(db, "S1", 20 * 24 * 60, parse_fields("co2"),
+                                        ["avg", "min", "max", "count"], archive)
+        body = b"".join([chunk async for chunk in export.stream_export(
+            session_factory, export.CSVEncoder(), "S1", None, None, 2, archive)])
+        await async_engine.dispose()
+        return stats, body
+
+    stats, body = asyncio.run(scenario())
+    assert stats["sample_count"] == 4 and stats["count_co2"] == 4
+    assert stats["avg_co2"] == pytest.approx((400 + 420 + 500 + 900) / 4)
+    assert (stats["min_co2"], stats["max_co2"]) == (400.0, 900.0)
+    lines = body.decode().splitlines()[1:]
+    assert [float(line.split(",")[1]) for line in lines] == [420, 400, 500, 900]
+
+
+def test_rebuild_rollups_keeps_archived_days(database, tmp_path):
+    from app.database import SensorRollup
+    from app.rollups import rebuild_rollups
+
+    engine, _ = database
+    with engine.begin() as conn:
+        conn.execute(insert(SensorReading), [
+            reading("S/1", 40, 500), reading("S/1", 1, 600), reading("S2", 33, 700), reading("S3", 35, 800),
+        ])
+    rebuild_rollups(engine)
+    archive = Archive(tmp_path / "archive")
+    archive.run(engine, older_than_days=30, sensor_ids=["S/1", "S2"], now=NOW)
+    assert archive.sensor_ids() == ["S/1", "S2"]
+    assert [path.stem for path in archive.day_paths("S/1", None, None)] == [
+        (NOW - timedelta(days=40)).date().isoformat()
+    ]
+
+    def daily():
+        with engine.connect() as conn:
+            return sorted(conn.execute(
+                select(SensorRollup.sensor_id, SensorRollup.co2_ppm_sum).where(SensorRollup.resolution == "1d")
+            ).all())
+
+    before = daily()
+    assert rebuild_rollups(engine, archive=archive) > 0
+    assert rebuild_rollups(engine, sensor_id="S2", archive=archive) == 0
+    assert daily() == before == [("S/1", 500), ("S/1", 600), ("S2", 700), ("S3", 800)]
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+from app.cache import LocalCache, TwoTierCache
+
+
+class MemoryRedis:
+    '''Just enough of redis.asyncio for TwoTierCache: GET/PTTL pipeline, SETEX and DELETE'''
+
+    def __init__(self):
+        self.values = {}
+
+    def pipeline(self, transaction=False):
+        return MemoryPipeline(self)
+
+    async def setex(self, key, ttl, value):
+        self.values[key] = (value, time.monotonic() + ttl)
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    def expire_in(self, key, seconds):
+        value, _ = self.values[key]
+        self.values[key] = (value, time.monotonic() + seconds)
+
+
+class MemoryPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append(("get", key))
+
+    def pttl(self, key):
+        self.commands.append(("pttl", key))
+
+    async def execute(self):
+        results = []
+        for command, key in self.commands:
+            entry = self.redis.values.get(key)
+            if command == "get":
+                results.append(entry[0] if entry else None)
+            else:
+                results.append(int((entry[1] - time.monotonic()) * 1000) if entry else -2)
+        return results
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(max_entries=2)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, 60)
+    cache.get("a")
+    cache.set("c", 3, 60)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_concurrent_misses_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"avg_co2": 450.0}
+
+    async def scenario():
+        cache = TwoTierCache(MemoryRedis())
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(20)))
+        again = await cache.get_or_compute("k", compute)
+        return cache, results, again
+
+    cache, results, again = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert {source for _, source in results} == {"computed"}
+    assert again == ({"avg_co2": 450.0}, "local")
+    assert cache.stats()["compute"]["coalesced"] == 19
+
+
+def test_stale_value_is_served_while_refreshing():
+    values = iter([{"v": 1}, {"v": 2}])
+
+    async def compute():
+        return next(values)
+
+    async def scenario():
+        redis = MemoryRedis()
+        cache = TwoTierCache(redis, ttl=60, stale_ttl=30, local_ttl=0)
+        await cache.get_or_compute("k", compute)
+        redis.expire_in("k", 10)  # inside the stale window
+        stale = await cache.get_or_compute("k", compute)
+        await asyncio.sleep(0.01)
+        fresh = await cache.get_or_compute("k", compute)
+        return cache, stale, fresh
+
+    cache, stale, fresh = asyncio.run(scenario())
+    assert stale == ({"v": 1}, "redis")
+    assert fresh == ({"v": 2}, "redis")
+    assert cache.stats()["compute"]["stale_served"] == 1
+
+
+def test_invalidate_drops_both_tiers():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"v": len(calls)}
+
+    async def scenario():
+        cache = TwoTierCache(MemoryRedis())
+        await cache.get_or_compute("k", compute)
+        await cache.invalidate("k")
+        return await cache.get_or_compute("k", compute)
+
+    assert asyncio.run(scenario()) == ({"v": 2}, "computed")
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.downsample import downsample_readings, lttb, minmax, rows_to_columns, to_points
+
+
+def make_rows(count):
+    start = datetime(2024, 1, 1)
+    return [(start + timedelta(seconds=i), 400.0 + (i % 10), 21.0, 45.0) for i in range(count)]
+
+
+def test_lttb_keeps_endpoints_and_size():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    index = lttb(x, y, 100)
+    assert len(index) == 100
+    assert index[0] == 0 and index[-1] == 999
+    assert np.all(np.diff(index) > 0)
+
+
+def test_minmax_keeps_bucket_extremes():
+    y = np.array([5.0, 1.0, 9.0, 3.0, 2.0, 8.0, 7.0, 0.0])
+    index = minmax(y, 4)
+    assert list(index) == [1, 2, 5, 7]
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax", "avg"])
+def test_downsample_readings_bounds_points(method):
+    timestamps, fields = rows_to_columns(make_rows(5000))
+    timestamps, fields = downsample_readings(timestamps, fields, 200, method)
+    points = to_points(timestamps, fields)
+    assert len(points) <= 200
+    assert set(points[0]) == {"co2_ppm", "temperature", "humidity", "timestamp"}
+    # Newest first, like the raw history response
+    assert points[0]["timestamp"] > points[-1]["timestamp"]
+
+
+def test_small_windows_are_returned_unchanged():
+    timestamps, fields = rows_to_columns(make_rows(50))
+    sampled_timestamps, sampled = downsample_readings(timestamps, fields, 200, "lttb")
+    assert len(sampled_timestamps) == 50
+    assert np.array_equal(sampled["co2_ppm"], fields["co2_ppm"])
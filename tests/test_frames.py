@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.frames import decode_frame, encode_frame
+
+
+def test_frame_round_trip():
+    received_at = datetime(2024, 1, 1, 12, 0, 0)
+    body = encode_frame("SENSOR_001", [(0, 612.5, 21.25, 44.5), (10000, 600.0, 21.0, 45.0)])
+    assert len(body) == 4 + len("SENSOR_001") + 2 * 16
+
+    rows = decode_frame(body, received_at)
+    assert [row["co2_ppm"] for row in rows] == [612.5, 600.0]
+    assert rows[0]["sensor_id"] == "SENSOR_001"
+    assert rows[0]["timestamp"] == received_at
+    assert rows[1]["timestamp"] == received_at - timedelta(seconds=10)
+
+
+@pytest.mark.parametrize("body", [
+    b"SR",
+    b"XX\x01\x01A" + bytes(16),
+    b"SR\x02\x01A" + bytes(16),
+    b"SR\x01\x01A" + bytes(15),
+    b"SR\x01\x01A",
+    encode_frame("A", [(0, float("nan"), 21.0, 45.0)]),
+])
+def test_malformed_frames_are_rejected(body):
+    with pytest.raises(ValueError):
+        decode_frame(body, datetime.utcnow())
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import Base, SensorReading
+from app.hot_tier import HotTier, to_micros
+from app.stats import parse_fields
+
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+def payload(sensor_id, seconds_ago, co2):
+    moment = NOW - timedelta(seconds=seconds_ago)
+    return {"sensor_id": sensor_id, "co2_ppm": co2, "temperature": 21.0, "humidity": 40.0,
+            "timestamp": moment.isoformat()}
+
+
+def feed(tier, *readings):
+    tier.append(
+        [r["sensor_id"] for r in readings],
+        np.array([r["timestamp"] for r in readings], dtype="datetime64[us]").view(np.int64),
+        np.array([[r[f] for r in readings] for f in ("co2_ppm", "temperature", "humidity")]),
+        now=NOW
+    )
+
+
+def ready(tier, since):
+    tier.covered_since = to_micros(since)
+    tier.ready = True
+
+
+def test_window_and_stats_from_memory():
+    tier = HotTier(session_factory=None, retention_minutes=60)
+    ready(tier, NOW - timedelta(minutes=60))
+    feed(tier, payload("A", 300, 500), payload("A", 100, 700), payload("B", 50, 900))
+    # Back-dated reading lands in timestamp order
+    feed(tier, payload("A", 200, 600))
+
+    since = NOW - timedelta(minutes=10)
+    assert tier.covers("A", since, now=NOW)
+    assert not tier.covers("A", NOW - timedelta(minutes=61), now=NOW)
+    timestamps, fields = tier.window("A", since)
+    assert fields["co2_ppm"].tolist() == [500, 600, 700]
+    assert timestamps[0] == np.datetime64(NOW - timedelta(seconds=300))
+
+    stats = tier.compute_stats("A", NOW - timedelta(seconds=250), parse_fields("co2"), ["avg", "max", "count"])
+    assert stats == {"sample_count": 2, "avg_co2": 650.0, "max_co2": 700.0, "count_co2": 2}
+    assert tier.compute_stats("C", since, parse_fields("co2"), ["avg"]) is None
+    assert tier.stats()["readings"] == 4
+
+
+def test_not_served_before_reload_or_after_dropping_readings():
+    tier = HotTier(session_factory=None, retention_minutes=60, sensor_capacity=64)
+    feed(tier, payload("A", 10, 500))
+    assert not tier.covers("A", NOW - timedelta(minutes=5), now=NOW)
+
+    ready(tier, NOW - timedelta(minutes=60))
+    feed(tier, *(payload("A", 1000 - i, 400 + i) for i in range(100)))
+    # Over the per-sensor cap the oldest readings go; windows reaching them fall through
+    assert tier.stats()["dropped_readings"] > 0
+    _, fields = tier.window("A", NOW - timedelta(minutes=60))
+    oldest_kept = NOW - timedelta(seconds=1000 - (fields["co2_ppm"][0] - 400))
+    assert tier.covers("A", oldest_kept, now=NOW)
+    assert not tier.covers("A", oldest_kept - timedelta(seconds=1), now=NOW)
+    assert tier.covers("B", NOW - timedelta(minutes=30), now=NOW)
+
+
+def test_memory_budget_evicts_least_recently_used_sensor():
+    tier = HotTier(session_factory=None, retention_minutes=60, memory_mb=0, sensor_capacity=64)
+    ready(tier, NOW - timedelta(minutes=60))
+    budget = tier.max_bytes
+    feed(tier, payload("A", 30, 500))
+    feed(tier, payload("B", 20, 600))
+    assert tier.nbytes <= budget
+    assert tier.stats()["sensors"] == 1 and tier.stats()["evicted_sensors"] == 1
+    assert not tier.covers("A", NOW - timedelta(minutes=5), now=NOW)
+    assert tier.covers("A", NOW - timedelta(seconds=29), now=NOW)
+
+
+def test_warm_loads_database_and_keeps_duplicates_once(tmp_path):
+    path = tmp_path / "hot.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(insert(SensorReading), [
+            {"sensor_id": "A", "co2_ppm": 400.0 + i, "temperature": 21.0, "humidity": 40.0,
+             "timestamp": NOW - timedelta(minutes=90 - i * 10)}
+            for i in range(9)
+        ])
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        tier = HotTier(async_sessionmaker(engine), retention_minutes=60)
+        # Published while the reload runs and also committed to the database
+        feed(tier, payload("A", 30 * 60, 406.0))
+        await tier.warm(now=NOW)
+        await engine.dispose()
+        return tier
+
+    tier = asyncio.run(scenario())
+    assert tier.ready
+    _, fields = tier.window("A", NOW - timedelta(minutes=60))
+    assert fields["co2_ppm"].tolist() == [403.0, 404.0, 405.0, 406.0, 407.0, 408.0]
+    assert tier.covers("A", NOW - timedelta(minutes=60), now=NOW)
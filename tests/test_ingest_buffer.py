@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy.exc import DataError
+
+from app.ingest import reading_row
+from app.ingest_buffer import WriteBehindBuffer
+
+
+class RecordingSession:
+    '''Stands in for AsyncSessionLocal and records every bulk insert'''
+    batches = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows):
+        self.batches.append(list(rows))
+
+    async def commit(self):
+        pass
+
+
+def make_row(i):
+    return reading_row(f"SENSOR_{i:03d}", 400.0 + i, 21.0, 45.0, datetime.utcnow())
+
+
+def test_buffer_rejects_when_full():
+    buffer = WriteBehindBuffer(RecordingSession, max_size=2)
+    assert buffer.submit(make_row(1))
+    assert buffer.submit(make_row(2))
+    assert not buffer.submit(make_row(3))
+    assert buffer.stats()["rejected"] == 1
+    assert buffer.stats()["queue_depth"] == 2
+
+
+def test_buffer_flushes_in_batches_on_stop(monkeypatch):
+    monkeypatch.setattr("app.rollups.ROLLUPS_ENABLED", False)
+    RecordingSession.batches = []
+    buffer = WriteBehindBuffer(RecordingSession, max_size=100, batch_size=4)
+    for i in range(10):
+        buffer.submit(make_row(i))
+    asyncio.run(buffer.stop())
+    assert [len(b) for b in RecordingSession.batches] == [4, 4, 2]
+    assert buffer.stats()["flushed_rows"] == 10
+    assert buffer.stats()["queue_depth"] == 0
+
+
+def test_buffer_counts_in_flight_batch_when_stop_times_out(monkeypatch):
+    monkeypatch.setattr("app.rollups.ROLLUPS_ENABLED", False)
+    RecordingSession.batches = []
+
+    class StuckOnceSession(RecordingSession):
+        stuck = True
+
+        async def execute(self, statement, rows):
+            if StuckOnceSession.stuck:
+                StuckOnceSession.stuck = False
+                await asyncio.sleep(60)
+            await super().execute(statement, rows)
+
+    async def scenario():
+        buffer = WriteBehindBuffer(StuckOnceSession, max_size=100, batch_size=4, flush_interval=0.01)
+        buffer.start()
+        for i in range(6):
+            buffer.submit(make_row(i))
+        await asyncio.sleep(0.05)
+        await buffer.stop(timeout=0.05)
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    # The flusher was cancelled inside its first insert; the rest is flushed inline
+    assert stats["dropped_rows"] == 4
+    assert stats["flushed_rows"] == 2
+
+
+def test_buffer_drops_rows_the_database_rejects(monkeypatch):
+    monkeypatch.setattr("app.rollups.ROLLUPS_ENABLED", False)
+    RecordingSession.batches = []
+
+    class RejectingSession(RecordingSession):
+        async def execute(self, statement, rows):
+            if any(row["sensor_id"] == "SENSOR_003" for row in rows):
+                raise DataError("INSERT", {}, Exception("value out of range"))
+            await super().execute(statement, rows)
+
+    flushed = []
+
+    async def after_flush(batch):
+        flushed.extend(row["sensor_id"] for row in batch)
+
+    buffer = WriteBehindBuffer(RejectingSession, max_size=100, batch_size=8, after_flush=after_flush)
+    for i in range(8):
+        buffer.submit(make_row(i))
+    asyncio.run(buffer.stop())
+    stats = buffer.stats()
+    assert stats["dropped_rows"] == 1
+    assert stats["flushed_rows"] == 7
+    assert stats["failed_flushes"] == 0
+    assert "SENSOR_003" not in flushed and len(flushed) == 7
+    assert sum(len(b) for b in RecordingSession.batches) == 7
+
+
+def test_buffer_hands_batches_to_a_custom_store():
+    stored = []
+
+    async def enqueue(batch):
+        stored.append(len(batch))
+
+    buffer = WriteBehindBuffer(None, max_size=100, batch_size=4, store=enqueue)
+    for i in range(6):
+        buffer.submit(make_row(i))
+    asyncio.run(buffer.stop())
+    assert stored == [4, 2]
+    assert buffer.stats()["flushed_rows"] == 6
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.line_protocol import LineProtocolServer, parse_line
+
+
+def test_parse_line_with_short_field_names_and_timestamp():
+    row = parse_line("co2,sensor=S1 ppm=412.3,temp=21.2,hum=44i 1704067200000000000", datetime.utcnow())
+    assert row == {
+        "sensor_id": "S1",
+        "co2_ppm": 412.3,
+        "temperature": 21.2,
+        "humidity": 44.0,
+        "timestamp": datetime(2024, 1, 1),
+    }
+
+
+def test_parse_line_without_timestamp_uses_arrival_time():
+    received_at = datetime(2024, 5, 1, 8, 30)
+    row = parse_line("env,sensor_id=S2,room=lab co2_ppm=500,temperature=20,humidity=50", received_at)
+    assert row["sensor_id"] == "S2"
+    assert row["timestamp"] == received_at
+
+
+@pytest.mark.parametrize("line", [
+    "co2 ppm=412,temp=21,hum=44",
+    "co2,sensor=S1 ppm=412,temp=21",
+    "co2,sensor=S1 ppm=abc,temp=21,hum=44",
+    "co2,sensor=S1 ppm=nan,temp=21,hum=44",
+    "co2,sensor=S1",
+    "co2,sensor=S1 ppm=412,temp=21,hum=44 99999999999999999999999999",
+    # 2099: a device clock that was never set
+    "co2,sensor=S1 ppm=412,temp=21,hum=44 4070908800000000000",
+])
+def test_parse_line_rejects_malformed(line):
+    with pytest.raises(ValueError):
+        parse_line(line, datetime.utcnow())
+
+
+class ListBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.rows = []
+
+    def submit(self, row):
+        if len(self.rows) >= self.capacity:
+            return False
+        self.rows.append(row)
+        return True
+
+    async def put(self, row):
+        self.rows.append(row)
+
+    def stats(self):
+        return {"queue_depth": len(self.rows)}
+
+
+def test_server_accepts_udp_and_tcp():
+    async def scenario():
+        buffer = ListBuffer(capacity=2)
+        server = LineProtocolServer(buffer, host="127.0.0.1", udp_port=0, tcp_port=0)
+        # Port 0 means disabled in the server; feed datagrams directly and use a real TCP socket
+        server.datagram_received(b"co2,sensor=U1 ppm=1,temp=2,hum=3\nbad line\n"
+                                 b"co2,sensor=U2 ppm=1,temp=2,hum=3\nco2,sensor=U3 ppm=1,temp=2,hum=3\n")
+        tcp = await asyncio.start_server(server._handle_connection, "127.0.0.1", 0)
+        port = tcp.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"co2,sensor=T1 ppm=1,temp=2,hum=3\nco2,sensor=T2 ppm=1,temp=2,hum=3\n")
+        await writer.drain()
+        writer.close()
+        for _ in range(100):
+            if len(buffer.rows) == 4:
+                break
+            await asyncio.sleep(0.01)
+        tcp.close()
+        return server, buffer
+
+    server, buffer = asyncio.run(scenario())
+    assert [row["sensor_id"] for row in buffer.rows] == ["U1", "U2", "T1", "T2"]
+    stats = server.stats()
+    assert stats["lines"] == 6
+    assert stats["parse_errors"] == 1
+    assert stats["dropped"] == 1
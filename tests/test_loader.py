@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from app.database import Base, SensorReading
+from app.loader import Loader, parse_timestamp
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'load.db'}")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def count(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(SensorReading)).scalar()
+
+
+def test_parse_timestamp_normalizes_to_naive_utc():
+    assert parse_timestamp("2024-01-01T12:00:00+02:00") == datetime(2024, 1, 1, 10, 0)
+    assert parse_timestamp("2024-01-01T10:00:00Z") == datetime(2024, 1, 1, 10, 0)
+    assert parse_timestamp("1704103200") == datetime(2024, 1, 1, 10, 0)
+    with pytest.raises(ValueError):
+        parse_timestamp("")
+
+
+def test_load_csv_dedupes_and_is_idempotent(engine, tmp_path):
+    path = tmp_path / "dump.csv"
+    path.write_text(
+        "sensor_id,timestamp,co2_ppm,temperature,humidity\n"
+        "S1,2024-01-01T10:00:00,410,21.0,40\n"
+        "S1,2024-01-01T10:00:10,415,21.1,40\n"
+        "S1,2024-01-01T10:00:10,415,21.1,40\n"
+        "S1,not-a-time,415,21.1,40\n"
+        "S2,2024-01-01T10:00:00,500,22.0,45\n"
+    )
+    loader = Loader(engine, chunk_size=2)
+    loader.load_file(path)
+    assert (loader.read, loader.inserted, loader.duplicates, loader.invalid) == (5, 3, 1, 1)
+    assert count(engine) == 3
+
+    again = Loader(engine)
+    again.load_file(path)
+    assert again.inserted == 0
+    assert count(engine) == 3
+
+
+def test_load_ndjson_and_parquet_with_default_sensor(engine, tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    ndjson = tmp_path / "offline.ndjson"
+    ndjson.write_text('{"timestamp": "2024-01-02T00:00:00", "co2_ppm": 600, "temperature": 20, "humidity": 50}\n')
+    parquet = tmp_path / "archive.parquet"
+    pq.write_table(pa.table({
+        "timestamp": [datetime(2024, 1, 3, 0, 0), datetime(2024, 1, 3, 0, 1)],
+        "co2_ppm": [610.0, 620.0],
+        "temperature": [20.5, 20.6],
+        "humidity": [49.0, 48.0],
+    }), parquet)
+
+    loader = Loader(engine, default_sensor_id="S9")
+    loader.load_file(ndjson)
+    loader.load_file(parquet)
+    assert loader.inserted == 3
+    assert (loader.earliest, loader.latest) == (datetime(2024, 1, 2), datetime(2024, 1, 3, 0, 1))
+    assert loader.rebuild_rollups() > 0
+
+
+def test_rebuild_rollups_only_touches_loaded_sensors(engine, tmp_path):
+    from sqlalchemy import insert
+
+    from app.database import SensorRollup
+
+    # Rollups of a sensor whose raw rows are gone (e.g. archived) for the same day
+    with engine.begin() as conn:
+        conn.execute(insert(SensorRollup), [{"sensor_id": "ARCHIVED", "resolution": "1d",
+                                             "bucket": datetime(2024, 1, 1), "count": 10}])
+    path = tmp_path / "one-sensor.csv"
+    path.write_text(
+        "sensor_id,timestamp,co2_ppm,temperature,humidity\n"
+        "S1,2024-01-01T10:00:00,410,21.0,40\n"
+        "S1,2024-01-01T11:00:00,420,21.0,40\n"
+    )
+    loader = Loader(engine)
+    loader.load_file(path)
+    assert loader.sensor_ranges == {"S1": [datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 11)]}
+    assert loader.rebuild_rollups() > 0
+    with engine.connect() as conn:
+        sensors = conn.execute(select(SensorRollup.sensor_id).distinct()).scalars().all()
+    assert sorted(sensors) == ["ARCHIVED", "S1"]
@@ -0,0 +1,61 @@
+import json
+import logging
+
+from app.logs import SampledLogger, StructuredFormatter
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def capture(name):
+    logger = logging.getLogger(name)
+    handler = Capture()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return handler
+
+
+def test_sampled_logger_rates():
+    handler = capture("test.sampled")
+    for _ in range(1000):
+        SampledLogger("test.sampled", rate=0).info("reading received")
+    assert handler.records == []
+
+    for _ in range(10):
+        SampledLogger("test.sampled", rate=1).info("reading received", sensor_id="S1")
+    assert len(handler.records) == 10
+
+    handler.records.clear()
+    for _ in range(10000):
+        SampledLogger("test.sampled", rate=0.1).info("reading received")
+    assert 700 < len(handler.records) < 1300
+    assert handler.records[0].fields["sample_rate"] == 0.1
+
+
+def test_structured_formatter():
+    handler = capture("test.formatted")
+    SampledLogger("test.formatted", rate=1).info("batch received", count=3, accepted=2)
+    record = handler.records[0]
+
+    entry = json.loads(StructuredFormatter(json_lines=True).format(record))
+    assert entry["event"] == "batch received"
+    assert entry["count"] == 3
+    assert entry["logger"] == "test.formatted"
+
+    line = StructuredFormatter().format(record)
+    assert line.endswith("batch received count=3 accepted=2 sample_rate=1")
+
+
+def test_sampled_logger_warning_level():
+    handler = capture("test.warned")
+    SampledLogger("test.warned", rate=1).warning("rejected MQTT message", topic="sensors/S1/reading")
+    record = handler.records[0]
+    assert record.levelno == logging.WARNING
+    assert record.fields == {"topic": "sensors/S1/reading", "sample_rate": 1}
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import socket
+from datetime import datetime
+
+import pytest
+
+from app.mqtt_worker import MQTTIngestWorker, decode_message
+
+MQTT_HOST = os.getenv("MQTT_TEST_HOST", "localhost")
+MQTT_PORT = int(os.getenv("MQTT_TEST_PORT", 1883))
+
+
+def test_decode_message_takes_sensor_id_from_topic():
+    row = decode_message("sensors/S1/reading", b'{"co2_ppm": 410, "temperature": "21.5", "humidity": 40}',
+                         datetime(2024, 1, 1))
+    assert row["sensor_id"] == "S1"
+    assert row["temperature"] == 21.5
+
+
+@pytest.mark.parametrize("topic,payload", [
+    ("sensors/S1/reading", b'{"co2_ppm": 410, "temperature": 21}'),
+    ("sensors/S1/reading", b'{"sensor_id": "S2", "co2_ppm": 410, "temperature": 21, "humidity": 40}'),
+    ("sensors/S1/reading", b"[1, 2]"),
+    ("sensors/S1/reading", b"not json"),
+    ("sensors/S1", b'{"co2_ppm": 410, "temperature": 21, "humidity": 40}'),
+])
+def test_decode_message_rejects_invalid(topic, payload):
+    with pytest.raises(ValueError):
+        decode_message(topic, payload, datetime.utcnow())
+
+
+def test_worker_needs_a_client_id_and_bounds_its_queue():
+    with pytest.raises(ValueError):
+        MQTTIngestWorker(None, None, client_id="")
+    worker = MQTTIngestWorker(None, None, client_id="sensor-ingest-0", batch_size=500, queue_size=1000)
+    assert worker._queue.maxsize == 1000
+
+
+def broker_available():
+    try:
+        socket.create_connection((MQTT_HOST, MQTT_PORT), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+class FlakySession:
+    '''Stands in for AsyncSessionLocal; the first commit fails, later ones are recorded'''
+    batches = []
+    failures = 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows):
+        self.rows = list(rows)
+
+    async def commit(self):
+        if FlakySession.failures:
+            FlakySession.failures -= 1
+            raise ConnectionError("database unavailable")
+        FlakySession.batches.append(self.rows)
+
+
+class NullRedis:
+    def pipeline(self, transaction=False):
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    async def execute(self):
+        return []
+
+
+@pytest.mark.skipif(not broker_available(), reason=f"no MQTT broker on {MQTT_HOST}:{MQTT_PORT}")
+def test_worker_stores_batches_and_acks_after_commit(monkeypatch):
+    import paho.mqtt.client as mqtt
+
+    monkeypatch.setattr("app.rollups.ROLLUPS_ENABLED", False)
+    monkeypatch.setattr("app.running_stats.RUNNING_STATS_ENABLED", False)
+    FlakySession.batches = []
+    FlakySession.failures = 1
+
+    async def scenario():
+        worker = MQTTIngestWorker(
+            FlakySession, NullRedis(), host=MQTT_HOST, port=MQTT_PORT,
+            share_group=os.getenv("MQTT_TEST_SHARE_GROUP", "ingest"),
+            client_id="sensor-ingest-test", protocol=os.getenv("MQTT_TEST_PROTOCOL", "5"),
+            batch_size=100, flush_interval=0.2, retry_delay=0.1
+        )
+        task = asyncio.create_task(worker.run())
+        await asyncio.wait_for(worker.connected.wait(), 5)
+        await asyncio.sleep(0.2)  # let the SUBSCRIBE complete
+
+        publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="sensor-publisher-test")
+        publisher.connect(MQTT_HOST, MQTT_PORT)
+        publisher.loop_start()
+        for i in range(5):
+            reading = {"co2_ppm": 400 + i, "temperature": 21.0, "humidity": 40.0}
+            publisher.publish(f"sensors/MQTT_{i}/reading", json.dumps(reading), qos=1).wait_for_publish(5)
+        publisher.publish("sensors/MQTT_BAD/reading", b'{"co2_ppm": "high"}', qos=1).wait_for_publish(5)
+        publisher.disconnect()
+        publisher.loop_stop()
+
+        for _ in range(100):
+            if worker.stored == 5 and worker.invalid == 1:
+                break
+            await asyncio.sleep(0.05)
+        worker.stop()
+        await asyncio.wait_for(task, 5)
+        return worker
+
+    worker = asyncio.run(scenario())
+    assert worker.failed_flushes == 1
+    assert sorted(row["sensor_id"] for batch in FlakySession.batches for row in batch) == [
+        f"MQTT_{i}" for i in range(5)
+    ]
+    assert worker.stats()["invalid"] == 1
+
+
+def test_worker_dead_letters_rows_the_database_rejects(monkeypatch):
+    from types import SimpleNamespace
+
+    from sqlalchemy.exc import DataError
+
+    monkeypatch.setattr("app.rollups.ROLLUPS_ENABLED", False)
+    monkeypatch.setattr("app.running_stats.RUNNING_STATS_ENABLED", False)
+    FlakySession.batches = []
+    FlakySession.failures = 0
+
+    class RejectingSession(FlakySession):
+        async def execute(self, statement, rows):
+            self.rows = list(rows)
+            if any(row["sensor_id"] == "MQTT_2" for row in self.rows):
+                raise DataError("INSERT", {}, Exception("value out of range"))
+
+    class RecordingRedis(NullRedis):
+        dead = []
+
+        def xadd(self, key, fields, **kwargs):
+            self.dead.append(fields)
+
+    acked = []
+    worker = MQTTIngestWorker(RejectingSession, RecordingRedis(), client_id="sensor-ingest-test")
+    worker._client = SimpleNamespace(ack=lambda mid, qos: acked.append(mid))
+    messages = [
+        SimpleNamespace(topic=f"sensors/MQTT_{i}/reading", mid=i, qos=1,
+                        payload=json.dumps({"co2_ppm": 400, "temperature": 21.0, "humidity": 40.0}))
+        for i in range(4)
+    ]
+    asyncio.run(worker._flush(messages))
+    assert sorted(acked) == [0, 1, 2, 3]
+    assert worker.stats()["dead_lettered"] == 1
+    assert worker.stats()["stored"] == 3
+    assert worker.failed_flushes == 0
+    assert [json.loads(fields["r"])["sensor_id"] for fields in RecordingRedis.dead] == ["MQTT_2"]
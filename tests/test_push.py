@@ -0,0 +1,37 @@
+import asyncio
+
+from app.push import ReadingBroadcaster
+
+
+def reading(sensor_id, co2):
+    return {"sensor_id": sensor_id, "co2_ppm": co2, "temperature": 21.0, "humidity": 40.0}
+
+
+def test_broadcaster_filters_by_sensor():
+    async def scenario():
+        broadcaster = ReadingBroadcaster(redis_client=None)
+        everything = broadcaster.subscribe()
+        only_a = broadcaster.subscribe({"A"})
+        broadcaster.dispatch([reading("A", 400), reading("B", 500)])
+        return everything.take(), only_a.take()
+
+    everything, only_a = asyncio.run(scenario())
+    assert {r["sensor_id"] for r in everything} == {"A", "B"}
+    assert [r["sensor_id"] for r in only_a] == ["A"]
+
+
+def test_slow_subscriber_keeps_only_newest_reading_per_sensor():
+    async def scenario():
+        broadcaster = ReadingBroadcaster(redis_client=None)
+        subscriber = broadcaster.subscribe({"A"})
+        for co2 in (400, 450, 500):
+            broadcaster.dispatch([reading("A", co2)])
+        pending = subscriber.take()
+        broadcaster.unsubscribe(subscriber)
+        return subscriber, pending, broadcaster.subscriber_count
+
+    subscriber, pending, remaining = asyncio.run(scenario())
+    assert [r["co2_ppm"] for r in pending] == [500]
+    assert subscriber.coalesced == 2
+    assert not subscriber.event.is_set()
+    assert remaining == 0
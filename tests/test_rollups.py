@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from app.rollups import aggregate_rows, choose_resolution, merge_points
+
+
+def row(sensor_id, minute, co2):
+    return {
+        "sensor_id": sensor_id,
+        "co2_ppm": co2,
+        "temperature": 21.0,
+        "humidity": 40.0,
+        "timestamp": datetime(2024, 1, 1, 12, minute, 30),
+    }
+
+
+def test_aggregate_rows_merges_per_bucket():
+    aggregates = aggregate_rows([row("S1", 0, 400), row("S1", 0, 600), row("S1", 1, 500)])
+    by_key = {(a["resolution"], a["bucket"]): a for a in aggregates}
+
+    first_minute = by_key[("1m", datetime(2024, 1, 1, 12, 0))]
+    assert first_minute["count"] == 2
+    assert first_minute["co2_ppm_sum"] == 1000
+    assert first_minute["co2_ppm_min"] == 400
+    assert first_minute["co2_ppm_max"] == 600
+
+    hour = by_key[("1h", datetime(2024, 1, 1, 12, 0))]
+    assert hour["count"] == 3
+    assert by_key[("1d", datetime(2024, 1, 1))]["count"] == 3
+
+
+def test_choose_resolution():
+    assert choose_resolution(timedelta(hours=24), 500, raw_count=400) == "raw"
+    assert choose_resolution(timedelta(hours=6), 500, raw_count=20000) == "1m"
+    # 360 minutes span 361 unaligned minute buckets
+    assert choose_resolution(timedelta(hours=6), 360, raw_count=20000) == "1h"
+    assert choose_resolution(timedelta(days=30), 1000, raw_count=10**6) == "1h"
+    assert choose_resolution(timedelta(days=30), 100, raw_count=10**6) == "1d"
+
+
+def test_merge_points_caps_daily_buckets():
+    points = [
+        {"timestamp": datetime(2024, 1, day).isoformat(), "count": day,
+         **{f"{field}{suffix}": float(day) for field in ("co2_ppm", "temperature", "humidity")
+            for suffix in ("", "_min", "_max")}}
+        for day in range(5, 0, -1)
+    ]
+    assert merge_points(points, 5) is points
+
+    merged = merge_points(points, 2)
+    assert [point["timestamp"] for point in merged] == ["2024-01-04T00:00:00", "2024-01-01T00:00:00"]
+    assert [point["count"] for point in merged] == [9, 6]
+    assert merged[0]["co2_ppm"] == (5 * 5 + 4 * 4) / 9
+    assert (merged[1]["co2_ppm_min"], merged[1]["co2_ppm_max"]) == (1.0, 3.0)
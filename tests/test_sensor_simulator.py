@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import numpy as np
+
+from app.sensor_simulator import FleetSimulator
+
+
+def test_fleet_rows():
+    at = datetime(2024, 1, 1, 12, 0, 0)
+    fleet = FleetSimulator(1500, seed=1)
+    rows = fleet.rows(at)
+
+    assert len(rows) == len(fleet) == 1500
+    assert rows[0]["sensor_id"] == "SENSOR_0001"
+    assert rows[-1]["sensor_id"] == "SENSOR_1500"
+    assert all(row["timestamp"] == at for row in rows)
+    assert min(row["co2_ppm"] for row in rows) >= 350
+    assert all(5 <= row["humidity"] <= 95 for row in rows)
+    # Default fleet of one keeps the historical sensor id
+    assert FleetSimulator(1).sensor_ids == ["SENSOR_001"]
+
+
+def test_fleet_is_reproducible_with_a_seed():
+    at = datetime(2024, 1, 1, 9, 30, 0)
+    first = FleetSimulator(100, seed=7).tick(at)
+    second = FleetSimulator(100, seed=7).tick(at)
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+
+
+def test_fleet_follows_a_daily_profile():
+    fleet = FleetSimulator(2000, seed=3)
+    afternoon = fleet.tick(datetime(2024, 1, 1, 14, 0, 0))
+    night = fleet.tick(datetime(2024, 1, 2, 3, 0, 0))
+
+    assert afternoon[0].mean() > night[0].mean() + 200
+    assert afternoon[1].mean() > night[1].mean()
+    assert afternoon[2].mean() < night[2].mean()
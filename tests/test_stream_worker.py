@@ -0,0 +1,145 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime
+
+import orjson
+import pytest
+import redis.asyncio as aioredis
+
+from app.ingest import latest_payload, reading_row
+from app.stream_worker import StreamIngestWorker
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+
+
+def redis_available():
+    try:
+        socket.create_connection((REDIS_HOST, REDIS_PORT), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not redis_available(), reason=f"no Redis on {REDIS_HOST}:{REDIS_PORT}")
+
+
+class RecordingSession:
+    '''Stands in for AsyncSessionLocal and records every bulk insert'''
+    batches = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows):
+        self.batches.append(list(rows))
+
+    async def commit(self):
+        pass
+
+
+def entry(sensor_id):
+    return {"r": orjson.dumps(latest_payload(reading_row(sensor_id, 410.0, 21.0, 40.0, datetime.utcnow())))}
+
+
+def run_with_stream(scenario, monkeypatch):
+    monkeypatch.setattr("app.rollups.ROLLUPS_ENABLED", False)
+    RecordingSession.batches = []
+
+    async def wrapper():
+        client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        stream = f"test:stream:{uuid.uuid4().hex}"
+        try:
+            return await scenario(client, stream)
+        finally:
+            await client.delete(stream)
+            await client.aclose()
+
+    return asyncio.run(wrapper())
+
+
+def test_worker_stores_acks_and_deletes(monkeypatch):
+    async def scenario(client, stream):
+        worker = StreamIngestWorker(RecordingSession, client, stream=stream, group="writers", consumer="w1")
+        await worker.ensure_group()
+        await client.xadd(stream, entry("S1"))
+        await client.xadd(stream, entry("S2"))
+        await client.xadd(stream, {"r": b"not json"})
+        await worker.read_batch(block_ms=100)
+        return worker, await client.xlen(stream), await client.xpending(stream, "writers")
+
+    worker, length, pending = run_with_stream(scenario, monkeypatch)
+    assert [row["sensor_id"] for row in RecordingSession.batches[0]] == ["S1", "S2"]
+    assert worker.stats()["invalid"] == 1
+    assert length == 0
+    assert pending["pending"] == 0
+
+
+def test_worker_claims_entries_abandoned_by_a_crashed_consumer(monkeypatch):
+    async def scenario(client, stream):
+        worker = StreamIngestWorker(RecordingSession, client, stream=stream, group="writers", consumer="w2",
+                                    claim_idle_ms=0)
+        await worker.ensure_group()
+        await client.xadd(stream, entry("S3"))
+        # Another consumer reads the entry and dies before acknowledging it
+        await client.xreadgroup("writers", "crashed", {stream: ">"}, count=10)
+        claimed = await worker.claim_abandoned()
+        return claimed, await client.xlen(stream)
+
+    claimed, length = run_with_stream(scenario, monkeypatch)
+    assert claimed == 1
+    assert RecordingSession.batches[0][0]["sensor_id"] == "S3"
+    assert length == 0
+
+
+def test_worker_dead_letters_rows_the_database_rejects(monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+
+    from app.ingest import DEAD_LETTER_KEY
+
+    class RejectingSession(RecordingSession):
+        async def execute(self, statement, rows):
+            if any(row["sensor_id"] == "BAD" for row in rows):
+                raise IntegrityError("INSERT", {}, Exception("no partition of relation found for row"))
+            await super().execute(statement, rows)
+
+    async def scenario(client, stream):
+        worker = StreamIngestWorker(RejectingSession, client, stream=stream, group="writers", consumer="w3")
+        await worker.ensure_group()
+        await client.delete(DEAD_LETTER_KEY)
+        for sensor_id in ("S1", "BAD", "S2", "S3"):
+            await client.xadd(stream, entry(sensor_id))
+        await worker.read_batch(block_ms=100)
+        dead = await client.xrange(DEAD_LETTER_KEY)
+        await client.delete(DEAD_LETTER_KEY)
+        return worker, dead, await client.xpending(stream, "writers")
+
+    worker, dead, pending = run_with_stream(scenario, monkeypatch)
+    assert sorted(row["sensor_id"] for batch in RecordingSession.batches for row in batch) == ["S1", "S2", "S3"]
+    assert worker.stats()["dead_lettered"] == 1
+    assert worker.stats()["stored"] == 3
+    assert [orjson.loads(fields["r"])["sensor_id"] for _, fields in dead] == ["BAD"]
+    assert pending["pending"] == 0
+
+
+def test_worker_deletes_idle_consumers_without_pending_entries(monkeypatch):
+    async def scenario(client, stream):
+        worker = StreamIngestWorker(RecordingSession, client, stream=stream, group="writers", consumer="w4",
+                                    claim_idle_ms=0, consumer_idle_ms=0)
+        await worker.ensure_group()
+        await client.xadd(stream, entry("S4"))
+        # A restarted pod's old consumer holds an entry until XAUTOCLAIM takes it over
+        await client.xreadgroup("writers", "crashed", {stream: ">"}, count=10)
+        await client.xreadgroup("writers", "quiet", {stream: ">"}, count=10)
+        assert await worker.delete_idle_consumers() == 1
+        await worker.claim_abandoned()
+        assert await worker.delete_idle_consumers() == 1
+        return [info["name"] for info in await client.xinfo_consumers(stream, "writers")]
+
+    consumers = run_with_stream(scenario, monkeypatch)
+    assert "crashed" not in consumers and "quiet" not in consumers